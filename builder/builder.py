@@ -1,5 +1,10 @@
 import os
+import shutil
+import hashlib
+import threading
+import subprocess
 from collections import namedtuple
+from distutils.spawn import find_executable
 import orthrusutils.orthrusutils as util
 
 class BuildEnv(object):
@@ -41,16 +46,170 @@ class BuildEnv(object):
         self.buildenv.update(self.exportvars)
         return self.buildenv
 
+class BuildCache(object):
+
+    # Build products and files generated by configure never make it into the
+    # key. Prebuilt libraries shipped with the sources do, like in a build tree.
+    IGNORE = ['.git', '.svn', '.hg', '.orthrus', '*.o', '*.lo', '*.la', '*.gcda', '*.gcno', '.libs', '.deps',
+              'autom4te.cache', 'config.log', 'config.status', 'stamp-h1', 'libtool']
+
+    def __init__(self, directory, max_size, ignore=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.ignore = ignore if ignore is not None else self.IGNORE
+        self._source_hashes = {}
+        self._compilers = {}
+        self._lock = threading.Lock()
+
+    def source_hash(self, srcdir):
+        with self._lock:
+            if srcdir not in self._source_hashes:
+                digest = hashlib.sha1()
+                for relpath in util.source_files(srcdir, self.ignore, Builder.PREBUILT):
+                    digest.update(relpath + '\0')
+                    digest.update(util.hash_file(os.path.join(srcdir, relpath)))
+                self._source_hashes[srcdir] = digest.hexdigest()
+            return self._source_hashes[srcdir]
+
+    def compiler_id(self, compiler, env):
+        # Resolved path and version of a compiler, upgrading clang or AFL
+        # changes it
+        path = find_executable(compiler, env.get('PATH')) or compiler
+        with self._lock:
+            if path not in self._compilers:
+                try:
+                    version = subprocess.check_output([path, '--version'], env=env, stderr=subprocess.STDOUT)
+                except (OSError, subprocess.CalledProcessError):
+                    version = ''
+                self._compilers[path] = path + '\0' + version
+            return self._compilers[path]
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key, dest):
+        entry = self._entry(key)
+        if not os.path.isdir(entry + "/install"):
+            return False
+        if os.path.exists(dest):
+            shutil.rmtree(dest)
+        shutil.copytree(entry + "/install", dest, symlinks=True)
+        # Entry mtime is the LRU clock
+        os.utime(entry, None)
+        return True
+
+    def store(self, key, src):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        entry = self._entry(key)
+        tmp = entry + ".tmp." + str(os.getpid()) + "." + str(threading.current_thread().ident)
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.mkdir(tmp)
+        shutil.copytree(src, tmp + "/install", symlinks=True)
+        with open(tmp + "/size", 'w') as f:
+            f.write(str(util.tree_size(tmp + "/install")))
+
+        with self._lock:
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+            self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        total = 0
+        for key in os.listdir(self.directory):
+            entry = self._entry(key)
+            if not os.path.isfile(entry + "/size"):
+                continue
+            with open(entry + "/size") as f:
+                size = int(f.read() or 0)
+            entries.append((os.path.getmtime(entry), size, entry))
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry)
+            total -= size
+
+class JobServer(object):
+
+    # GNU make jobserver shared by concurrent builds. Every top-level make owns
+    # one implicit job slot, the pipe holds the tokens for the rest of the budget.
+    def __init__(self, jobs, clients):
+        self.read_fd, self.write_fd = os.pipe()
+        os.write(self.write_fd, '+' * max(jobs - clients, 0))
+
+    def makeflags(self):
+        # --jobserver-fds for make < 4.2, --jobserver-auth for newer versions
+        return "-j --jobserver-fds={0},{1} --jobserver-auth={0},{1}".format(self.read_fd, self.write_fd)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
 class Builder(object):
 
-    def __init__(self, buildenv, configargs, logfile=None):
+    CONFIGURE_STAMP = ".orthrus-configure"
+    # Left out when copying the sources into a build tree. Only what a build
+    # generates, prebuilt libraries shipped with the sources are copied.
+    SYNC_IGNORE = ['.git', '.svn', '.hg', '*.o', '*.lo', '*.la', '*.gcda', '*.gcno', '.libs', '.deps',
+                   'autom4te.cache', 'config.log', 'config.status', 'stamp-h1', 'libtool']
+    # ELF files among the sources that are prebuilt libraries, not binaries
+    # left over from an in-tree build
+    PREBUILT = ['*.so', '*.so.*']
+
+    def __init__(self, buildenv, configargs, logfile=None, builddir=None, cache=None, jobs=None,
+                 jobserver=None):
         self.env = buildenv.getenvdict()
+        self.exportvars = buildenv.exportvars
         self.configargs = configargs
         self.logfile = logfile
+        self.builddir = builddir or "."
+        self.cache = cache
+        self.jobs = jobs or int(util.getnproc())
+        self.jobserver = jobserver
+
+    def cache_key(self, srcdir="."):
+        digest = hashlib.sha1(self.cache.source_hash(srcdir))
+        for var in sorted(self.exportvars):
+            digest.update(var + "=" + self.exportvars[var] + "\0")
+        for var in ['CC', 'CXX']:
+            digest.update(self.cache.compiler_id(self.exportvars[var], self.env) + "\0")
+        digest.update(" ".join(self.configargs))
+        return digest.hexdigest()
+
+    def restore(self, dest):
+        if not self.cache:
+            return False
+        return self.cache.lookup(self.cache_key(), dest)
+
+    def store(self, dest):
+        if not self.cache:
+            return False
+        return self.cache.store(self.cache_key(), dest)
+
+    def _configure_stamp(self):
+        digest = hashlib.sha1(util.hash_file(os.path.join(self.builddir, "configure")))
+        for var in sorted(self.exportvars):
+            digest.update(var + "=" + self.exportvars[var] + "\0")
+        digest.update(" ".join(self.configargs))
+        return digest.hexdigest()
+
+    def configure_needed(self):
+        # Configure only has to run again if the script, its arguments or the environment changed
+        stamp = os.path.join(self.builddir, self.CONFIGURE_STAMP)
+        if not os.path.isfile(os.path.join(self.builddir, "Makefile")) or not os.path.isfile(stamp):
+            return True
+        with open(stamp) as f:
+            return f.read() != self._configure_stamp()
 
     def configure(self):
 
-        if not os.path.isfile("configure"):
+        if not os.path.isfile(os.path.join(self.builddir, "configure")):
             util.color_print(util.bcolors.FAIL, "No configure script found in work dir")
             return False
 
@@ -58,18 +217,30 @@ class Builder(object):
         # "--disable-shared " +
         command = ["./configure " + " ".join(self.configargs)]
 
-        if not util.run_cmd(command, self.env, self.logfile):
+        if not util.run_cmd(command, self.env, self.logfile, self.builddir):
             util.color_print(util.bcolors.FAIL, "\t\t[-] Error running configure. Check the log!")
             return False
+
+        with open(os.path.join(self.builddir, self.CONFIGURE_STAMP), 'w') as f:
+            f.write(self._configure_stamp())
         return True
 
-    def make_install(self):
-        if not os.path.isfile("Makefile"):
+    def make_install(self, clean=True):
+        if not os.path.isfile(os.path.join(self.builddir, "Makefile")):
             util.color_print(util.bcolors.FAIL, "No Makefile found in work dir")
             return False
 
-        command = ["make clean install"]
-        if not util.run_cmd(command, self.env, self.logfile):
+        # Running clean and install as goals of one parallel make races
+        env = self.env.copy()
+        if self.jobserver:
+            env['MAKEFLAGS'] = self.jobserver.makeflags()
+            command = ["make install"]
+        else:
+            command = ["make -j" + str(self.jobs) + " install"]
+        if clean:
+            command = ["make clean && " + command[0]]
+
+        if not util.run_cmd(command, env, self.logfile, self.builddir):
             util.color_print(util.bcolors.FAIL, "Error running make install. Check the log!")
             return False
         return True
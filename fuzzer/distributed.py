@@ -0,0 +1,283 @@
+import os
+import pipes
+import shutil
+import tarfile
+import threading
+import subprocess
+from orthrusutils import blobstore
+import stats
+
+# Pseudo session on a node holding the testcases pushed by the master
+# workspace, and the prefix of the pseudo sessions holding the testcases
+# pulled from the nodes in the master workspace
+PUSH_SESSION = "orthrus-sync"
+PULL_PREFIX = "node."
+
+
+class LocalTransport(object):
+
+    # Runs shell commands in a workspace on this host. Mostly useful to try
+    # out and test a multi-node setup with one workspace per directory.
+    def __init__(self, workspace):
+        self.workspace = os.path.abspath(os.path.expanduser(workspace))
+
+    def command(self, cmd):
+        if not os.path.isdir(self.workspace):
+            os.makedirs(self.workspace)
+        return ["sh", "-c", "cd " + pipes.quote(self.workspace) + " && " + cmd]
+
+    def popen(self, cmd, **kwargs):
+        return subprocess.Popen(self.command(cmd), **kwargs)
+
+    def call(self, cmd, data=None):
+        # Output of the command, None if it failed
+        proc = self.popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        output = proc.communicate(data)[0]
+        if proc.returncode != 0:
+            return None
+        return output
+
+
+class SSHTransport(LocalTransport):
+
+    def __init__(self, host, workspace, options=""):
+        self.host = host
+        self.workspace = workspace
+        self.options = options.split()
+
+    def command(self, cmd):
+        # Quoting would keep the remote shell from expanding ~
+        if self.workspace.startswith("~/"):
+            workspace = '"$HOME"/' + pipes.quote(self.workspace[2:])
+        else:
+            workspace = pipes.quote(self.workspace)
+        return ["ssh"] + self.options + [self.host, "mkdir -p " + workspace + " && cd " + workspace + " && " + cmd]
+
+
+class Node(object):
+
+    def __init__(self, name, options):
+        self.name = name
+        if options.get('transport', 'local') == 'ssh':
+            self.transport = SSHTransport(options['host'], options.get('workspace', '.'),
+                                          options.get('ssh_options', ''))
+        else:
+            self.transport = LocalTransport(options.get('workspace', '.'))
+        self.orthrus = options.get('orthrus', 'orthrus')
+        self.directory = options.get('directory', '.orthrus')
+
+    def job_dir(self, jobId):
+        return self.directory + "/jobs/" + jobId
+
+    def run_orthrus(self, args, logfile=None):
+        with open(logfile or os.devnull, 'a') as log:
+            proc = self.transport.popen(self.orthrus + " " + " ".join(pipes.quote(a) for a in args),
+                                        stdout=log, stderr=subprocess.STDOUT)
+            return proc.wait() == 0
+
+
+def nodes_from_config(config):
+    return [Node(name, options) for name, options in sorted(config.get('nodes', {}).items())]
+
+
+def deploy(node, orthrusDir, jobId):
+    # Ship the fuzzing binaries and the job to the node. The job's sync dir on
+    # the node is left alone, so deploying again never loses fuzzing state.
+    jobDir = orthrusDir + "/jobs/" + jobId
+    proc = node.transport.popen("mkdir -p " + pipes.quote(node.directory) + " && tar -xf - -C " +
+                                pipes.quote(node.directory), stdin=subprocess.PIPE)
+    tar = tarfile.open(fileobj=proc.stdin, mode='w|')
+    for name in ["afl-harden", "afl-asan"]:
+        if os.path.isdir(orthrusDir + "/binaries/" + name):
+            tar.add(orthrusDir + "/binaries/" + name, "binaries/" + name)
+    for name in ["logs", "jobs/" + jobId + "/afl-out"]:
+        info = tarfile.TarInfo(name)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0755
+        tar.addfile(info)
+    tar.add(orthrusDir + "/jobs/jobs.conf", "jobs/jobs.conf")
+    for name in ["harden-job.conf", "asan-job.conf", "afl-in"]:
+        if os.path.exists(jobDir + "/" + name):
+            tar.add(jobDir + "/" + name, "jobs/" + jobId + "/" + name)
+    tar.close()
+    proc.stdin.close()
+    return proc.wait() == 0
+
+
+class SyncIndex(object):
+
+    # Append-only record of the testcases a node is known to hold, and of the
+    # ids handed out for the pseudo sessions on either side
+    def __init__(self, path):
+        self.path = path
+        self.digests = set()
+        self.counters = {'pushed': 0, 'pulled': 0}
+        self._pending = []
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 2 and fields[0] in self.counters:
+                        self.counters[fields[0]] = int(fields[1])
+                    elif len(fields) == 1:
+                        self.digests.add(fields[0])
+        self._flushed = dict(self.counters)
+
+    def add(self, digest):
+        if digest not in self.digests:
+            self.digests.add(digest)
+            self._pending.append(digest + "\n")
+
+    def next_id(self, counter):
+        value = self.counters[counter]
+        self.counters[counter] += 1
+        return value
+
+    def flush(self):
+        if not self._pending and self.counters == self._flushed:
+            return
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'a') as f:
+            f.writelines(self._pending)
+            for counter, value in sorted(self.counters.items()):
+                f.write("{} {}\n".format(counter, value))
+        self._pending = []
+        self._flushed = dict(self.counters)
+
+
+class Syncer(object):
+
+    # Exchanges new queue entries between the master workspace and the nodes
+    # of a job. Every round lists the entries a node found since the last
+    # round, pulls the ones the workspace does not have in one tarball and
+    # pushes the ones the node does not have in another. Testcases are
+    # identified by content, so nothing is transferred twice.
+    def __init__(self, orthrusDir, jobId, nodes):
+        self.orthrusDir = orthrusDir
+        self.jobId = jobId
+        self.jobDir = orthrusDir + "/jobs/" + jobId
+        self.nodes = nodes
+        self.store = blobstore.BlobStore(orthrusDir + "/blobs")
+
+    def _queue_entries(self, manifest, exclude):
+        # {digest: relpath} of the local queue entries, except those of a session
+        entries = {}
+        for relpath, (_, digest) in sorted(manifest.entries.items()):
+            parts = relpath.split('/')
+            if len(parts) == 4 and parts[0] == "afl-out" and parts[2] == "queue" and parts[1] != exclude:
+                entries.setdefault(digest, relpath)
+        return entries
+
+    def list_remote(self, node):
+        # {relpath: digest} of the queue entries found on the node since the last round
+        cmd = ("cd " + pipes.quote(node.job_dir(self.jobId)) + " && N=; " +
+               "if [ -f sync.stamp ]; then N='-newer sync.stamp'; fi; touch sync.stamp.new && " +
+               "find afl-out -path 'afl-out/*/queue/*' ! -path 'afl-out/" + PUSH_SESSION + "/*' " +
+               "! -path '*/.*' -type f $N -exec sha1sum {} +")
+        output = node.transport.call(cmd)
+        if output is None:
+            return None
+        listing = {}
+        for line in output.splitlines():
+            digest, relpath = line.split(None, 1)
+            listing[relpath] = digest
+        return listing
+
+    def pull(self, node, relpaths, index):
+        # Fetch the entries into the node's pseudo session, returns their relpaths
+        pullDir = "afl-out/" + PULL_PREFIX + node.name + "/queue/"
+        if not os.path.isdir(self.jobDir + "/" + pullDir):
+            os.makedirs(self.jobDir + "/" + pullDir)
+        proc = node.transport.popen("cd " + pipes.quote(node.job_dir(self.jobId)) + " && tar -cf - -T -",
+                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        # The list is fed from a thread, tar starts sending before it read all names
+        feeder = threading.Thread(target=self._feed, args=(proc.stdin, relpaths))
+        feeder.start()
+        pulled = []
+        tar = tarfile.open(fileobj=proc.stdout, mode='r|')
+        for member in tar:
+            if not member.isfile():
+                continue
+            name = "id:{:06d},sync:{}".format(index.next_id('pulled'), node.name)
+            with open(self.jobDir + "/" + pullDir + name, 'wb') as f:
+                shutil.copyfileobj(tar.extractfile(member), f)
+            pulled.append(pullDir + name)
+        tar.close()
+        feeder.join()
+        if proc.wait() != 0:
+            return None
+        return pulled
+
+    @staticmethod
+    def _feed(pipe, relpaths):
+        pipe.write("".join(relpath + "\n" for relpath in relpaths))
+        pipe.close()
+
+    def push(self, node, paths, index):
+        proc = node.transport.popen("cd " + pipes.quote(node.job_dir(self.jobId)) + " && mkdir -p afl-out/" +
+                                    PUSH_SESSION + "/queue && tar -xf - -C afl-out/" + PUSH_SESSION + "/queue",
+                                    stdin=subprocess.PIPE)
+        tar = tarfile.open(fileobj=proc.stdin, mode='w|')
+        for path in paths:
+            tar.add(path, "id:{:06d},sync:master".format(index.next_id('pushed')))
+        tar.close()
+        proc.stdin.close()
+        return proc.wait() == 0
+
+    def pull_stats(self, node):
+        # Copies of the nodes' fuzzer_stats below jobs/<id>/nodes/<node>/<session>/
+        statsDir = self.jobDir + "/nodes/" + node.name
+        proc = node.transport.popen("cd " + pipes.quote(node.job_dir(self.jobId)) + "/afl-out && " +
+                                    "find . -mindepth 2 -maxdepth 2 -name fuzzer_stats | tar -cf - -T -",
+                                    stdout=subprocess.PIPE)
+        tar = tarfile.open(fileobj=proc.stdout, mode='r|')
+        for member in tar:
+            if member.isfile():
+                session = os.path.dirname(os.path.normpath(member.name))
+                if not os.path.isdir(statsDir + "/" + session):
+                    os.makedirs(statsDir + "/" + session)
+                with open(statsDir + "/" + session + "/fuzzer_stats", 'wb') as f:
+                    shutil.copyfileobj(tar.extractfile(member), f)
+        tar.close()
+        proc.wait()
+        return stats.summarize([], remote=stats.session_dirs(statsDir))
+
+    def sync_node(self, node):
+        # One round with one node, returns (pulled, pushed) or None on failure
+        index = SyncIndex(self.jobDir + "/nodes/" + node.name + ".index")
+        manifest_path = self.jobDir + "/manifest"
+        self.store.ingest_tree(self.jobDir, manifest_path)
+        manifest = blobstore.Manifest(manifest_path)
+        local = set(digest for _, digest in manifest.entries.values())
+
+        listing = self.list_remote(node)
+        if listing is None:
+            return None
+        wanted = {}
+        for relpath, digest in sorted(listing.items()):
+            index.add(digest)
+            if digest not in local:
+                wanted.setdefault(digest, relpath)
+        pulled = []
+        if wanted:
+            pulled = self.pull(node, sorted(wanted.values()), index)
+            if pulled is None:
+                return None
+            self.store.ingest_paths(self.jobDir, pulled, manifest)
+            manifest.flush()
+
+        # Everything the node has not seen, including the finds of other nodes
+        outgoing = [(digest, relpath) for digest, relpath in
+                    sorted(self._queue_entries(manifest, PULL_PREFIX + node.name).items())
+                    if digest not in index.digests]
+        if outgoing:
+            if not self.push(node, [self.jobDir + "/" + relpath for _, relpath in outgoing], index):
+                return None
+            for digest, _ in outgoing:
+                index.add(digest)
+
+        index.flush()
+        # Only now the entries listed this round count as synced
+        node.transport.call("cd " + pipes.quote(node.job_dir(self.jobId)) + " && mv sync.stamp.new sync.stamp")
+        return len(pulled), len(outgoing)
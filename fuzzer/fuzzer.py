@@ -0,0 +1,380 @@
+import os
+import time
+import errno
+import shlex
+import ctypes
+import ctypes.util
+import signal
+import subprocess
+import ConfigParser
+
+# Files in the job dir: the plan lists the instances a job should run, the
+# state is owned by the supervisor and records what actually runs
+PLAN_FILE = "fuzzers.conf"
+STATE_FILE = "fuzzers.state"
+
+
+class Instance(object):
+
+    # One afl-fuzz process, described by an afl-multicore style job conf and
+    # pinned to a core unless cpu is None
+    def __init__(self, session, variant, role, jobconf, cpu=None):
+        self.session = session
+        self.variant = variant
+        self.role = role
+        self.jobconf = jobconf
+        self.cpu = cpu
+
+    def environ(self, env=None):
+        env = dict(env if env is not None else os.environ)
+        if self.cpu is not None:
+            # afl-fuzz would otherwise bind itself to a core of its choice
+            env['AFL_NO_AFFINITY'] = '1'
+        return env
+
+    def preexec(self):
+        # Runs in the child before afl-fuzz is executed. The affinity is
+        # inherited by the target processes afl-fuzz forks.
+        os.setpgrp()
+        if self.cpu is not None:
+            set_affinity([self.cpu])
+
+    def command(self):
+        conf = ConfigParser.ConfigParser()
+        conf.read(self.jobconf)
+        outdir = conf.get("afl.dirs", "output")
+        # Sessions that fuzzed before resume from their own queue
+        if os.path.isdir(os.path.join(outdir, self.session, "queue")):
+            indir = "-"
+        else:
+            indir = conf.get("afl.dirs", "input")
+
+        cmd = ["afl-fuzz", "-i", indir, "-o", outdir]
+        if conf.has_option("afl.ctrl", "file"):
+            cmd += ["-f", conf.get("afl.ctrl", "file") + "_" + self.session]
+        if conf.has_option("afl.ctrl", "timeout"):
+            cmd += ["-t", conf.get("afl.ctrl", "timeout")]
+        if conf.has_option("afl.ctrl", "mem_limit"):
+            cmd += ["-m", conf.get("afl.ctrl", "mem_limit")]
+        cmd += ["-M" if self.role == "master" else "-S", self.session]
+        cmd += ["--", conf.get("target", "target")] + shlex.split(conf.get("target", "cmdline"))
+        return cmd
+
+
+# Size of the kernel's cpu_set_t in bits
+CPU_SETSIZE = 1024
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+
+def set_affinity(cpus, pid=0):
+    # sched_setaffinity(2), os has no wrapper for it in Python 2
+    bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    mask = (ctypes.c_ulong * (CPU_SETSIZE // bits))()
+    for cpu in cpus:
+        mask[cpu // bits] |= 1 << (cpu % bits)
+    if _libc.sched_setaffinity(pid, ctypes.sizeof(mask), mask) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def built_variants(orthrusDir):
+    # The builds instances can fuzz, harden first
+    return [variant for variant in ["harden", "asan"] if os.path.exists(orthrusDir + "/binaries/afl-" + variant)]
+
+
+def make_plan(orthrusDir, jobId, scheduler, count=None, prefer=()):
+    # The scheduler splits the free cores between the harden and ASAN
+    # instances. The master is a harden instance if there is a harden build.
+    # Empty without builds or free cores.
+    jobDir = orthrusDir + "/jobs/" + jobId
+    variants = built_variants(orthrusDir)
+    if not variants:
+        return []
+
+    instances = []
+    for variant, cpu in scheduler.assign(variants, count, prefer):
+        session = "SESSION{:03d}".format(len(instances))
+        role = "master" if not instances else "slave"
+        instances.append(Instance(session, variant, role, jobDir + "/" + variant + "-job.conf", cpu))
+    return instances
+
+
+def write_plan(jobDir, instances):
+    plan = ConfigParser.ConfigParser()
+    for inst in instances:
+        plan.add_section(inst.session)
+        plan.set(inst.session, "variant", inst.variant)
+        plan.set(inst.session, "role", inst.role)
+        plan.set(inst.session, "conf", inst.jobconf)
+        if inst.cpu is not None:
+            plan.set(inst.session, "cpu", str(inst.cpu))
+    _write_config(plan, os.path.join(jobDir, PLAN_FILE))
+
+
+def read_plan(jobDir):
+    plan = ConfigParser.ConfigParser()
+    plan.read(os.path.join(jobDir, PLAN_FILE))
+    return [Instance(session, plan.get(session, "variant"), plan.get(session, "role"), plan.get(session, "conf"),
+                     plan.getint(session, "cpu") if plan.has_option(session, "cpu") else None)
+            for session in sorted(plan.sections())]
+
+
+def read_state(jobDir):
+    # {'supervisor': pid, 'instances': {session: {pid, variant, role, restarts, status}}},
+    # None if the job has no supervisor
+    path = os.path.join(jobDir, STATE_FILE)
+    if not os.path.isfile(path):
+        return None
+    state = ConfigParser.ConfigParser()
+    state.read(path)
+    if not state.has_section("supervisor"):
+        return None
+    instances = {}
+    for session in state.sections():
+        if session == "supervisor":
+            continue
+        instances[session] = dict(state.items(session))
+        instances[session]['pid'] = state.getint(session, "pid")
+        instances[session]['restarts'] = state.getint(session, "restarts")
+    return {'supervisor': state.getint("supervisor", "pid"), 'instances': instances}
+
+
+def _write_config(config, path):
+    with open(path + ".tmp", 'wb') as f:
+        config.write(f)
+    os.rename(path + ".tmp", path)
+
+
+def pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    # Zombies are dead, they only wait to be reaped
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except IOError:
+        return False
+
+
+def send_signal(pid, signum):
+    # Processes may exit at any time, a vanished pid is not an error
+    try:
+        os.kill(pid, signum)
+    except OSError as e:
+        if e.errno != errno.ESRCH:
+            raise
+
+
+def is_afl_fuzz(pid):
+    # Guards against signalling a process that reused the pid of an instance
+    try:
+        with open("/proc/{}/cmdline".format(pid)) as f:
+            argv = f.read().split('\0')
+    except IOError:
+        return False
+    return os.path.basename(argv[0]) == "afl-fuzz"
+
+
+class Supervisor(object):
+
+    # Seconds an instance gets to exit after SIGINT before it is killed
+    GRACE = 10
+    # An instance that crashed this often within the window is given up on
+    MAX_RESTARTS = 5
+    RESTART_WINDOW = 60
+
+    def __init__(self, jobDir, env=None, logdir=None):
+        self.jobDir = jobDir
+        self.env = env
+        self.logdir = logdir
+        self.procs = {}
+        self.instances = {}
+        self.restarts = {}
+        self.failed = set()
+        self._stopping = False
+        self._reload = False
+
+    def _launch(self, inst):
+        log = open(os.devnull, 'w')
+        if self.logdir:
+            log = open(os.path.join(self.logdir, "afl-{}.log".format(inst.variant)), 'a')
+        with log, open(os.devnull) as devnull:
+            try:
+                self.procs[inst.session] = subprocess.Popen(inst.command(), env=inst.environ(self.env),
+                                                            stdin=devnull, stdout=log, stderr=subprocess.STDOUT,
+                                                            close_fds=True, preexec_fn=inst.preexec)
+            except OSError as e:
+                # e.g. the core went offline, an unpinned afl-fuzz would
+                # compete with the instances on other cores
+                log.write("[-] Cannot start {}: {}\n".format(inst.session, e))
+                self.failed.add(inst.session)
+
+    def _terminate(self, sessions):
+        # SIGINT lets afl-fuzz write its stats and exit cleanly, SIGKILL
+        # takes care of instances that do not react in time
+        procs = [self.procs.pop(s) for s in sessions if s in self.procs]
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+        deadline = time.time() + self.GRACE
+        while time.time() < deadline and any(proc.poll() is None for proc in procs):
+            time.sleep(0.1)
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+    def _write_state(self):
+        state = ConfigParser.ConfigParser()
+        state.add_section("supervisor")
+        state.set("supervisor", "pid", str(os.getpid()))
+        for session, inst in sorted(self.instances.items()):
+            proc = self.procs.get(session)
+            state.add_section(session)
+            state.set(session, "pid", str(proc.pid if proc else 0))
+            state.set(session, "variant", inst.variant)
+            state.set(session, "role", inst.role)
+            state.set(session, "cpu", str(inst.cpu) if inst.cpu is not None else "")
+            state.set(session, "restarts", str(len(self.restarts.get(session, []))))
+            state.set(session, "status", "failed" if session in self.failed else "running")
+        _write_config(state, os.path.join(self.jobDir, STATE_FILE))
+
+    def load_plan(self):
+        # Start, stop and restart instances so that the plan is followed.
+        # Instances whose settings did not change keep running.
+        plan = dict((inst.session, inst) for inst in read_plan(self.jobDir))
+        changed = [s for s in self.instances
+                   if s not in plan or vars(plan[s]) != vars(self.instances[s])]
+        self._terminate(changed)
+        for session in changed:
+            del self.instances[session]
+            self.restarts.pop(session, None)
+            self.failed.discard(session)
+        for session in sorted(plan):
+            if session not in self.instances:
+                self.instances[session] = plan[session]
+                self._launch(plan[session])
+        self._write_state()
+
+    def _check(self):
+        changed = False
+        now = time.time()
+        for session, proc in self.procs.items():
+            if proc.poll() is None:
+                continue
+            del self.procs[session]
+            history = [t for t in self.restarts.get(session, []) if now - t < self.RESTART_WINDOW]
+            if len(history) >= self.MAX_RESTARTS:
+                self.failed.add(session)
+            else:
+                self.restarts[session] = history + [now]
+                self._launch(self.instances[session])
+            changed = True
+        if changed:
+            self._write_state()
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        try:
+            self.load_plan()
+            while not self._stopping:
+                if self._reload:
+                    self._reload = False
+                    self.load_plan()
+                self._check()
+                time.sleep(1)
+        finally:
+            self._terminate(list(self.procs))
+            try:
+                os.remove(os.path.join(self.jobDir, STATE_FILE))
+            except OSError:
+                pass
+
+    def daemonize(self):
+        # Run the supervisor detached from the terminal. Returns in the calling
+        # process, the supervisor itself never returns from here.
+        pid = os.fork()
+        if pid:
+            os.waitpid(pid, 0)
+            return
+        try:
+            os.setsid()
+            if os.fork():
+                os._exit(0)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            self.run()
+        except BaseException:
+            os._exit(1)
+        os._exit(0)
+
+
+def start(jobDir, env=None, logdir=None, timeout=10):
+    # Launch the supervisor of a job and wait until it started every instance
+    # of the plan. Returns the state, None if the supervisor did not come up.
+    Supervisor(jobDir, env, logdir).daemonize()
+    deadline = time.time() + timeout
+    planned = set(inst.session for inst in read_plan(jobDir))
+    while time.time() < deadline:
+        state = read_state(jobDir)
+        if state and pid_alive(state['supervisor']) and set(state['instances']) >= planned:
+            return state
+        time.sleep(0.1)
+    return None
+
+
+def reload(jobDir):
+    state = read_state(jobDir)
+    if not state or not pid_alive(state['supervisor']):
+        return False
+    send_signal(state['supervisor'], signal.SIGHUP)
+    return True
+
+
+def stop(jobDir, timeout=Supervisor.GRACE + 5):
+    # Ask the supervisor to stop its instances. Instances left behind by a
+    # supervisor that died or hangs are stopped directly.
+    state = read_state(jobDir)
+    if not state:
+        return True
+    if pid_alive(state['supervisor']):
+        send_signal(state['supervisor'], signal.SIGTERM)
+        deadline = time.time() + timeout
+        while time.time() < deadline and pid_alive(state['supervisor']):
+            time.sleep(0.1)
+        if pid_alive(state['supervisor']):
+            send_signal(state['supervisor'], signal.SIGKILL)
+
+    pids = [inst['pid'] for inst in state['instances'].values() if is_afl_fuzz(inst['pid'])]
+    for pid in pids:
+        send_signal(pid, signal.SIGINT)
+    deadline = time.time() + Supervisor.GRACE
+    while time.time() < deadline and any(pid_alive(pid) for pid in pids):
+        time.sleep(0.1)
+    for pid in pids:
+        if pid_alive(pid):
+            send_signal(pid, signal.SIGKILL)
+
+    try:
+        os.remove(os.path.join(jobDir, STATE_FILE))
+    except OSError:
+        pass
+    return True
+
+
+def running(jobDir):
+    state = read_state(jobDir)
+    return bool(state) and pid_alive(state['supervisor'])
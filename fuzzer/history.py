@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import stats
+
+# plot_data columns kept in the history
+PLOT_UNIQUE_CRASHES = 7
+
+# (bucket seconds, seconds the buckets are kept). Every sample goes into all
+# resolutions, old samples survive only in the coarse ones.
+RESOLUTIONS = [(60, 2 * 86400), (900, 30 * 86400), (3600, None)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, inode INTEGER, offset INTEGER);
+CREATE TABLE IF NOT EXISTS samples (resolution INTEGER, bucket INTEGER, session TEXT,
+                                    execs_per_sec REAL, paths_total INTEGER, unique_crashes INTEGER,
+                                    PRIMARY KEY (resolution, bucket, session));
+"""
+
+
+class History(object):
+
+    # Time series of a job built from the plot_data of its instances. Only the
+    # bytes appended to a plot_data since the last update are parsed, the
+    # position is kept per file. Sessions report every 5 seconds, samples are
+    # bucketed per resolution and the latest sample of a bucket wins.
+    def __init__(self, jobDir):
+        self.jobDir = jobDir
+        self.db = sqlite3.connect(os.path.join(jobDir, "history.db"))
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _new_lines(self, path):
+        st = os.stat(path)
+        key = os.path.relpath(path, self.jobDir)
+        row = self.db.execute("SELECT inode, offset FROM sources WHERE path = ?", (key,)).fetchone()
+        offset = 0
+        # afl-fuzz recreates plot_data when it resumes a session
+        if row and row[0] == st.st_ino and row[1] <= st.st_size:
+            offset = row[1]
+        with open(path) as f:
+            f.seek(offset)
+            data = f.read()
+        # A line afl-fuzz is still writing is left for the next update
+        end = data.rfind('\n') + 1
+        self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (key, st.st_ino, offset + end))
+        return data[:end].splitlines()
+
+    def update(self):
+        rows = []
+        for session in stats.session_dirs(os.path.join(self.jobDir, "afl-out")):
+            path = os.path.join(session, "plot_data")
+            if not os.path.isfile(path):
+                continue
+            name = os.path.basename(session)
+            for line in self._new_lines(path):
+                fields = line.split(',')
+                if line.startswith('#') or len(fields) <= stats.PLOT_EXECS_PER_SEC:
+                    continue
+                try:
+                    sample = (int(fields[stats.PLOT_UNIX_TIME]), float(fields[stats.PLOT_EXECS_PER_SEC]),
+                              int(fields[stats.PLOT_PATHS_TOTAL]), int(fields[PLOT_UNIQUE_CRASHES]))
+                except ValueError:
+                    continue
+                for resolution, _ in RESOLUTIONS:
+                    rows.append((resolution, sample[0] - sample[0] % resolution, name) + sample[1:])
+        self.db.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.prune()
+        self.db.commit()
+        return len(rows) / len(RESOLUTIONS)
+
+    def prune(self, now=None):
+        now = now or self.db.execute("SELECT MAX(bucket) FROM samples").fetchone()[0]
+        if now is None:
+            return
+        for resolution, keep in RESOLUTIONS:
+            if keep:
+                self.db.execute("DELETE FROM samples WHERE resolution = ? AND bucket < ?", (resolution, now - keep))
+
+    def series(self, since, resolution=None):
+        # [(time, execs_per_sec, paths_total, unique_crashes)] of the job since a
+        # point in time, at the finest resolution still holding that time span
+        if resolution is None:
+            latest = self.db.execute("SELECT MAX(bucket) FROM samples").fetchone()[0] or 0
+            resolution = next((r for r, keep in RESOLUTIONS if not keep or latest - since <= keep),
+                              RESOLUTIONS[-1][0])
+        return self.db.execute("SELECT bucket, SUM(execs_per_sec), MAX(paths_total), SUM(unique_crashes) "
+                               "FROM samples WHERE resolution = ? AND bucket >= ? GROUP BY bucket "
+                               "ORDER BY bucket", (resolution, since)).fetchall()
+
+
+# Block elements U+2581 to U+2588
+SPARK = [unichr(c).encode('utf-8') for c in range(0x2581, 0x2589)]
+
+
+def sparkline(values, width=60):
+    # At most width characters, longer series are averaged down
+    if len(values) > width:
+        step = len(values) / float(width)
+        values = [sum(values[int(i * step):int((i + 1) * step)]) / float(int((i + 1) * step) - int(i * step))
+                  for i in range(width)]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = float(high - low) or 1.0
+    return "".join(SPARK[int((v - low) / span * (len(SPARK) - 1))] for v in values)
@@ -0,0 +1,96 @@
+import BaseHTTPServer
+import stats
+
+# name, type, help of the exported metrics
+JOB_METRICS = [
+    ('orthrus_fuzzers_alive', 'gauge', 'Running afl-fuzz instances of a job', 'alive'),
+    ('orthrus_execs_per_second', 'gauge', 'Current executions per second of a job', 'execs_per_sec'),
+    ('orthrus_execs_total', 'counter', 'Executions of a job', 'execs_done'),
+    ('orthrus_paths_total', 'gauge', 'Paths in the queue of a job', 'paths_total'),
+    ('orthrus_pending_favs', 'gauge', 'Favored paths of a job not fuzzed yet', 'pending_favs'),
+    ('orthrus_unique_crashes', 'gauge', 'Crashes of a job, unique per instance', 'unique_crashes'),
+    ('orthrus_unique_hangs', 'gauge', 'Hangs of a job, unique per instance', 'unique_hangs'),
+    ('orthrus_last_path_timestamp_seconds', 'gauge', 'Time the last new path of a job was found', 'last_path'),
+]
+INSTANCE_METRICS = [
+    ('orthrus_instance_up', 'gauge', 'Whether an afl-fuzz instance is running', 'alive'),
+    ('orthrus_instance_execs_per_second', 'gauge', 'Current executions per second of an instance',
+     'execs_per_sec'),
+    ('orthrus_instance_execs_total', 'counter', 'Executions of an instance', 'execs_done'),
+    ('orthrus_instance_stability_percent', 'gauge', 'Stability of the coverage of an instance', 'stability'),
+]
+
+
+def _labels(**labels):
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in sorted(labels.items())) + "}"
+
+
+def _sample(name, labels, value):
+    if isinstance(value, bool):
+        value = int(value)
+    return "{}{} {}\n".format(name, labels, value)
+
+
+def render(orthrusDir, job_config, cache):
+    # Prometheus text exposition format of the stats of all jobs
+    jobs = []
+    for jobId in job_config.sections():
+        jobDir = orthrusDir + "/jobs/" + jobId
+        jobs.append((jobId, job_config.get(jobId, "target"), jobDir, stats.job_stats(jobDir, cache)))
+    cpu = stats.process_group_cpu()
+    triaged = stats.triaged_crashes(orthrusDir)
+
+    out = []
+    for name, kind, description, key in JOB_METRICS:
+        out.append("# HELP {} {}\n# TYPE {} {}\n".format(name, description, name, kind))
+        for jobId, target, _, summary in jobs:
+            out.append(_sample(name, _labels(job=jobId, target=target), summary[key]))
+    out.append("# HELP orthrus_triaged_crashes Unique crashes of a job after triage\n"
+               "# TYPE orthrus_triaged_crashes gauge\n")
+    for jobId, target, _, _ in jobs:
+        out.append(_sample("orthrus_triaged_crashes", _labels(job=jobId, target=target), triaged.get(jobId, 0)))
+
+    for name, kind, description, key in INSTANCE_METRICS:
+        out.append("# HELP {} {}\n# TYPE {} {}\n".format(name, description, name, kind))
+        for jobId, target, _, summary in jobs:
+            for sstats in summary['sessions']:
+                if sstats[key] is not None:
+                    out.append(_sample(name, _labels(job=jobId, session=sstats['session'],
+                                                     remote=str(sstats['remote']).lower()), sstats[key]))
+    out.append("# HELP orthrus_instance_cpu_seconds_total CPU time of an instance and its targets\n"
+               "# TYPE orthrus_instance_cpu_seconds_total counter\n")
+    for jobId, target, _, summary in jobs:
+        for sstats in summary['sessions']:
+            if sstats['alive'] and sstats['pid'] in cpu:
+                out.append(_sample("orthrus_instance_cpu_seconds_total",
+                                   _labels(job=jobId, session=sstats['session']), cpu[sstats['pid']]))
+    return "".join(out)
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.render()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(address, port, render_fn):
+    # Serves render_fn() until interrupted. The stats are read on every scrape,
+    # the cache behind render_fn keeps that cheap.
+    server = BaseHTTPServer.HTTPServer((address, port), MetricsHandler)
+    server.render = render_fn
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,177 @@
+import os
+import glob
+import time
+
+# Relative share of the cores each variant gets. ASAN instances execute about
+# half as fast as harden instances and find less per core.
+DEFAULT_WEIGHTS = {'harden': 3, 'asan': 1}
+# Cores busier than this (in percent) are not handed out
+DEFAULT_BUSY_THRESHOLD = 50
+
+
+def parse_cpulist(cpulist):
+    # "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+    cpus = []
+    for part in cpulist.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def online_cpus():
+    # Online cores this process may run on, a cpuset or taskset limits them
+    try:
+        with open("/sys/devices/system/cpu/online") as f:
+            cpus = parse_cpulist(f.read())
+    except IOError:
+        cpus = range(os.sysconf('SC_NPROCESSORS_ONLN'))
+    allowed = allowed_cpus()
+    return [cpu for cpu in cpus if allowed is None or cpu in allowed]
+
+
+def allowed_cpus(pid="self"):
+    # Affinity of a process, None if it is unknown
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("Cpus_allowed_list:"):
+                    return set(parse_cpulist(line.split(':', 1)[1]))
+    except IOError:
+        pass
+    return None
+
+
+def numa_nodes():
+    # {node: [cpus]}, a single node holding every cpu on non-NUMA systems
+    nodes = {}
+    for path in glob.glob("/sys/devices/system/node/node*/cpulist"):
+        node = int(os.path.basename(os.path.dirname(path))[4:])
+        with open(path) as f:
+            nodes[node] = parse_cpulist(f.read())
+    return nodes or {0: online_cpus()}
+
+
+def cpu_times():
+    # {cpu: (busy, total)} in jiffies since boot
+    times = {}
+    with open("/proc/stat") as f:
+        for line in f:
+            fields = line.split()
+            if not fields[0].startswith("cpu") or fields[0] == "cpu":
+                continue
+            values = [int(v) for v in fields[1:]]
+            # idle and iowait
+            idle = values[3] + (values[4] if len(values) > 4 else 0)
+            times[int(fields[0][3:])] = (sum(values) - idle, sum(values))
+    return times
+
+
+def cpu_load(interval=0.5):
+    # {cpu: percent busy} over the sampling interval
+    before = cpu_times()
+    time.sleep(interval)
+    after = cpu_times()
+    load = {}
+    for cpu, (busy, total) in after.items():
+        prev_busy, prev_total = before.get(cpu, (0, 0))
+        load[cpu] = 100.0 * (busy - prev_busy) / max(total - prev_total, 1)
+    return load
+
+
+def afl_bound_cpus():
+    # Cores that running afl-fuzz instances are pinned to, by afl-fuzz itself,
+    # by another orthrus job or by hand
+    bound = set()
+    for status in glob.glob("/proc/[0-9]*/status"):
+        try:
+            with open(status) as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+        except IOError:
+            continue
+        if fields.get('Name', '').strip() != "afl-fuzz":
+            continue
+        allowed = parse_cpulist(fields.get('Cpus_allowed_list', ''))
+        if len(allowed) == 1:
+            bound.update(allowed)
+    return bound
+
+
+def apportion(count, variants, weights):
+    # Split count instances between the variants in proportion to their weights
+    # (largest remainder). Every variant gets at least one instance while count
+    # allows, with fewer than one each the heaviest variants, earliest first,
+    # get one and the others none.
+    if count < len(variants):
+        order = sorted(range(len(variants)), key=lambda i: (-weights.get(variants[i], 1), i))
+        chosen = set(variants[i] for i in order[:max(count, 0)])
+        return dict((v, 1 if v in chosen else 0) for v in variants)
+    total = float(sum(weights.get(v, 1) for v in variants))
+    shares = [(count * weights.get(v, 1) / total, v) for v in variants]
+    counts = dict((v, max(int(share), 1)) for share, v in shares)
+    by_remainder = sorted(shares, key=lambda s: s[0] - int(s[0]), reverse=True)
+    for share, v in by_remainder:
+        if sum(counts.values()) >= count:
+            break
+        counts[v] += 1
+    # Raising small shares to one instance may hand out more than count, the
+    # variants furthest above their share give them back
+    shares = dict((v, share) for share, v in shares)
+    while sum(counts.values()) > count:
+        over = [v for v in variants if counts[v] > 1]
+        counts[max(over, key=lambda v: (counts[v] - shares[v], v))] -= 1
+    return counts
+
+
+class Scheduler(object):
+
+    # Hands out the cores no other fuzzer is bound to and that are not busy.
+    # Cores are taken from as few NUMA nodes as possible so the instances of a
+    # job share the memory of one node. A pool restricts the scheduler to a
+    # fixed set of cores, e.g. the cores of running jobs being rebalanced.
+    def __init__(self, weights=None, busy_threshold=DEFAULT_BUSY_THRESHOLD, load=None, bound=None, pool=None):
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.busy_threshold = busy_threshold
+        self._load = load
+        self._bound = bound
+        self.pool = pool
+        self.taken = set()
+
+    def free_cpus(self):
+        if self.pool is not None:
+            return [cpu for cpu in sorted(self.pool) if cpu not in self.taken]
+        if self._load is None:
+            self._load = cpu_load()
+        if self._bound is None:
+            self._bound = afl_bound_cpus()
+        return [cpu for cpu in online_cpus()
+                if cpu not in self._bound and cpu not in self.taken and
+                self._load.get(cpu, 0) < self.busy_threshold]
+
+    def pick(self, count, prefer=()):
+        # Preferred cores (the ones a job already runs on) are kept first
+        free = set(self.free_cpus())
+        picked = sorted(free & set(prefer))[:count]
+        free -= set(picked)
+        # Fullest node first, then spill over into the next ones
+        for node, cpus in sorted(numa_nodes().items(), key=lambda n: (-len(free & set(n[1])), n[0])):
+            picked.extend(sorted(free & set(cpus))[:count - len(picked)])
+        # Pool cores missing from the node lists
+        picked.extend(sorted(free - set(picked))[:count - len(picked)])
+        self.taken.update(picked)
+        return picked
+
+    def assign(self, variants, count=None, prefer=()):
+        # [(variant, cpu)] for the instances of a job, in the order of variants,
+        # one instance per picked core. Empty without free cores.
+        cpus = self.pick(len(self.free_cpus()) if count is None else count, prefer)
+        assignment = []
+        counts = apportion(len(cpus), variants, self.weights)
+        for variant in variants:
+            for _ in range(counts[variant]):
+                assignment.append((variant, cpus.pop(0)))
+        return assignment
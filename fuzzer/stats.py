@@ -0,0 +1,249 @@
+import os
+import json
+import time
+from triagetool import crashdb
+import fuzzer
+
+# Columns of afl-fuzz plot_data
+PLOT_UNIX_TIME = 0
+PLOT_PATHS_TOTAL = 3
+PLOT_EXECS_PER_SEC = 10
+
+# Seconds after which the stats copied from a worker node count as stale
+REMOTE_STALE = 300
+
+# Bytes read from the end of plot_data, enough for well over an hour of
+# samples at afl-fuzz' 5 second interval
+PLOT_TAIL = 64 * 1024
+
+
+def read_fuzzer_stats(path):
+    # "key : value" lines of a session's fuzzer_stats
+    stats = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    stats[key.strip()] = value.strip()
+    except IOError:
+        pass
+    return stats
+
+
+def read_plot_data(path, since=0, columns=(PLOT_UNIX_TIME, PLOT_PATHS_TOTAL)):
+    # [(unix_time, paths_total)] of the samples taken at or after since, or
+    # the given columns of them
+    samples = []
+    try:
+        with open(path) as f:
+            f.seek(max(os.fstat(f.fileno()).st_size - PLOT_TAIL, 0))
+            lines = f.read().splitlines()
+    except IOError:
+        return samples
+    for line in lines:
+        fields = line.split(',')
+        if line.startswith('#') or len(fields) <= max(columns):
+            continue
+        try:
+            sample = tuple(float(fields[c]) if '.' in fields[c] else int(fields[c]) for c in columns)
+        except ValueError:
+            # First line of the tail is usually cut off
+            continue
+        if sample[0] >= since:
+            samples.append(sample)
+    return samples
+
+
+def session_dirs(syncDir):
+    if not os.path.isdir(syncDir):
+        return []
+    return [os.path.join(syncDir, s) for s in sorted(os.listdir(syncDir))
+            if os.path.isfile(os.path.join(syncDir, s, "fuzzer_stats"))]
+
+
+def path_rate(syncDir, window, now):
+    # New paths per hour over the last window seconds. Sessions import the
+    # finds of each other, so the busiest session stands for the whole job.
+    rate = 0.0
+    for session in session_dirs(syncDir):
+        samples = read_plot_data(os.path.join(session, "plot_data"), now - window)
+        if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+            continue
+        found = samples[-1][1] - samples[0][1]
+        rate = max(rate, found * 3600.0 / (samples[-1][0] - samples[0][0]))
+    return rate
+
+
+class StatsCache(object):
+
+    # Parsed stats files keyed by path, reused as long as the file's mtime and
+    # size do not change. Persisted as JSON so one-shot commands benefit too.
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        self._dirty = False
+        if path and os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                pass
+
+    def get(self, path, parse):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = [st.st_mtime, st.st_size]
+        entry = self._entries.get(path)
+        if not entry or entry[0] != key:
+            entry = [key, parse(path)]
+            self._entries[path] = entry
+            self._dirty = True
+        return entry[1]
+
+    def save(self):
+        if not self.path or not self._dirty or not os.path.isdir(os.path.dirname(self.path)):
+            return
+        # Files that are gone, e.g. of removed jobs, are dropped
+        entries = dict((path, entry) for path, entry in self._entries.items() if os.path.exists(path))
+        with open(self.path + ".tmp", 'w') as f:
+            json.dump(entries, f)
+        os.rename(self.path + ".tmp", self.path)
+        self._dirty = False
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _float(value):
+    try:
+        return float(str(value).rstrip('%'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _current_speed(path):
+    # execs_per_sec of the latest plot_data sample. fuzzer_stats only holds
+    # the average since the instance started.
+    samples = read_plot_data(path, columns=(PLOT_UNIX_TIME, PLOT_EXECS_PER_SEC))
+    return samples[-1][1] if samples else None
+
+
+def session_stats(session, cache=None, remote=False):
+    # Stats of one instance, None if it did not write fuzzer_stats yet
+    cache = cache or StatsCache()
+    fstats = cache.get(os.path.join(session, "fuzzer_stats"), read_fuzzer_stats)
+    if not fstats:
+        return None
+    speed = cache.get(os.path.join(session, "plot_data"), _current_speed)
+    if speed is None:
+        speed = _float(fstats.get('execs_per_sec')) or 0.0
+    pid = _int(fstats.get('fuzzer_pid'))
+    name = os.path.basename(os.path.normpath(session))
+    if remote:
+        # Sessions of different nodes share their names
+        name = os.path.basename(os.path.dirname(os.path.normpath(session))) + "/" + name
+    return {
+        'session': name,
+        'remote': remote,
+        'pid': pid,
+        'alive': not remote and fuzzer.pid_alive(pid),
+        'start_time': _int(fstats.get('start_time')),
+        'last_update': _int(fstats.get('last_update')),
+        'last_path': _int(fstats.get('last_path')),
+        'cycles_done': _int(fstats.get('cycles_done')),
+        'execs_done': _int(fstats.get('execs_done')),
+        'execs_per_sec': speed,
+        'paths_total': _int(fstats.get('paths_total')),
+        'pending_total': _int(fstats.get('pending_total')),
+        'pending_favs': _int(fstats.get('pending_favs')),
+        'unique_crashes': _int(fstats.get('unique_crashes')),
+        'unique_hangs': _int(fstats.get('unique_hangs')),
+        'stability': _float(fstats.get('stability')),
+    }
+
+
+def summarize(sessions, cache=None, remote=()):
+    # Totals over the sessions of a job. Remote sessions (copies of the stats
+    # of worker nodes) count as running while their stats are fresh. Every
+    # session imports the paths of the others, so paths_total is the maximum.
+    cache = cache or StatsCache()
+    now = time.time()
+    summary = {'fuzzers': 0, 'alive': 0, 'dead': 0, 'remote': 0, 'run_time': 0, 'execs_done': 0,
+               'execs_per_sec': 0.0, 'paths_total': 0, 'pending_total': 0, 'pending_favs': 0,
+               'unique_crashes': 0, 'unique_hangs': 0, 'stability': None, 'last_path': 0, 'sessions': []}
+    stabilities = []
+    for session, is_remote in [(s, False) for s in sessions] + [(s, True) for s in remote]:
+        sstats = session_stats(session, cache, is_remote)
+        if not sstats:
+            continue
+        summary['sessions'].append(sstats)
+        summary['fuzzers'] += 1
+        if is_remote:
+            summary['remote'] += 1
+            running = now - sstats['last_update'] < REMOTE_STALE
+        else:
+            running = sstats['alive']
+            summary['alive' if running else 'dead'] += 1
+        if running:
+            summary['execs_per_sec'] += sstats['execs_per_sec']
+            summary['run_time'] = max(summary['run_time'], int(now) - sstats['start_time'])
+        summary['execs_done'] += sstats['execs_done']
+        summary['paths_total'] = max(summary['paths_total'], sstats['paths_total'])
+        summary['pending_total'] += sstats['pending_total']
+        summary['pending_favs'] += sstats['pending_favs']
+        summary['unique_crashes'] += sstats['unique_crashes']
+        summary['unique_hangs'] += sstats['unique_hangs']
+        summary['last_path'] = max(summary['last_path'], sstats['last_path'])
+        if sstats['stability'] is not None:
+            stabilities.append(sstats['stability'])
+    if stabilities:
+        summary['stability'] = sum(stabilities) / len(stabilities)
+    return summary
+
+
+def job_stats(jobDir, cache=None):
+    # Summary of the local sessions of a job and of the sessions of its nodes
+    remote = []
+    nodesDir = os.path.join(jobDir, "nodes")
+    if os.path.isdir(nodesDir):
+        for node in sorted(os.listdir(nodesDir)):
+            remote.extend(session_dirs(os.path.join(nodesDir, node)))
+    return summarize(session_dirs(os.path.join(jobDir, "afl-out")), cache, remote)
+
+
+def triaged_crashes(orthrusDir):
+    # {job: unique crashes} found by triage so far
+    if not os.path.isfile(os.path.join(orthrusDir, crashdb.DB_FILE)):
+        return {}
+    db = crashdb.CrashDB(orthrusDir)
+    try:
+        return db.bucket_counts()
+    finally:
+        db.close()
+
+
+def process_group_cpu():
+    # {pgid: cpu seconds} of every process group. The supervisor starts each
+    # instance in a group of its own, so this is the CPU time of an instance,
+    # its fork server and the target processes, reaped ones included.
+    ticks = float(os.sysconf('SC_CLK_TCK'))
+    groups = {}
+    for stat in os.listdir("/proc"):
+        if not stat.isdigit():
+            continue
+        try:
+            with open("/proc/" + stat + "/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except IOError:
+            continue
+        # pgrp, utime, stime, cutime and cstime
+        pgid = int(fields[2])
+        groups[pgid] = groups.get(pgid, 0.0) + sum(int(v) for v in fields[11:15]) / ticks
+    return groups
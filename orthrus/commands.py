@@ -5,19 +5,35 @@ import os
 import sys
 import shutil
 import subprocess
-import random
 import glob
 import webbrowser
 import binascii
 import ConfigParser
 import tarfile
 import time
+import json
+import errno
 import threading
 from Queue import Queue
 # import shlex
 # import pty
 from orthrusutils import orthrusutils as util
+from orthrusutils import elf
+from orthrusutils import blobstore
+from orthrusutils import replay
+from orthrusutils.blobstore import BlobStore
 from builder import builder as b
+from fuzzer import fuzzer
+from fuzzer import scheduler
+from fuzzer import stats
+from fuzzer import distributed
+from fuzzer import metrics
+from fuzzer import history
+from triagetool import triagetool
+from triagetool import crashdb
+from triagetool import symbolizer
+from triagetool import minimizer
+from triagetool import hangs
 
 
 class OrthrusCreate(object):
@@ -26,82 +42,170 @@ class OrthrusCreate(object):
         self.args = args
         self.config = config
 
-    def verifycmd(self, cmd):
-        try:
-            subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError:
-            return False
-
-        return True
-
-    def verifyafl(self, binpath):
-        cmd = ['objdump -t ' + binpath + ' | grep __afl_maybe_log']
-        return self.verifycmd(cmd)
-
-    def verifyasan(self, binpath):
-        cmd = ['objdump -t ' + binpath + ' | grep __asan_get_shadow_mapping']
-        return self.verifycmd(cmd)
-
-    def verifycov(self, binpath):
-        cmd = ['objdump -t ' + binpath + ' | grep gcov_write_block']
-        return self.verifycmd(cmd)
-
-    def verify(self, binpath, benv):
-
-        if 'afl' in benv.cc and not self.verifyafl(binpath):
-            return False
-        if ('-fsanitize=address' in benv.cflags or 'AFL_USE_ASAN=1' in benv.misc) and not self.verifyasan(binpath):
-            return False
-        if '-ftest-coverage' in benv.cflags and not self.verifycov(binpath):
-            return False
-
-        return True
+    # Symbols proving each kind of instrumentation
+    AFL_SYMBOL = '__afl_maybe_log'
+    ASAN_SYMBOL = '__asan_get_shadow_mapping'
+    COV_SYMBOL = 'gcov_write_block'
+
+    def expected_symbols(self, benv):
+        symbols = {}
+        if 'afl' in benv.cc:
+            symbols[self.AFL_SYMBOL] = 'afl'
+        if '-fsanitize=address' in benv.cflags or 'AFL_USE_ASAN' in benv.misc:
+            symbols[self.ASAN_SYMBOL] = 'asan'
+        if '-ftest-coverage' in benv.cflags:
+            symbols[self.COV_SYMBOL] = 'coverage'
+        return symbols
+
+    def verify(self, bindir, benv):
+        # Map every installed binary lacking instrumentation to what it lacks
+        symbols = self.expected_symbols(benv)
+        missing = {}
+        binaries = 0
+        for binpath in sorted(glob.glob(bindir + '*')):
+            if not os.path.isfile(binpath) or not util.is_elf(binpath):
+                continue
+            binaries += 1
+            try:
+                found = self.symbols.find_symbols(binpath, symbols.keys())
+            except elf.ElfError:
+                found = set()
+            absent = [symbols[symbol] for symbol in sorted(symbols) if symbol not in found]
+            if absent:
+                missing[binpath] = absent
+
+        if not binaries:
+            missing[bindir] = ['binaries']
+        return missing
+
+    def _stage(self, msg, quiet):
+        if not quiet:
+            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] " + msg + "... ")
+
+    def _stage_done(self, ok, quiet):
+        if not quiet:
+            if ok:
+                util.color_print(util.bcolors.OKGREEN, "done")
+            else:
+                util.color_print(util.bcolors.FAIL, "failed")
+        return ok
+
+    def variants(self):
+        # (name, description, build environment, log file) of every requested variant
+        variants = []
+        if self.args.update and not (self.args.afl_asan or self.args.afl_harden or self.args.coverage):
+            # Update whatever the workspace was created with
+            binaries = self.config['orthrus']['directory'] + "/binaries/"
+            self.args.afl_asan = os.path.exists(binaries + "afl-asan")
+            self.args.afl_harden = os.path.exists(binaries + "afl-harden")
+            self.args.coverage = os.path.exists(binaries + "coverage")
+        if self.args.afl_asan:
+            variants.append(('afl-asan', "afl-fuzz with AddressSanitizer",
+                             b.BuildEnv.BEnv_afl_asan, 'afl-asan_inst.log'))
+            variants.append(('asan-dbg', "debug with AddressSanitizer",
+                             b.BuildEnv.BEnv_asan_debug, 'afl-asan_dbg.log'))
+        if self.args.afl_harden:
+            variants.append(('afl-harden', "afl-fuzz in harden mode",
+                             b.BuildEnv.BEnv_afl_harden, 'afl_harden.log'))
+            variants.append(('harden-dbg', "debug in harden mode",
+                             b.BuildEnv.BEnv_harden_debug, 'afl_harden_dbg.log'))
+        if self.args.coverage:
+            variants.append(('coverage', "obtaining test coverage information",
+                             b.BuildEnv.BEnv_coverage, 'gcc_coverage.log'))
+        return variants
 
-    def create(self, dest, BEnv, logfn):
+    def create(self, dest, BEnv, logfn, builddir=None, quiet=False, jobserver=None):
 
         install_path = dest
-        os.mkdir(install_path)
-
-        ### Configure
-        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Configure... ")
-
         config_flags = ['--prefix=' + os.path.abspath(install_path)] + \
                        self.args.configure_flags.split(" ")
 
         builder = b.Builder(b.BuildEnv(BEnv),
                             config_flags,
-                            self.config['orthrus']['directory'] + "/logs/" + logfn)
+                            self.config['orthrus']['directory'] + "/logs/" + logfn,
+                            builddir, self.cache, self.args.make_jobs, jobserver)
 
-        if not builder.configure():
-            util.color_print(util.bcolors.FAIL, "failed")
-            return False
+        ### Reuse a previous build of the same sources and build environment
+        if builder.restore(install_path):
+            self._stage("Restoring from build cache", quiet)
+            return self._stage_done(True, quiet)
 
-        util.color_print(util.bcolors.OKGREEN, "done")
+        if not os.path.isdir(install_path):
+            os.mkdir(install_path)
+        if builddir:
+            util.sync_tree('.', builddir, self.sync_ignore, b.Builder.PREBUILT)
+
+        ### Configure
+        self._stage("Configure", quiet)
+
+        if self.args.update and not builder.configure_needed():
+            if not quiet:
+                util.color_print(util.bcolors.OKGREEN, "unchanged")
+        elif not builder.configure():
+            return self._stage_done(False, quiet)
+        else:
+            self._stage_done(True, quiet)
 
         ### Make install
-        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Compile and install... ")
+        self._stage("Compile and install", quiet)
 
-        if not builder.make_install():
-            util.color_print(util.bcolors.FAIL, "failed")
-            return False
+        if not builder.make_install(clean=not self.args.update):
+            return self._stage_done(False, quiet)
 
-        util.copy_binaries(install_path + "bin/")
-        util.color_print(util.bcolors.OKGREEN, "done")
+        util.copy_binaries(install_path + "bin/", builddir or '.', self.args.update,
+                           self.config['orthrus'].get('scan_skip_dirs', util.SCAN_SKIP_DIRS), self.binaries)
+        self._stage_done(True, quiet)
 
         ## Verify instrumentation
-        sample_binpath = random.choice(glob.glob(install_path + 'bin/*'))
-
-        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Verifying instrumentation... ")
-        if not self.verify(sample_binpath, BEnv):
-            util.color_print(util.bcolors.FAIL, "failed")
+        self._stage("Verifying instrumentation", quiet)
+        missing = self.verify(install_path + "bin/", BEnv)
+        self.symbols.save()
+        if not self._stage_done(not missing, quiet):
+            for binpath in sorted(missing):
+                util.color_print(util.bcolors.FAIL, "\t\t\t[-] {}: no {} instrumentation"
+                                 .format(binpath, ", ".join(missing[binpath])))
             return False
 
-        util.color_print(util.bcolors.OKGREEN, "done")
+        builder.store(install_path)
         return True
 
+    def create_parallel(self, variants):
+        builddir = self.config['orthrus']['directory'] + "/build/"
+        workers = self.args.workers or len(variants)
+        # All concurrent makes draw from one global job budget
+        jobserver = b.JobServer(self.args.make_jobs or int(util.getnproc()), min(workers, len(variants)))
+
+        def build(variant):
+            name, _, BEnv, logfn = variant
+            start = time.time()
+            ok = self.create(self.config['orthrus']['directory'] + "/binaries/" + name + "/",
+                             BEnv, logfn, builddir + name + "/", quiet=True, jobserver=jobserver)
+            return ok, time.time() - start
+
+        util.color_print(util.bcolors.HEADER, "\t[+] Building {} variants in parallel".format(len(variants)))
+        start = time.time()
+        try:
+            results = util.parallel_map(build, variants, workers)
+        finally:
+            jobserver.close()
+
+        for (name, description, _, logfn), (ok, duration) in zip(variants, results):
+            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] {} ({})... ".format(name, description))
+            if ok:
+                util.color_print(util.bcolors.OKGREEN, "done ({:.0f}s)".format(duration))
+            else:
+                util.color_print(util.bcolors.FAIL, "failed. Check the log: " + \
+                                 self.config['orthrus']['directory'] + "/logs/" + logfn)
+        util.color_print(util.bcolors.OKGREEN, "\t[+] Finished in {:.0f}s".format(time.time() - start))
+
+        return all(ok for ok, _ in results)
+
     def run(self):
-        util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Create Orthrus workspace")
-        
+        if self.args.update and os.path.exists(self.config['orthrus']['directory']):
+            util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Update Orthrus workspace")
+        else:
+            util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Create Orthrus workspace")
+
         if not os.path.exists(self.config['orthrus']['directory']):
             os.mkdir(self.config['orthrus']['directory'])
             os.mkdir(self.config['orthrus']['directory'] + "/binaries/")
@@ -109,52 +213,36 @@ class OrthrusCreate(object):
             os.mkdir(self.config['orthrus']['directory'] + "/logs/")
             os.mkdir(self.config['orthrus']['directory'] + "/jobs/")
             os.mkdir(self.config['orthrus']['directory'] + "/archive/")
-        else:
+        elif not self.args.update:
             util.color_print(util.bcolors.ERROR, "Error: Orthrus workspace already exists!")
             return False
 
-        # AFL-ASAN
-        if self.args.afl_asan:
-
-            ### Prepare
-            util.color_print(util.bcolors.HEADER,
-                             "\t[+] Installing binaries for afl-fuzz with AddressSanitizer")
-              
-            install_path = self.config['orthrus']['directory'] + "/binaries/afl-asan/"
-            if not self.create(install_path, b.BuildEnv.BEnv_afl_asan, 'afl-asan_inst.log'):
-                return False
-
-            #
-            # ASAN Debug 
-            #
-            util.color_print(util.bcolors.HEADER,
-                             "\t[+] Installing binaries for debug with AddressSanitizer")
-            install_path = self.config['orthrus']['directory'] + "/binaries/asan-dbg/"
-            if not self.create(install_path, b.BuildEnv.BEnv_asan_debug, 'afl-asan_dbg.log'):
-                return False
-
-        ### AFL-HARDEN
-        if self.args.afl_harden:
-            util.color_print(util.bcolors.HEADER,
-                             "\t[+] Installing binaries for afl-fuzz in harden mode")
-            install_path = self.config['orthrus']['directory'] + "/binaries/afl-harden/"
-            if not self.create(install_path, b.BuildEnv.BEnv_afl_harden, 'afl_harden.log'):
-                return False
-
-            #
-            # Harden Debug 
-            #
-            util.color_print(util.bcolors.HEADER,
-                             "\t[+] Installing binaries for debug in harden mode")
-            install_path = self.config['orthrus']['directory'] + "/binaries/harden-dbg/"
-            if not self.create(install_path, b.BuildEnv.BEnv_harden_debug, 'afl_harden_dbg.log'):
-                return False
-
-        ### Coverage
-        if self.args.coverage:
-            util.color_print(util.bcolors.HEADER, "\t[+] Installing binaries for obtaining test coverage information")
-            install_path = self.config['orthrus']['directory'] + "/binaries/coverage/"
-            if not self.create(install_path, b.BuildEnv.BEnv_coverage, 'gcc_coverage.log'):
+        self.workspace = os.path.basename(os.path.normpath(self.config['orthrus']['directory']))
+        self.symbols = elf.SymbolCache(self.config['orthrus']['directory'] + "/conf/symbols.cache")
+        # Binaries found in each build tree, shared by all variants of this run
+        self.binaries = {}
+        cache_config = self.config.get('cache', {})
+        self.ignore = (cache_config.get('ignore') or b.BuildCache.IGNORE) + [self.workspace,
+                                                                             b.Builder.CONFIGURE_STAMP]
+        self.sync_ignore = b.Builder.SYNC_IGNORE + [self.workspace, b.Builder.CONFIGURE_STAMP,
+                                                    util.SYNC_MANIFEST]
+        self.cache = None
+        if not self.args.no_cache:
+            self.cache = b.BuildCache(cache_config.get('directory', os.path.expanduser('~/.orthrus/cache')),
+                                      cache_config.get('max_size', 4096 * 1024 * 1024), self.ignore)
+
+        variants = self.variants()
+        if self.args.parallel:
+            return self.create_parallel(variants)
+
+        for name, description, BEnv, logfn in variants:
+            util.color_print(util.bcolors.HEADER, "\t[+] Installing binaries for " + description)
+            install_path = self.config['orthrus']['directory'] + "/binaries/" + name + "/"
+            # Incremental builds keep their objects in a build dir per variant
+            builddir = None
+            if self.args.update:
+                builddir = self.config['orthrus']['directory'] + "/build/" + name + "/"
+            if not self.create(install_path, BEnv, logfn, builddir):
                 return False
 
         return True
@@ -164,6 +252,8 @@ class OrthrusAdd(object):
     def __init__(self, args, config):
         self._args = args
         self._config = config
+        self.jobId = args.job_id
+        self.jobTarget = None
 
     def seedjob(self):
 
@@ -174,25 +264,54 @@ class OrthrusAdd(object):
             util.color_print_singleline(util.bcolors.OKGREEN,
                                         "\t\t[+] Adding initial samples for job id [" + self.jobId + "]... ")
 
-        samplevalid = False
-
+        dest = self._config['orthrus']['directory'] + "/jobs/" + self.jobId + "/afl-in/"
+        seeds = []
         if os.path.isdir(self._args.sample):
-            samplevalid = True
             for dirpath, dirnames, filenames in os.walk(self._args.sample):
                 for fn in filenames:
                     fpath = os.path.join(dirpath, fn)
                     if os.path.isfile(fpath):
-                        shutil.copy(fpath, self._config['orthrus']['directory'] + "/jobs/" + self.jobId + "/afl-in/")
+                        seeds.append(fpath)
         elif os.path.isfile(self._args.sample):
-            samplevalid = True
-            shutil.copy(self._args.sample, self._config['orthrus']['directory'] + "/jobs/" + self.jobId + "/afl-in/")
-
-        if not samplevalid:
-            util.color_print(util.bcolors.WARNING, 'seed dir or file invalid. No seeds copied!')
+            seeds.append(self._args.sample)
         else:
-            util.color_print(util.bcolors.OKGREEN, "done")
+            util.color_print(util.bcolors.WARNING, 'seed dir or file invalid. No seeds copied!')
+            return True
+
+        imported, duplicates = self.import_seeds(seeds, dest)
+        util.color_print(util.bcolors.OKGREEN, "done ({} seeds, {} duplicates skipped)".format(imported, duplicates))
         return True
 
+    def import_seeds(self, seeds, dest):
+        workers = int(util.getnproc())
+        existing = [dest + fn for fn in os.listdir(dest) if os.path.isfile(dest + fn)]
+
+        # Identical seeds only waste afl-fuzz's dry run, keep the first of each
+        hashes = util.parallel_map(util.hash_file, existing + seeds, workers)
+        known = set(hashes[:len(existing)])
+        names = set()
+        unique = []
+        for seed, digest in zip(seeds, hashes[len(existing):]):
+            if digest in known:
+                continue
+            known.add(digest)
+            dst = dest + os.path.basename(seed)
+            if dst in names or os.path.exists(dst):
+                dst += "." + digest[:8]
+            names.add(dst)
+            unique.append((seed, dst, digest))
+
+        # Seeds enter the workspace blob store once and afl-in links to the blobs
+        store = BlobStore(self._config['orthrus']['directory'] + "/blobs")
+
+        def import_seed(seed):
+            src, dst, digest = seed
+            store.add(src, digest)
+            store.checkout(digest, dst)
+
+        util.parallel_map(import_seed, unique, workers)
+        return len(unique), len(seeds) - len(unique)
+
     def processjob(self):
 
         self.jobId = str(binascii.crc32(self._args.job) & 0xffffffff)
@@ -212,6 +331,7 @@ class OrthrusAdd(object):
         job_config.add_section(self.jobId)
         job_config.set(self.jobId, "target", self.jobTarget)
         job_config.set(self.jobId, "params", self.jobParams)
+        job_config.set(self.jobId, "priority", str(self._args.priority))
         with open(self._config['orthrus']['directory'] + "/jobs/jobs.conf", 'wb') as job_file:
             job_config.write(job_file)
 
@@ -265,6 +385,68 @@ class OrthrusAdd(object):
 
         return True
 
+    # Top level entries of a single afl-fuzz output dir
+    AFL_SESSION_ENTRIES = ['queue', 'crashes', 'hangs', 'fuzzer_stats', 'plot_data', 'fuzz_bitmap',
+                           'cmdline', '.cur_input', '.synced']
+
+    def _is_session_entry(self, name):
+        return name in self.AFL_SESSION_ENTRIES or name.split('.')[0] in ['queue', 'crashes', 'hangs']
+
+    def extract_sync_dir(self, tar, syncDir, next_session):
+        # Extract an archive of a single afl output dir or of a whole sync dir
+        # member by member into the final session dirs. The layout is decided
+        # by the first member, so the archive is only read once.
+        layout = {'single': None, 'next': next_session}
+        sessions = {}
+
+        def fresh_session():
+            # Next session name neither on disk nor taken by this archive
+            while True:
+                name = "SESSION{:03d}".format(layout['next'])
+                layout['next'] += 1
+                if not os.path.exists(syncDir + name) and name not in sessions.values():
+                    return name
+
+        def target(name):
+            parts = [p for p in name.split('/') if p not in ('', '.')]
+            if not parts or '..' in parts or name.startswith('/'):
+                return None
+            if layout['single'] is None:
+                layout['single'] = self._is_session_entry(parts[0])
+                if layout['single']:
+                    layout['session'] = fresh_session()
+            if layout['single']:
+                return "/".join([layout['session']] + parts)
+            if parts[0] not in sessions:
+                # Never merge into a session that already exists or that an
+                # earlier session of the archive was renamed to
+                if os.path.exists(syncDir + parts[0]) or parts[0] in sessions.values():
+                    sessions[parts[0]] = fresh_session()
+                else:
+                    sessions[parts[0]] = parts[0]
+            return "/".join([sessions[parts[0]]] + parts[1:])
+
+        files = 0
+        size = 0
+        for member in tar:
+            # Symlinks could point anywhere and later members would be written
+            # through them, devices and fifos have no place in a sync dir
+            if not (member.isfile() or member.isdir() or member.islnk()):
+                continue
+            name = target(member.name)
+            if not name or (not layout['single'] and '/' not in name and not member.isdir()):
+                continue
+            member.name = name
+            if member.islnk():
+                member.linkname = target(member.linkname)
+                if not member.linkname:
+                    continue
+            tar.extract(member, syncDir)
+            if member.isfile():
+                files += 1
+                size += member.size
+        return files, size
+
     def importjob(self):
         if self.jobId:
             jobId = self.jobId
@@ -274,39 +456,36 @@ class OrthrusAdd(object):
 
         util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Import afl sync dir for job [" + jobId + "]... ")
 
-        if not tarfile.is_tarfile(self._args._import):
+        syncDir = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/"
+        if not os.path.exists(syncDir) or not os.path.isfile(self._args._import):
             util.color_print(util.bcolors.FAIL, "failed!")
             return False
 
-        if not os.path.exists(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/"):
-            util.color_print(util.bcolors.FAIL, "failed!")
-            return False
-
-        syncDir = os.listdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/")
-        for directory in syncDir:
+        for directory in os.listdir(syncDir):
             if "SESSION" in directory:
                 next_session += 1
 
-        is_single = True
-        with tarfile.open(self._args._import, "r") as tar:
+        start = time.time()
+        try:
+            tar, decompressor = util.open_tar_stream(self._args._import)
             try:
-                info = tar.getmember("fuzzer_stats")
-            except KeyError:
-                is_single = False
-
-            if is_single:
-                outDir = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/SESSION" + "{:03d}".format(
-                    next_session)
-                os.mkdir(outDir)
-                tar.extractall(outDir)
-            else:
-                tmpDir = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/tmp/"
-                os.mkdir(tmpDir)
-                tar.extractall(tmpDir)
-                for directory in os.listdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/tmp/"):
-                    outDir = self._config['orthrus']['directory'] + '/jobs/' + jobId + '/afl-out/'
-                    shutil.move(tmpDir + directory, outDir)
-                shutil.rmtree(tmpDir)
+                files, size = self.extract_sync_dir(tar, syncDir, next_session)
+            finally:
+                util.close_tar_stream(tar, decompressor)
+        except (tarfile.TarError, IOError, OSError) as e:
+            util.color_print(util.bcolors.FAIL, "failed!")
+            if str(e):
+                util.color_print(util.bcolors.FAIL, "\t\t[-] " + str(e))
+            return False
+
+        elapsed = max(time.time() - start, 0.001)
+        util.color_print(util.bcolors.OKGREEN, "done ({} files, {:.1f} MB at {:.1f} MB/s)"
+                         .format(files, size / 1048576.0, size / 1048576.0 / elapsed))
+
+        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Deduplicating testcases... ")
+        store = BlobStore(self._config['orthrus']['directory'] + "/blobs")
+        jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+        store.ingest_tree(jobDir, jobDir + "/manifest")
         util.color_print(util.bcolors.OKGREEN, "done")
 
         util.minimize_sync_dir(self._config, jobId)
@@ -359,6 +538,9 @@ class OrthrusRemove(object):
             if not os.path.exists(self._config['orthrus']['directory'] + "/jobs/" + self._args.job_id):
                 util.color_print(util.bcolors.FAIL, "failed!")
                 return False
+            # Archived testcases keep sharing their blobs with the workspace
+            jobDir = self._config['orthrus']['directory'] + "/jobs/" + self._args.job_id
+            BlobStore(self._config['orthrus']['directory'] + "/blobs").ingest_tree(jobDir, jobDir + "/manifest")
             shutil.move(self._config['orthrus']['directory'] + "/jobs/" + self._args.job_id,
                         self._config['orthrus']['directory'] + "/archive/" + time.strftime("%Y-%m-%d-%H:%M:%S") + "-"
                         + self._args.job_id)
@@ -380,16 +562,13 @@ class OrthrusStart(object):
         self._args = args
         self._config = config
     
-    def _start_fuzzers(self, jobId, available_cores):
-        if os.listdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/") == []:
-            start_cmd = "start"
-        else:
-            start_cmd = "resume"
-
-        core_per_subjob = available_cores / 2
-        if core_per_subjob == 0:
-            core_per_subjob = 1
+    def _scheduler(self):
+        scheduler_config = self._config.get('scheduler', {})
+        return scheduler.Scheduler(scheduler_config.get('weights'),
+                                   scheduler_config.get('busy_threshold', scheduler.DEFAULT_BUSY_THRESHOLD))
 
+    def _start_fuzzers(self, jobId, sched=None, count=None):
+        jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
         cmd = ["cat /proc/sys/kernel/core_pattern"]
         util.color_print_singleline(util.bcolors.OKGREEN, "Checking core_pattern...")
         if "core" not in subprocess.check_output(" ".join(cmd), shell=True, stderr=subprocess.STDOUT):
@@ -399,136 +578,93 @@ class OrthrusStart(object):
             return False
         util.color_print(util.bcolors.OKGREEN, "okay")
 
-        env = os.environ.copy()
-        env.update({'AFL_SKIP_CPUFREQ': '1'})
-
-        if os.path.exists(self._config['orthrus']['directory'] + "/binaries/afl-harden"):
-            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Starting AFL harden fuzzer job as master...")
-
-            harden_file = self._config['orthrus']['directory'] + "/logs/afl-harden.log"
-            cmd = ["afl-multicore", "--config=.orthrus/jobs/" + jobId + "/harden-job.conf",
-                                           start_cmd, str(core_per_subjob), "-v"]
-
-            if not util.run_cmd(" ".join(cmd), env, harden_file):
-                util.color_print(util.bcolors.FAIL, "failed")
-                return False
-
-            util.color_print(util.bcolors.OKGREEN, "done")
-            
-            output = open(self._config['orthrus']['directory'] + "/logs/afl-harden.log", "r")
-            for line in output:
-                if "Starting master" in line or "Starting slave" in line:
-                    util.color_print(util.bcolors.OKGREEN, "\t\t\t" + line)
-                if " Master " in line or " Slave " in line:
-                    util.color_print_singleline(util.bcolors.OKGREEN, "\t\t\t\t" + "[+] " + line)
-            output.close()
-            
-            if os.path.exists(self._config['orthrus']['directory'] + "/binaries/afl-asan"):
-                util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Starting AFL ASAN fuzzer job as slave...")
-                asan_file = self._config['orthrus']['directory'] + "/logs/afl-asan.log"
-                cmd = ["afl-multicore", "--config=.orthrus/jobs/" + jobId + "/asan-job.conf ", "add", \
-                                str(core_per_subjob), "-v"]
-
-                if not util.run_cmd(" ".join(cmd), env, asan_file):
-                    util.color_print(util.bcolors.FAIL, "failed")
-                    return False
-
-                util.color_print(util.bcolors.OKGREEN, "done")
-
-                output2 = open(self._config['orthrus']['directory'] + "/logs/afl-asan.log", "r")
-                for line in output2:
-                    if "Starting master" in line or "Starting slave" in line:
-                        util.color_print(util.bcolors.OKGREEN, "\t\t\t" + line)
-                    if " Master " in line or " Slave " in line:
-                        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t\t\t" + "[+] " + line)
-                output2.close()
+        instances = fuzzer.make_plan(self._config['orthrus']['directory'], jobId, sched or self._scheduler(), count)
+        if not instances:
+            if fuzzer.built_variants(self._config['orthrus']['directory']):
+                util.color_print(util.bcolors.FAIL, "\t\t\t[-] No free cores")
+            else:
+                util.color_print(util.bcolors.FAIL, "\t\t\t[-] No afl-harden or afl-asan binaries found")
+            return False
+        fuzzer.write_plan(jobDir, instances)
 
-        elif os.path.exists(self._config['orthrus']['directory'] + "/binaries/afl-asan"):
+        env = os.environ.copy()
+        env.update({'AFL_SKIP_CPUFREQ': '1', 'AFL_NO_UI': '1'})
 
-            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Starting AFL ASAN fuzzer job as master...")
-            asan_file = self._config['orthrus']['directory'] + "/logs/afl-asan.log"
-            cmd = ["afl-multicore", "-c", ".orthrus/jobs/" + jobId + "/asan-job.conf", start_cmd, \
-                   str(available_cores), "-v"]
+        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Starting " + str(len(instances)) +
+                                    " fuzzer instances...")
+        state = fuzzer.start(jobDir, env, self._config['orthrus']['directory'] + "/logs")
+        if not state:
+            util.color_print(util.bcolors.FAIL, "failed")
+            return False
+        util.color_print(util.bcolors.OKGREEN, "done")
 
-            if not util.run_cmd(" ".join(cmd), env, asan_file):
-                util.color_print(util.bcolors.FAIL, "failed")
-                util.printfile(asan_file)
-                return False
+        for session, inst in sorted(state['instances'].items()):
+            util.color_print(util.bcolors.OKGREEN, "\t\t\t[+] " + inst['role'].capitalize() + " " + session +
+                             " (afl-" + inst['variant'] + "), pid " + str(inst['pid']) +
+                             (", cpu " + inst['cpu'] if inst['cpu'] else ", unpinned"))
+        return True
 
-            util.color_print(util.bcolors.OKGREEN, "done")
+    # Testcase dirs merged into the master session, crashes.<date> and hangs.<date> are
+    # left behind by afl-fuzz when it resumes
+    COMPACT_DIRS = ['crashes', 'hangs', 'queue']
 
-            output2 = open(self._config['orthrus']['directory'] + "/logs/afl-asan.log", "r")
-            for line in output2:
-                if "Starting master" in line or "Starting slave" in line:
-                    util.color_print(util.bcolors.OKGREEN, "\t\t\t" + line)
-                if " Master " in line or " Slave " in line:
-                    util.color_print_singleline(util.bcolors.OKGREEN, "\t\t\t\t" + "[+] " + line)
-            output2.close()
-                
-        return True
-    
     def compact_sync_dir(self, jobId):
-        syncDir = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out"
-        for session in os.listdir(syncDir):
-            if os.path.isfile(syncDir + "/" + session):
-                os.remove(syncDir + "/" + session)
-            if os.path.isdir(syncDir + "/" + session):
-                for directory in os.listdir(syncDir + "/" + session):
-                    if "crashes." in directory:
-                        for num, filename in enumerate(os.listdir(syncDir + "/" + session + "/" + directory)):
-                            src_path = syncDir + "/" + session + "/" + directory + "/" + filename
-                            dst_path = syncDir + "/" + session + "/" + "crashes" + "/" + filename
-                            if not os.path.isfile(dst_path):
-                                #dst_path += "," + str(num)
-                                shutil.move(src_path, dst_path)
-                        shutil.rmtree(syncDir + "/" + session + "/" + directory + "/")
-                    if "hangs." in directory:
-                        for num, filename in enumerate(os.listdir(syncDir + "/" + session + "/" + directory)):
-                            src_path = syncDir + "/" + session + "/" + directory + "/" + filename
-                            dst_path = syncDir + "/" + session + "/" + "hangs" + "/" + filename
-                            if not os.path.isfile(dst_path):
-                                #dst_path += "," + str(num)
-                                shutil.move(src_path, dst_path)
-                        shutil.rmtree(syncDir + "/" + session + "/" + directory + "/")
-    #                 if "queue." in directory:
-    #                     for num, filename in enumerate(os.listdir(syncDir + "/" + session + "/" + directory)):
-    #                         src_path = syncDir + "/" + session + "/" + directory + "/" + filename
-    #                         dst_path = syncDir + "/" + session + "/" + "queue" + "/" + filename
-    #                         if os.path.isfile(dst_path):
-    #                             dst_path += "," + str(num)
-    #                         shutil.move(src_path, dst_path)
-    #                     shutil.rmtree(syncDir + "/" + session + "/" + directory + "/")
-        
-        for session in os.listdir(syncDir):
-            if "SESSION000" != session and os.path.isdir(syncDir + "/" + session):
-                for directory in os.listdir(syncDir + "/" + session):
-                    if "crashes" == directory:
-                        for num, filename in enumerate(os.listdir(syncDir + "/" + session + "/" + directory)):
-                            src_path = syncDir + "/" + session + "/" + directory + "/" + filename
-                            dst_path = syncDir + "/" + "SESSION000" + "/" + "crashes" + "/" + filename
-                            if not os.path.isfile(dst_path):
-                                #dst_path += "," + str(num)
-                                shutil.move(src_path, dst_path)
-                    if "hangs" == directory:
-                        for num, filename in enumerate(os.listdir(syncDir + "/" + session + "/" + directory)):
-                            src_path = syncDir + "/" + session + "/" + directory + "/" + filename
-                            dst_path = syncDir + "/" + "SESSION000" + "/" + "hangs" + "/" + filename
-                            if not os.path.isfile(dst_path):
-                                #dst_path += "," + str(num)
-                                shutil.move(src_path, dst_path)
-                    if "queue" == directory:
-                        for num, filename in enumerate(os.listdir(syncDir + "/" + session + "/" + directory)):
-                            src_path = syncDir + "/" + session + "/" + directory + "/" + filename
-                            dst_path = syncDir + "/" + "SESSION000" + "/" + "queue" + "/" + filename
-                            if os.path.isdir(src_path):
-                                continue
-                            if not os.path.isfile(dst_path):
-                                #dst_path += "," + str(num)
-                                shutil.move(src_path, dst_path)
-                shutil.rmtree(syncDir + "/" + session)
-                
+        # Merge the testcases of all sessions into SESSION000 and drop the other
+        # sessions. The job manifest is the index of what SESSION000 already
+        # holds, so only testcases that are new since the last run are touched.
+        jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+        syncDir = jobDir + "/afl-out/"
+        store = BlobStore(self._config['orthrus']['directory'] + "/blobs")
+        if not os.path.isfile(jobDir + "/manifest"):
+            store.ingest_tree(jobDir, jobDir + "/manifest")
+        manifest = blobstore.Manifest(jobDir + "/manifest")
+
+        new = []
+        for session in sorted(os.listdir(syncDir)):
+            if os.path.isfile(syncDir + session):
+                os.remove(syncDir + session)
+                continue
+            if not os.path.isdir(syncDir + session):
+                continue
+            for directory in sorted(os.listdir(syncDir + session)):
+                category = directory.split('.')[0]
+                if category not in self.COMPACT_DIRS or (category == 'queue' and directory != 'queue'):
+                    continue
+                srcDir = syncDir + session + "/" + directory + "/"
+                dstDir = syncDir + "SESSION000/" + category + "/"
+                if session == "SESSION000" and directory == category:
+                    # Entries afl-fuzz wrote into the master session itself
+                    new.extend("afl-out/SESSION000/" + category + "/" + fn for fn in os.listdir(srcDir)
+                               if not fn.startswith('.') and
+                               "afl-out/SESSION000/" + category + "/" + fn not in manifest.entries)
+                    continue
+                if not os.path.isdir(dstDir):
+                    os.makedirs(dstDir)
+                for filename in os.listdir(srcDir):
+                    relpath = "afl-out/SESSION000/" + category + "/" + filename
+                    if filename.startswith('.') or relpath in manifest.entries:
+                        continue
+                    # Linking never replaces a testcase the index does not know about yet
+                    try:
+                        os.link(srcDir + filename, dstDir + filename)
+                    except OSError as e:
+                        if e.errno != errno.EEXIST:
+                            raise
+                        continue
+                    new.append(relpath)
+                if directory != category:
+                    shutil.rmtree(srcDir)
+            if session != "SESSION000":
+                shutil.rmtree(syncDir + session)
+                for relpath in [r for r in manifest.entries if r.startswith("afl-out/" + session + "/")]:
+                    manifest.remove(relpath)
+
+        # Testcases shared with other sessions, jobs and archives are stored once
+        store.ingest_paths(jobDir, sorted(set(new)), manifest)
+        manifest.flush()
+
         return True
-                
+
     def _start_afl_coverage(self, jobId):
         job_config = ConfigParser.ConfigParser()
         job_config.read(self._config['orthrus']['directory'] + "/jobs/jobs.conf")
@@ -555,39 +691,217 @@ class OrthrusStart(object):
         job_config = ConfigParser.ConfigParser()
         job_config.read(self._config['orthrus']['directory'] + "/jobs/jobs.conf")
         
+        if self._args.all:
+            return self.start_all(job_config)
         if self._args.job_id:
             jobId = self._args.job_id
-            total_cores = int(util.getnproc())
             if jobId in job_config.sections():
-                if len(os.listdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/")) > 0:
-                    util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Tidy fuzzer sync dir... ")
+                return self.start_job(jobId)
 
-                    if not self.compact_sync_dir(jobId):
-                        util.color_print(util.bcolors.FAIL, "failed")
-                        return False
-                    util.color_print(util.bcolors.OKGREEN, "done")
-                    
-                    if self._args.minimize:
-                        if not util.minimize_sync_dir(self._config, jobId):
-                            return False
-
-                if self._args.coverage:
-                    util.color_print(util.bcolors.OKGREEN, "\t\t[+] Start afl-cov for Job [" + jobId +"]... ")
-                    if not self._start_afl_coverage(jobId):
-                        util.color_print(util.bcolors.FAIL + "failed" + util.bcolors.ENDC + "\n")
-                        return False
-                    util.color_print(util.bcolors.OKGREEN, "done")
-                
-                util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Start Fuzzers for Job [" + jobId +"]... ")
-                if not self._start_fuzzers(jobId, total_cores):
-                    try:
-                        subprocess.call("pkill -9 afl-fuzz", shell=True, stderr=subprocess.STDOUT)
-                    except OSError, subprocess.CalledProcessError:
-                        return False
+        return True
+
+    def start_job(self, jobId, sched=None, count=None):
+        # Starting a job by hand or once its pause ran out ends the pause, and
+        # a stop by hand
+        for name in [self.PAUSED_FILE, self.STOPPED_FILE]:
+            if os.path.isfile(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/" + name):
+                os.remove(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/" + name)
+        # The sync dir must not be touched while the job fuzzes
+        if fuzzer.running(self._config['orthrus']['directory'] + "/jobs/" + jobId):
+            util.color_print(util.bcolors.FAIL, "\t\t[-] Job [" + jobId + "] is already running")
+            return False
+        if len(os.listdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/")) > 0:
+            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Tidy fuzzer sync dir... ")
+
+            # Compaction and resuming drop plot_data files, their samples are kept
+            hist = history.History(self._config['orthrus']['directory'] + "/jobs/" + jobId)
+            hist.update()
+            hist.close()
+
+            if not self.compact_sync_dir(jobId):
+                util.color_print(util.bcolors.FAIL, "failed")
+                return False
+            util.color_print(util.bcolors.OKGREEN, "done")
+
+            if self._args.minimize:
+                if not util.minimize_sync_dir(self._config, jobId):
                     return False
 
+        if self._args.coverage:
+            util.color_print(util.bcolors.OKGREEN, "\t\t[+] Start afl-cov for Job [" + jobId +"]... ")
+            if not self._start_afl_coverage(jobId):
+                util.color_print(util.bcolors.FAIL + "failed" + util.bcolors.ENDC + "\n")
+                return False
+            util.color_print(util.bcolors.OKGREEN, "done")
+
+        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Start Fuzzers for Job [" + jobId +"]... ")
+        if not self._start_fuzzers(jobId, sched, count):
+            fuzzer.stop(self._config['orthrus']['directory'] + "/jobs/" + jobId)
+            return False
+
+        if self._args.nodes:
+            return self.start_nodes(jobId)
         return True
-    
+
+    def start_nodes(self, jobId):
+        for node in distributed.nodes_from_config(self._config):
+            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Start Fuzzers for Job [" + jobId +
+                                        "] on node '" + node.name + "'... ")
+            if not distributed.deploy(node, self._config['orthrus']['directory'], jobId):
+                util.color_print(util.bcolors.FAIL, "failed to deploy")
+                return False
+            if not node.run_orthrus(['start', '-j', jobId], self._config['orthrus']['directory'] +
+                                    "/logs/node-" + node.name + ".log"):
+                util.color_print(util.bcolors.FAIL, "failed")
+                return False
+            util.color_print(util.bcolors.OKGREEN, "done")
+        return True
+
+    def policy_weights(self, job_config, jobIds, policy):
+        # Share of the cores each job gets relative to the others
+        if policy == 'priority':
+            return dict((jobId, job_config.getint(jobId, "priority") if job_config.has_option(jobId, "priority")
+                         else 1) for jobId in jobIds)
+        if policy == 'rate':
+            # Plateaued jobs keep a small share so they are still fuzzed
+            window = self._config.get('scheduler', {}).get('rate_window', 900)
+            now = int(time.time())
+            return dict((jobId, 1.0 + stats.path_rate(self._config['orthrus']['directory'] + "/jobs/" + jobId +
+                                                      "/afl-out", window, now)) for jobId in jobIds)
+        return dict((jobId, 1) for jobId in jobIds)
+
+    def start_all(self, job_config):
+        policy = self._args.policy or self._config.get('scheduler', {}).get('policy', 'equal')
+        jobIds = [jobId for jobId in job_config.sections()
+                  if not fuzzer.running(self._config['orthrus']['directory'] + "/jobs/" + jobId) and
+                  not self.paused(jobId)]
+        if not self.start_jobs(job_config, jobIds, policy):
+            return False
+
+        if self._args.rebalance or self._args.rotate:
+            interval = self._config.get('scheduler', {}).get('rebalance_interval', 300)
+            util.color_print(util.bcolors.OKGREEN, "\t\t[+] Rebalancing every " + str(interval) +
+                             " seconds, press Ctrl-C to stop rebalancing")
+            try:
+                while True:
+                    time.sleep(interval)
+                    if self._args.rotate and not self.rotate(job_config, policy):
+                        return False
+                    self.rebalance(job_config, policy)
+            except KeyboardInterrupt:
+                pass
+        return True
+
+    def start_jobs(self, job_config, jobIds, policy):
+        # Start the jobs on the free cores, shared by the policy. With more jobs
+        # than free cores the jobs left without a core wait for rotation.
+        if not jobIds:
+            return True
+        sched = self._scheduler()
+        free = len(sched.free_cpus())
+        shares = scheduler.apportion(free, jobIds, self.policy_weights(job_config, jobIds, policy))
+        util.color_print(util.bcolors.OKGREEN, "\t\t[+] Sharing " + str(free) + " free cores between " +
+                         str(len(jobIds)) + " jobs (" + policy + " policy)")
+        waiting = [jobId for jobId in jobIds if not shares[jobId]]
+        if waiting:
+            util.color_print(util.bcolors.WARNING, "\t\t[-] No free core for jobs [" + ", ".join(waiting) +
+                             "], they wait for rotation")
+        for jobId in [jobId for jobId in jobIds if shares[jobId]]:
+            util.color_print(util.bcolors.OKBLUE, "\t[+] Job [" + jobId + "] for target '" +
+                             job_config.get(jobId, "target") + "', " + str(shares[jobId]) + " cores")
+            if not self.start_job(jobId, sched, shares[jobId]):
+                return False
+        return True
+
+    # File in the job dir holding the time a plateaued job was paused
+    PAUSED_FILE = "paused"
+    # File in the job dir of a job stopped by hand, rotation leaves it alone
+    STOPPED_FILE = "stopped"
+
+    def paused_since(self, jobId):
+        # Time a job was paused at, 0 if it is not paused
+        path = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/" + self.PAUSED_FILE
+        if not os.path.isfile(path):
+            return 0
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+
+    def paused(self, jobId):
+        # Whether a job is paused and its pause did not run out yet
+        since = self.paused_since(jobId)
+        return since and time.time() - since < self._config.get('scheduler', {}).get('pause_time', 86400)
+
+    def pause_job(self, jobId):
+        # Stop a job, minimize its corpus for the next run and hand its cores back
+        jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+        fuzzer.stop(jobDir)
+        with open(jobDir + "/" + self.PAUSED_FILE, 'w') as f:
+            f.write(str(int(time.time())))
+        if not self.compact_sync_dir(jobId) or not util.minimize_sync_dir(self._config, jobId):
+            util.color_print(util.bcolors.WARNING, "\t\t[-] Corpus of job [" + jobId + "] not minimized")
+
+    def rotate(self, job_config, policy):
+        # Pause the jobs that did not find a new path for plateau_window seconds
+        # and start the jobs that wait for cores: jobs never started, then the
+        # jobs paused the longest ago once their pause ran out. Jobs stopped by
+        # hand wait for a start by hand.
+        window = self._config.get('scheduler', {}).get('plateau_window', 21600)
+        now = int(time.time())
+        cache = stats.StatsCache()
+        waiting = []
+        for jobId in job_config.sections():
+            jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+            if not fuzzer.running(jobDir):
+                if not self.paused(jobId) and not os.path.isfile(jobDir + "/" + self.STOPPED_FILE):
+                    waiting.append(jobId)
+                continue
+            summary = stats.job_stats(jobDir, cache)
+            last_path = summary['last_path'] or now - summary['run_time']
+            if summary['run_time'] >= window and now - last_path >= window:
+                util.color_print(util.bcolors.OKGREEN, "\t\t[+] Job [" + jobId + "] found no new path for " +
+                                 OrthrusShow.format_duration(now - last_path) + ", pausing it")
+                self.pause_job(jobId)
+
+        waiting.sort(key=lambda jobId: (self.paused_since(jobId), jobId))
+        return self.start_jobs(job_config, waiting, policy)
+
+    def rebalance(self, job_config, policy):
+        # Redistribute the cores of the running jobs and the free cores by the
+        # policy. Supervisors reload their plan and only restart the instances
+        # that changed.
+        jobDirs = dict((jobId, self._config['orthrus']['directory'] + "/jobs/" + jobId)
+                       for jobId in job_config.sections())
+        states = dict((jobId, fuzzer.read_state(jobDirs[jobId])) for jobId in jobDirs
+                      if fuzzer.running(jobDirs[jobId]))
+        if not states:
+            return False
+        owned = dict((jobId, [int(inst['cpu']) for inst in state['instances'].values() if inst.get('cpu')])
+                     for jobId, state in states.items())
+
+        pool = set(self._scheduler().free_cpus())
+        for cpus in owned.values():
+            pool.update(cpus)
+        base = self._scheduler()
+        sched = scheduler.Scheduler(base.weights, base.busy_threshold, pool=pool)
+        shares = scheduler.apportion(len(pool), sorted(states), self.policy_weights(job_config, states, policy))
+
+        # Shrinking jobs go first, growing jobs then take the cores they release
+        changed = False
+        for jobId in sorted(states, key=lambda j: (shares[j] - len(owned[j]), j)):
+            if not shares[jobId]:
+                # Only a job without cores of its own gets none, it keeps its plan
+                continue
+            instances = fuzzer.make_plan(self._config['orthrus']['directory'], jobId, sched, shares[jobId],
+                                         owned[jobId])
+            if [vars(i) for i in instances] == [vars(i) for i in fuzzer.read_plan(jobDirs[jobId])]:
+                continue
+            fuzzer.write_plan(jobDirs[jobId], instances)
+            fuzzer.reload(jobDirs[jobId])
+            changed = True
+            util.color_print(util.bcolors.OKGREEN, "\t\t[+] Job [" + jobId + "] now runs " +
+                             str(len(instances)) + " instances")
+        return changed
+
 class OrthrusStop(object):
     
     def __init__(self, args, config):
@@ -595,27 +909,89 @@ class OrthrusStop(object):
         self._config = config
     
     def run(self):
-        util.color_print_singleline(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Stopping fuzzing jobs...")
-        cmd = ["pkill", "-9", "afl-fuzz"]
-        rv = util.run_cmd(" ".join(cmd))
-        util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "done")
+        util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Stopping fuzzing jobs")
+        job_config = ConfigParser.ConfigParser()
+        job_config.read(self._config['orthrus']['directory'] + "/jobs/jobs.conf")
+
+        if self._args.job_id:
+            if self._args.job_id not in job_config.sections():
+                util.color_print(util.bcolors.FAIL, "\t\t[-] Job [" + self._args.job_id + "] not found")
+                return False
+            jobIds = [self._args.job_id]
+        else:
+            jobIds = job_config.sections()
+
+        for jobId in jobIds:
+            jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+            # Jobs that ran, or were named, are left alone by start --rotate.
+            # A named job is marked even when it is paused.
+            if self._args.job_id or fuzzer.read_state(jobDir):
+                with open(jobDir + "/" + OrthrusStart.STOPPED_FILE, 'w') as f:
+                    f.write(str(int(time.time())))
+            if self._args.nodes:
+                for node in distributed.nodes_from_config(self._config):
+                    util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Stopping fuzzers of job [" + jobId +
+                                                "] on node '" + node.name + "'... ")
+                    if node.run_orthrus(['stop', '-j', jobId]):
+                        util.color_print(util.bcolors.OKGREEN, "done")
+                    else:
+                        util.color_print(util.bcolors.FAIL, "failed")
+            if not fuzzer.read_state(jobDir):
+                continue
+            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Stopping fuzzers of job [" + jobId + "]... ")
+            fuzzer.stop(jobDir)
+            util.color_print(util.bcolors.OKGREEN, "done")
+
+            if self._args.minimize:
+                if not util.minimize_sync_dir(self._config, jobId):
+                    return False
+        return True
+
+class OrthrusSync(object):
+
+    def __init__(self, args, config):
+        self._args = args
+        self._config = config
+
+    def sync(self, syncer):
+        for node in syncer.nodes:
+            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Sync with node '" + node.name + "'... ")
+            result = syncer.sync_node(node)
+            if result is None:
+                util.color_print(util.bcolors.FAIL, "failed")
+                continue
+            summary = syncer.pull_stats(node)
+            util.color_print(util.bcolors.OKGREEN, "pulled " + str(result[0]) + ", pushed " + str(result[1]))
+            util.color_print(util.bcolors.OKBLUE, "\t\t\t" + str(summary['fuzzers']) + " fuzzers, " +
+                             "{:.0f}".format(summary['execs_per_sec']) + " execs/s, " +
+                             str(summary['paths_total']) + " paths, " + str(summary['unique_crashes']) +
+                             " crashes, " + str(summary['unique_hangs']) + " hangs")
+
+    def run(self):
+        util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Synchronizing job [" +
+                         self._args.job_id + "] with its nodes")
+        job_config = ConfigParser.ConfigParser()
+        job_config.read(self._config['orthrus']['directory'] + "/jobs/jobs.conf")
+        if self._args.job_id not in job_config.sections():
+            util.color_print(util.bcolors.FAIL, "\t\t[-] Job [" + self._args.job_id + "] not found")
+            return False
+        nodes = distributed.nodes_from_config(self._config)
+        if not nodes:
+            util.color_print(util.bcolors.FAIL, "\t\t[-] No nodes configured")
+            return False
+
+        syncer = distributed.Syncer(self._config['orthrus']['directory'], self._args.job_id, nodes)
+        self.sync(syncer)
+        if self._args.interval:
+            util.color_print(util.bcolors.OKGREEN, "\t\t[+] Syncing every " + str(self._args.interval) +
+                             " seconds, press Ctrl-C to stop")
+            try:
+                while True:
+                    time.sleep(self._args.interval)
+                    self.sync(syncer)
+            except KeyboardInterrupt:
+                pass
         return True
-        #
-        #
-        # p = subprocess.Popen("afl-multikill", shell=True, stdout=subprocess.PIPE)
-        # p.wait()
-        # output = p.communicate()[0]
-        # util.color_print("\t" + "\n".join(output.splitlines()[2:]))
-        #
-        # job_config = ConfigParser.ConfigParser()
-        # job_config.read(self._config['orthrus']['directory'] + "/jobs/jobs.conf")
-        #
-        # if self._args.minimize:
-        #     pass
-        #
-        # util.color_print("\n")
-        #
-        # return True
 
 class OrthrusResume(object):
     pass
@@ -641,93 +1017,237 @@ class OrthrusShow(object):
                                     "cov/web/lcov-web-final"
                 if os.path.exists(cov_web_indexhtml):
                     webbrowser.open_new_tab(cov_web_indexhtml)
+        elif self._args.watch:
+            return self.watch(job_config, self._args.watch)
+        elif self._args.crashes or self._args.hangs:
+            return self.crashes(job_config)
+        elif self._args.format == 'json':
+            cache = stats.StatsCache(self._config['orthrus']['directory'] + "/conf/stats.cache")
+            triaged = stats.triaged_crashes(self._config['orthrus']['directory'])
+            jobs = []
+            for jobId in job_config.sections():
+                jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+                summary = stats.job_stats(jobDir, cache)
+                jobs.append({'id': jobId, 'target': job_config.get(jobId, "target"),
+                             'params': job_config.get(jobId, "params"), 'running': fuzzer.running(jobDir),
+                             'triaged_crashes': triaged.get(jobId, 0), 'stats': summary})
+            cache.save()
+            sys.stdout.write(json.dumps({'time': int(time.time()), 'jobs': jobs}, indent=2, separators=(',', ': '),
+                                        sort_keys=True) + "\n")
         else:
             util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "Status of jobs:")
-            
+            cache = stats.StatsCache(self._config['orthrus']['directory'] + "/conf/stats.cache")
+            triaged = stats.triaged_crashes(self._config['orthrus']['directory'])
+
             for jobId in job_config.sections():
-                syncDir = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/"
-                output = subprocess.check_output(["afl-whatsup", "-s", syncDir])
-                output = output[output.find("==\n\n") + 4:]
-                
+                jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+                summary = stats.job_stats(jobDir, cache)
+
                 util.color_print(util.bcolors.OKBLUE, "\tJob [" + jobId + "] " + "for target '" + job_config.get(jobId, "target") + "':")
-                for line in output.splitlines():
+                for line in self.status_lines(summary):
                     util.color_print(util.bcolors.OKBLUE, "\t" + line)
-                triaged_unique = 0
-                if os.path.exists(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique/"):
-                    triaged_unique = len(os.listdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique/"))
-                util.color_print(util.bcolors.OKBLUE, "\t     Triaged crashes : " + str(triaged_unique) + " available")
-                
+                util.color_print(util.bcolors.OKBLUE, "\t     Triaged crashes : " +
+                                 str(triaged.get(jobId, 0)) + " available")
+            cache.save()
+
         return True
 
-class OrthrusTriage(object):
-    
-    def __init__(self, args, config):
-        self._args = args
-        self._config = config
+    def crashes(self, job_config):
+        # Crash or hang buckets of the crash database, optionally only the new
+        # ones or the ones shared between jobs
+        since = int(time.time()) - self._args.since if self._args.since else 0
+        category = crashdb.HANG if self._args.hangs else crashdb.CRASH
+        buckets = []
+        if os.path.isfile(self._config['orthrus']['directory'] + "/" + crashdb.DB_FILE):
+            db = crashdb.CrashDB(self._config['orthrus']['directory'])
+            buckets = db.query(since, job_config.sections(), self._args.cross_job, category)
+            db.close()
+        if self._args.format == 'json':
+            sys.stdout.write(json.dumps({'time': int(time.time()), 'buckets': buckets}, indent=2,
+                                        separators=(',', ': '), sort_keys=True) + "\n")
+            return True
+
+        util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, ("Hang" if self._args.hangs else "Crash") +
+                         " buckets:")
+        if not buckets:
+            util.color_print(util.bcolors.OKBLUE, "\tNone")
+        for bucket in buckets:
+            util.color_print(util.bcolors.OKBLUE, "\t[" + bucket['bucket'][:12] + "] " + bucket['kind'] + " in " +
+                             (" < ".join(bucket['frames']) or "unknown frames"))
+            util.color_print(util.bcolors.OKBLUE, "\t\tJobs " + ", ".join(bucket['jobs']) + ", " +
+                             str(bucket['crashes']) + (" hangs" if self._args.hangs else " crashes") +
+                             ", first found " +
+                             time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(bucket['first_seen'])) +
+                             ", last found " +
+                             time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(bucket['last_seen'])))
+            util.color_print(util.bcolors.OKBLUE, "\t\tReproducer " + bucket['reproducer'] +
+                             (", minimized " + bucket['minimized'] if bucket['minimized'] else ""))
+        return True
 
-    def tidy(self, crash_dir):
+    def watch(self, job_config, interval):
+        # Status of all jobs with their recent history, redrawn in place until
+        # interrupted. Stats and history are only read where files changed.
+        cache = stats.StatsCache()
+        histories = {}
+        try:
+            while True:
+                lines = [util.bcolors.BOLD + util.bcolors.HEADER + "Status of jobs at " +
+                         time.strftime("%Y-%m-%d %H:%M:%S") + ", press Ctrl-C to quit" + util.bcolors.ENDC]
+                now = int(time.time())
+                for jobId in job_config.sections():
+                    jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+                    if jobId not in histories:
+                        histories[jobId] = history.History(jobDir)
+                    histories[jobId].update()
+                    summary = stats.job_stats(jobDir, cache)
+                    color = util.bcolors.OKGREEN if summary['alive'] else util.bcolors.OKBLUE
+                    lines.append(color + "\tJob [" + jobId + "] for target '" + job_config.get(jobId, "target") +
+                                 "':" + util.bcolors.ENDC)
+                    lines.extend("\t" + line for line in self.status_lines(summary))
+                    hour = histories[jobId].series(now - 3600)
+                    day = histories[jobId].series(now - 86400)
+                    if hour:
+                        lines.append("\t  Speed (last hour) : " + history.sparkline([s[1] for s in hour]) +
+                                     " {:.0f} execs/sec".format(hour[-1][1]))
+                    if day:
+                        lines.append("\t  Paths (last day)  : " + history.sparkline([s[2] for s in day]) +
+                                     " " + str(day[-1][2]))
+                # Clear the screen and draw from the top left corner
+                sys.stdout.write("\033[H\033[2J" + "\n".join(lines) + "\n")
+                sys.stdout.flush()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for hist in histories.values():
+                hist.close()
+        return True
 
-        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Tidying crash dir...")
+    @staticmethod
+    def format_duration(seconds):
+        days, seconds = divmod(max(int(seconds), 0), 86400)
+        hours, seconds = divmod(seconds, 3600)
+        if days:
+            return "{} days, {} hours".format(days, hours)
+        if hours:
+            return "{} hours, {} minutes".format(hours, seconds / 60)
+        return "{} minutes, {} seconds".format(seconds / 60, seconds % 60)
+
+    def status_lines(self, summary):
+        # The summary in the layout of afl-whatsup -s
+        fuzzers = str(summary['alive'])
+        if summary['dead'] or summary['remote']:
+            fuzzers += " ({} dead, {} remote)".format(summary['dead'], summary['remote'])
+        lines = ["       Fuzzers alive : " + fuzzers]
+        if not summary['fuzzers']:
+            return lines
+        lines += ["      Total run time : " + self.format_duration(summary['run_time']),
+                  "         Total execs : " + str(summary['execs_done'] / 1000000) + " million",
+                  "    Cumulative speed : " + "{:.0f}".format(summary['execs_per_sec']) + " execs/sec",
+                  "       Pending paths : " + str(summary['pending_favs']) + " faves, " +
+                  str(summary['pending_total']) + " total",
+                  "         Total paths : " + str(summary['paths_total']),
+                  "       Crashes found : " + str(summary['unique_crashes']) + " locally unique",
+                  "         Hangs found : " + str(summary['unique_hangs']) + " locally unique"]
+        if summary['stability'] is not None:
+            lines.append("           Stability : " + "{:.2f}%".format(summary['stability']))
+        if summary['last_path']:
+            lines.append("           Last path : " + self.format_duration(time.time() - summary['last_path']) +
+                         " ago")
+        return lines
+
+class OrthrusMetrics(object):
 
-        dest = crash_dir + "/.scripts"
-        if not os.path.exists(dest):
-            os.mkdir(dest)
+    def __init__(self, args, config):
+        self._args = args
+        self._config = config
 
-        for script in glob.glob(crash_dir + "/gdb_script*"):
-            shutil.move(script, dest)
+    def render(self):
+        # jobs.conf is read on every scrape so added and removed jobs show up
+        job_config = ConfigParser.ConfigParser()
+        job_config.read(self._config['orthrus']['directory'] + "/jobs/jobs.conf")
+        return metrics.render(self._config['orthrus']['directory'], job_config, self.cache)
 
-        util.color_print(util.bcolors.OKGREEN, "done!")
+    def run(self):
+        metrics_config = self._config.get('metrics', {})
+        address = self._args.address or metrics_config.get('address', '127.0.0.1')
+        port = self._args.port or metrics_config.get('port', 9642)
+        self.cache = stats.StatsCache()
+        util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Serving metrics on http://" + address +
+                         ":" + str(port) + "/metrics, press Ctrl-C to stop")
+        try:
+            metrics.serve(address, port, self.render)
+        except KeyboardInterrupt:
+            pass
         return True
 
-    def triage(self, jobId, inst, indir=None, outdir=None):
-        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Collect and verify '{}' mode crashes... "
-                                    .format(inst))
-
-        env = os.environ.copy()
-        asan_flag = {}
-        asan_flag['ASAN_OPTIONS'] = "abort_on_error=1:disable_coredump=1:symbolize=1"
-        env.update(asan_flag)
-
-        if inst is 'harden':
-            prefix = 'HARDEN'
-        elif inst is 'asan' or inst is 'all':
-            prefix = 'ASAN'
-            inst = 'asan'
-        else:
-            util.color_print(util.bcolors.FAIL, "failed!")
-            return False
-
-        if not indir:
-            syncDir = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out/"
-        else:
-            syncDir = indir
-
-        if not outdir:
-            dirname = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/exploitable/" + \
-                      "{}/".format(prefix) + "crashes"
-            if not os.path.exists(dirname):
-                os.makedirs(dirname)
-            triage_outDir = dirname
-        else:
-            triage_outDir = outdir
-
-        logfile = self._config['orthrus']['directory'] + "/logs/" + "afl-{}_dbg.log".format(inst)
-        launch = self._config['orthrus']['directory'] + "/binaries/{}-dbg/bin/".format(inst) + \
-                 self.job_config.get(jobId, "target") + " " + \
-                 self.job_config.get(jobId, "params").replace("&", "\&")
-        cmd = " ".join(["afl-collect", "-r", "-j", util.getnproc(), "-e gdb_script",
-                        syncDir, triage_outDir, "--", launch])
-        rv = util.run_cmd("ulimit -c 0; " + cmd, env, logfile)
-        if not rv:
-            util.color_print(util.bcolors.FAIL, "failed")
-            return rv
+class OrthrusTriage(object):
+    
+    def __init__(self, args, config):
+        self._args = args
+        self._config = config
 
+    def triager(self, jobId, shim=None):
+        # The ASAN build explains most crashes by itself, the harden build is
+        # tried for crashes it does not reproduce
+        binaries = []
+        for variant in ["asan", "harden"]:
+            binary = self._config['orthrus']['directory'] + "/binaries/{}-dbg/bin/".format(variant) + \
+                     self.job_config.get(jobId, "target")
+            if os.path.exists(self._config['orthrus']['directory'] + "/binaries/afl-" + variant) and \
+                    os.path.isfile(binary):
+                binaries.append((variant, binary))
+        return triagetool.Triager(binaries, self.job_config.get(jobId, "params"), shim=shim)
+
+    def hang_triager(self, jobId, triager):
+        # Hangs are judged against the timeout afl-fuzz used for the job
+        job_conf = ConfigParser.ConfigParser()
+        job_conf.read([self._config['orthrus']['directory'] + "/jobs/" + jobId + "/" + name
+                       for name in ["asan-job.conf", "harden-job.conf"]])
+        timeout = None
+        if job_conf.has_option("afl.ctrl", "timeout"):
+            timeout = job_conf.get("afl.ctrl", "timeout")
+        return hangs.HangTriager(triager, hangs.parse_timeout(timeout))
+
+    def rerun(self, db, jobId, uniqueDir, category):
+        # Triage from scratch, the previous samples are kept aside
+        jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+        if os.path.exists(jobDir + "/" + uniqueDir + "/"):
+            shutil.move(jobDir + "/" + uniqueDir + "/", jobDir + "/" + uniqueDir + "." +
+                        time.strftime("%Y-%m-%d-%H:%M:%S"))
+        db.forget(jobId, category)
+
+    def minimize(self, db, triagers, frame_cache):
+        # Minimize the reproducer of every bucket that has none yet, one bucket
+        # per core. The minimized input is kept next to the original one.
+        buckets = db.unminimized(sorted(triagers))
+        if not buckets:
+            return
+        util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Minimizing the reproducers of " +
+                                    str(len(buckets)) + " buckets... ")
+
+        def minimize(bucket):
+            jobId, bucketId, variant, reproducer = bucket
+            tmin = minimizer.CrashMinimizer(triagers[jobId], variant, bucketId, frame_cache)
+            try:
+                return tmin.minimize(self._config['orthrus']['directory'] + "/" + reproducer)
+            finally:
+                tmin.close()
+
+        minimized = 0
+        for (jobId, bucketId, variant, reproducer), data in \
+                zip(buckets, util.parallel_map(minimize, buckets, int(util.getnproc()))):
+            if data is None:
+                db.set_minimized(jobId, bucketId, "")
+                continue
+            with open(self._config['orthrus']['directory'] + "/" + reproducer + ".min", 'wb') as f:
+                f.write(data)
+            db.set_minimized(jobId, bucketId, reproducer + ".min")
+            minimized += 1
         util.color_print(util.bcolors.OKGREEN, "done")
-
-        if not self.tidy(triage_outDir):
-            return False
-
-        return True
+        if minimized < len(buckets):
+            util.color_print(util.bcolors.WARNING, "\t\t[-] " + str(len(buckets) - minimized) +
+                             " reproducers no longer crash in their bucket, they are not tried again")
 
     def run(self):
         self.job_config = ConfigParser.ConfigParser()
@@ -738,44 +1258,94 @@ class OrthrusTriage(object):
             jobIds.append(self._args.job_id)
         else:
             jobIds = self.job_config.sections()
-            
-        for jobId in jobIds:
-            util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Triaging crashes for job [" \
-                             + jobId + "]")
-            
-            if not os.path.exists(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique/"):
-                os.mkdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique/")
-            else:
-                util.color_print(util.bcolors.OKGREEN, "[?] Rerun triaging? [y/n]...: ")
-
-                if 'y' not in sys.stdin.readline()[0]:
-                    return True
-
-                shutil.move(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique/",
-                            self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique." \
-                            + time.strftime("%Y-%m-%d-%H:%M:%S"))
-                os.mkdir(self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique/")
-                 
-            if os.path.exists(self._config['orthrus']['directory'] + "/binaries/afl-harden"):
-                if not self.triage(jobId, 'harden'):
-                    return False
-            if os.path.exists(self._config['orthrus']['directory'] + "/binaries/afl-asan"):
-                if not self.triage(jobId, 'asan'):
-                    return False
-
-            #Second pass over all exploitable crashes
-            exp_path = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/exploitable/"
-            uniq_path = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/unique/"
-            if os.path.exists(exp_path):
-                if not self.triage(jobId, 'all', exp_path, uniq_path):
-                    return False
 
-            triaged_crashes = os.listdir(uniq_path)
-            util.color_print(util.bcolors.OKGREEN, "\t\t[+] Triaged " + str(len(triaged_crashes)) + \
-                             " crashes. See {}".format(uniq_path))
-            if not triaged_crashes:
-                util.color_print(util.bcolors.OKBLUE, "\t\t[+] Nothing to do")
-                return True
+        # Crashes, or hangs, of all jobs that are not in the crash database
+        # yet, triaged by one pool of workers
+        if self._args.hangs:
+            testcases, uniqueDir, category = "hangs", "unique_hangs", crashdb.HANG
+        else:
+            testcases, uniqueDir, category = "crashes", "unique", crashdb.CRASH
+        db = crashdb.CrashDB(self._config['orthrus']['directory'])
+        # Crashes are replayed through a forkserver, the debug builds are no
+        # afl builds so the forkserver is preloaded into them. Hangs are timed
+        # and sampled with an exec of their own.
+        shim = None
+        if not self._args.hangs:
+            shim = replay.build_shim(self._config['orthrus']['directory'] + "/conf")
+            if not shim:
+                util.color_print(util.bcolors.WARNING, "[-] No C compiler for the replay forkserver, every crash "
+                                                       "is run with an exec of its own")
+        triagers = {}
+        replayers = {}
+        pending = []
+        for jobId in jobIds:
+            util.color_print(util.bcolors.BOLD + util.bcolors.HEADER, "[+] Collecting " + testcases +
+                             " for job [" + jobId + "]")
+            jobDir = self._config['orthrus']['directory'] + "/jobs/" + jobId
+            if self._args.rerun:
+                self.rerun(db, jobId, uniqueDir, category)
+            if not os.path.exists(jobDir + "/" + uniqueDir + "/"):
+                os.mkdir(jobDir + "/" + uniqueDir + "/")
+
+            triagers[jobId] = self.triager(jobId, shim)
+            if not triagers[jobId].binaries:
+                util.color_print(util.bcolors.FAIL, "\t\t[-] No debug binaries to triage with")
+                db.close()
+                return False
+            replayers[jobId] = self.hang_triager(jobId, triagers[jobId]) if self._args.hangs else triagers[jobId]
+            known = db.known(jobId, category)
+            crashes = triagetool.crash_files(jobDir + "/afl-out", testcases)
+            new = {}
+            for path, digest in zip(crashes, util.parallel_map(util.hash_file, crashes, int(util.getnproc()))):
+                if digest not in known and digest not in new:
+                    new[digest] = path
+            pending.extend((jobId, digest, path) for digest, path in sorted(new.items(), key=lambda n: n[1]))
+            util.color_print(util.bcolors.OKGREEN, "\t\t[+] " + str(len(crashes)) + " " + testcases + ", " +
+                             str(len(new)) + " not triaged yet")
+
+        def triage(task):
+            jobId, digest, path = task
+            return replayers[jobId].triage(path)
+
+        # Hangs are told from slow runs by the time they take, replaying them
+        # on every core would cause the very load that is filtered out
+        workers = int(util.getnproc())
+        if self._args.hangs:
+            workers = max(workers // 2, 1)
+        if pending:
+            util.color_print_singleline(util.bcolors.OKGREEN, "\t\t[+] Triaging " + str(len(pending)) + " " +
+                                        testcases + "... ")
+            results = util.parallel_map(triage, pending, workers)
+            util.color_print(util.bcolors.OKGREEN, "done")
+        else:
+            results = []
+
+        # Stacks are symbolized after all crashes ran, by one symbolizer and
+        # through the frame cache of the workspace. The first crash of a
+        # bucket is kept as its reproducer.
+        symbols = symbolizer.Symbolizer(
+            symbolizer.FrameCache(self._config['orthrus']['directory'] + "/conf/frames.cache"))
+        for (jobId, digest, path), report in zip(pending, results):
+            result = triagers[jobId].bucket(report, symbols)
+            if db.add(jobId, digest, path, result, int(os.path.getmtime(path)), category):
+                sample = "jobs/" + jobId + "/" + uniqueDir + "/" + triagetool.bucket_name(result)
+                shutil.copy(path, self._config['orthrus']['directory'] + "/" + sample)
+                db.set_reproducer(jobId, result['bucket'], sample, category)
+
+        symbols.close()
+        if symbols.resolved:
+            util.color_print(util.bcolors.OKGREEN, "\t\t[+] Symbolized " + str(symbols.resolved) + " new frames")
+        if self._args.minimize and not self._args.hangs:
+            self.minimize(db, triagers, symbols.cache)
+            symbols.cache.save()
+        for triager in triagers.values():
+            triager.close()
+        counts = db.bucket_counts(category)
+        db.close()
+        for jobId in jobIds:
+            uniq_path = self._config['orthrus']['directory'] + "/jobs/" + jobId + "/" + uniqueDir + "/"
+            util.color_print(util.bcolors.OKGREEN, "\t\t[+] Job [" + jobId + "]: " + str(counts.get(jobId, 0)) +
+                             " unique " + testcases + ". See {}".format(uniq_path))
 
         return True
 
@@ -0,0 +1,164 @@
+import os
+import errno
+import threading
+import orthrusutils as util
+
+# Directories of an afl sync dir and job holding testcases
+TESTCASE_DIRS = ['queue', 'crashes', 'hangs', 'afl-in']
+
+
+class BlobStore(object):
+
+    # Content addressed store of testcases shared by all jobs of a workspace.
+    # Every distinct content is kept once under <directory>/<xx>/<sha1>, files
+    # in jobs, sessions and archives are hard links to their blob. Testcases
+    # are never written in place (afl-fuzz unlinks before rewriting a queue
+    # entry), which is what makes sharing the inode safe.
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _link_blob(self, src, digest):
+        # Only for files the workspace owns, the blob shares their inode
+        blob = self.path(digest)
+        self._makedirs(blob)
+        try:
+            os.link(src, blob)
+            return True
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return False
+
+    def _makedirs(self, blob):
+        if not os.path.isdir(os.path.dirname(blob)):
+            try:
+                os.makedirs(os.path.dirname(blob))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def add(self, src, digest=None):
+        # Store the content of a file that lives outside the workspace. Its
+        # owner may still edit it in place, so the blob gets an inode of its
+        # own, a reflink or a copy.
+        digest = digest or util.hash_file(src)
+        blob = self.path(digest)
+        if not os.path.exists(blob):
+            self._makedirs(blob)
+            tmp = "{}.tmp.{}.{}".format(blob, os.getpid(), threading.current_thread().ident)
+            util.reflink_or_copy(src, tmp)
+            os.rename(tmp, blob)
+        return digest
+
+    def checkout(self, digest, dst):
+        os.link(self.path(digest), dst)
+
+    def ingest(self, path):
+        # Turn a file in the workspace into a hard link to its blob
+        digest = util.hash_file(path)
+        if self._link_blob(path, digest):
+            return digest
+        blob = self.path(digest)
+        if os.path.samefile(blob, path):
+            return digest
+        tmp = path + ".blob"
+        os.link(blob, tmp)
+        os.rename(tmp, path)
+        return digest
+
+    def ingest_tree(self, root, manifest=None):
+        # Ingest every testcase below root. Files whose inode did not change
+        # since they were recorded in the manifest are not hashed again.
+        manifest = Manifest(manifest)
+        pending = []
+        present = set()
+        for dirpath, dirnames, filenames in os.walk(root):
+            # afl-fuzz keeps per-entry state in queue/.state
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            if os.path.basename(dirpath).split('.')[0] not in TESTCASE_DIRS:
+                continue
+            for fn in filenames:
+                fpath = os.path.join(dirpath, fn)
+                if fn == 'README.txt' or os.path.islink(fpath) or not os.path.isfile(fpath):
+                    continue
+                relpath = os.path.relpath(fpath, root)
+                present.add(relpath)
+                known = manifest.entries.get(relpath)
+                if not known or known[0] != os.stat(fpath).st_ino:
+                    pending.append(relpath)
+
+        for relpath in set(manifest.entries) - present:
+            manifest.remove(relpath)
+        self.ingest_paths(root, pending, manifest)
+        manifest.flush()
+        return manifest.entries
+
+    def ingest_paths(self, root, relpaths, manifest):
+        digests = util.parallel_map(lambda relpath: self.ingest(os.path.join(root, relpath)), relpaths,
+                                    int(util.getnproc()))
+        for relpath, digest in zip(relpaths, digests):
+            manifest.add(relpath, os.stat(os.path.join(root, relpath)).st_ino, digest)
+
+    def gc(self):
+        # Drop blobs no job, session or archive links to anymore
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return removed
+        for prefix in os.listdir(self.directory):
+            for digest in os.listdir(os.path.join(self.directory, prefix)):
+                blob = os.path.join(self.directory, prefix, digest)
+                if os.stat(blob).st_nlink == 1:
+                    os.remove(blob)
+                    removed += 1
+        return removed
+
+
+class Manifest(object):
+
+    # Append-only log of the testcases of a job: "<sha1> <inode> <path>" adds
+    # or replaces a testcase, "- <path>" drops it. Later records win. The log
+    # is rewritten once stale records outnumber the live ones.
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._records = 0
+        self._pending = []
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    self._records += 1
+                    if line.startswith('- '):
+                        self.entries.pop(line[2:].rstrip('\n'), None)
+                        continue
+                    digest, inode, relpath = line.rstrip('\n').split(' ', 2)
+                    self.entries[relpath] = (int(inode), digest)
+
+    def add(self, relpath, inode, digest):
+        self.entries[relpath] = (inode, digest)
+        self._pending.append("{} {} {}\n".format(digest, inode, relpath))
+
+    def remove(self, relpath):
+        if self.entries.pop(relpath, None):
+            self._pending.append("- {}\n".format(relpath))
+
+    def flush(self):
+        if not self.path:
+            return
+        self._records += len(self._pending)
+        if self._records > 2 * len(self.entries) + 1024:
+            self.rewrite()
+        elif self._pending:
+            with open(self.path, 'a') as f:
+                f.writelines(self._pending)
+        self._pending = []
+
+    def rewrite(self):
+        with open(self.path + ".tmp", 'w') as f:
+            for relpath, (inode, digest) in sorted(self.entries.items()):
+                f.write("{} {} {}\n".format(digest, inode, relpath))
+        os.rename(self.path + ".tmp", self.path)
+        self._records = len(self.entries)
+        self._pending = []
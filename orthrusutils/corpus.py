@@ -0,0 +1,143 @@
+import os
+import shutil
+import shlex
+import tempfile
+import subprocess
+from array import array
+import orthrusutils as util
+
+# Without -r afl-showmap reports the class of each hit count, 1 to 8 for
+# 1, 2, 3, 4-7, 8-15, 16-31, 32-127 and 128+ hits. Every (edge, class) pair
+# is one tuple of the coverage map.
+HIT_CLASSES = 8
+MAP_SIZE = 65536
+TUPLES = MAP_SIZE * HIT_CLASSES
+# Format of the cached traces, cached traces of another format are dropped
+TRACE_FORMAT = 2
+NO_INPUT = 0xffffffff
+
+
+class TraceCache(object):
+
+    # Tuples covered by each input, stored as packed arrays under the hash of
+    # the input. Traces are only valid for one build of the target, the cache
+    # is flushed when the target binary changes.
+    def __init__(self, directory, target):
+        self.directory = directory
+        st = os.stat(target)
+        stamp = "{} {} {} {}".format(os.path.abspath(target), st.st_size, st.st_mtime, TRACE_FORMAT)
+        stamp_file = os.path.join(directory, "target")
+        if os.path.isdir(directory):
+            current = None
+            if os.path.isfile(stamp_file):
+                with open(stamp_file) as f:
+                    current = f.read()
+            if current != stamp:
+                shutil.rmtree(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            with open(stamp_file, 'w') as f:
+                f.write(stamp)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def __contains__(self, digest):
+        return os.path.isfile(self._path(digest))
+
+    def load(self, digest):
+        trace = array('I')
+        with open(self._path(digest), 'rb') as f:
+            trace.fromstring(f.read())
+        return trace
+
+    def store(self, digest, trace):
+        tmp = self._path(digest) + ".tmp"
+        with open(tmp, 'wb') as f:
+            trace.tofile(f)
+        os.rename(tmp, self._path(digest))
+
+
+def parse_showmap(path):
+    # Tuples of an afl-showmap output file
+    trace = array('I')
+    with open(path) as f:
+        for line in f:
+            edge, hits = line.split(':')
+            trace.append(int(edge) * HIT_CLASSES + min(max(int(hits), 1), HIT_CLASSES) - 1)
+    return trace
+
+
+class CorpusMinimizer(object):
+
+    # afl-cmin style corpus minimization. Every input is traced once with
+    # afl-showmap, then the smallest input for each tuple is kept, rarest
+    # tuples first, until every tuple seen in the corpus is covered.
+    def __init__(self, target, params, cache_dir, mem_limit, timeout, env=None):
+        self.target = target
+        self.params = shlex.split(params)
+        self.cache = TraceCache(cache_dir, target)
+        self.mem_limit = mem_limit
+        self.timeout = timeout
+        self.env = env
+
+    def trace(self, path):
+        # Timeouts and crashes do not belong into the corpus and get an empty trace
+        fd, out = tempfile.mkstemp(prefix="orthrus-trace-")
+        os.close(fd)
+        try:
+            if "@@" in self.params:
+                args = [path if p == "@@" else p for p in self.params]
+                stdin = open(os.devnull)
+            else:
+                args = self.params
+                stdin = open(path, 'rb')
+            with stdin:
+                cmd = ["afl-showmap", "-q", "-o", out, "-m", str(self.mem_limit), "-t", str(self.timeout), "--",
+                       self.target] + args
+                with open(os.devnull, 'w') as devnull:
+                    ret = subprocess.call(cmd, stdin=stdin, stdout=devnull, stderr=devnull, env=self.env)
+
+            if ret != 0:
+                return array('I')
+            return parse_showmap(out)
+        finally:
+            os.remove(out)
+
+    def _trace_cached(self, item):
+        digest, path = item
+        trace = self.trace(path)
+        self.cache.store(digest, trace)
+        return trace
+
+    def minimize(self, inputs, workers=None):
+        # inputs maps content hash to path, returns the hashes of the minimized corpus
+        digests = sorted(inputs, key=lambda d: (os.path.getsize(inputs[d]), d))
+        pending = [(d, inputs[d]) for d in digests if d not in self.cache]
+        self.traced = len(pending)
+        util.parallel_map(self._trace_cached, pending, workers or int(util.getnproc()))
+
+        # Smallest input and number of inputs per tuple. Inputs are visited
+        # smallest first, so the first input seen for a tuple is the best.
+        best = array('I', [NO_INPUT]) * TUPLES
+        counts = array('I', [0]) * TUPLES
+        traces = []
+        for idx, digest in enumerate(digests):
+            trace = self.cache.load(digest)
+            traces.append(trace)
+            for key in trace:
+                if best[key] == NO_INPUT:
+                    best[key] = idx
+                counts[key] += 1
+
+        covered = bytearray(TUPLES)
+        selected = set()
+        for key in sorted((k for k in xrange(TUPLES) if counts[k]), key=lambda k: counts[k]):
+            if covered[key]:
+                continue
+            idx = best[key]
+            selected.add(idx)
+            for k in traces[idx]:
+                covered[k] = 1
+
+        return [digests[idx] for idx in sorted(selected)]
@@ -0,0 +1,185 @@
+import os
+import mmap
+import struct
+import threading
+
+ELF_MAGIC = '\x7fELF'
+
+ET_EXEC = 2
+ET_DYN = 3
+
+PT_INTERP = 3
+
+SHT_SYMTAB = 2
+SHT_NOTE = 7
+SHT_DYNSYM = 11
+
+NT_GNU_BUILD_ID = 3
+
+# Layouts of the ELF header (after e_ident), section header and program
+# header for ELFCLASS32 and ELFCLASS64
+_EHDR = {1: 'HHIIIIIHHHHHH', 2: 'HHIQQQIHHHHHH'}
+_SHDR = {1: 'IIIIIIIIII', 2: 'IIQQQQIIQQ'}
+_PHDR = {1: 'IIIIIIII', 2: 'IIQQQQQQ'}
+
+
+class ElfError(Exception):
+    pass
+
+
+class ElfFile(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self._file.close()
+            raise ElfError("{}: empty or unmappable file".format(path))
+
+        if self._map[:4] != ELF_MAGIC or ord(self._map[4]) not in _EHDR or ord(self._map[5]) not in (1, 2):
+            self.close()
+            raise ElfError("{}: not an ELF file".format(path))
+
+        self.elfclass = ord(self._map[4])
+        self._endian = '<' if ord(self._map[5]) == 1 else '>'
+        try:
+            header = self._unpack(_EHDR[self.elfclass], 16)
+        except ElfError:
+            self.close()
+            raise
+        self.e_type = header[0]
+        self._phoff, self._shoff = header[4], header[5]
+        self._phentsize, self._phnum = header[8], header[9]
+        self._shentsize, self._shnum, self._shstrndx = header[10], header[11], header[12]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _unpack(self, fmt, offset):
+        fmt = self._endian + fmt
+        end = offset + struct.calcsize(fmt)
+        if end > len(self._map):
+            raise ElfError("{}: truncated file".format(self.path))
+        return struct.unpack(fmt, self._map[offset:end])
+
+    def sections(self):
+        # (sh_type, sh_offset, sh_size, sh_link) of every section
+        for idx in range(self._shnum):
+            sh = self._unpack(_SHDR[self.elfclass], self._shoff + idx * self._shentsize)
+            yield sh[1], sh[4], sh[5], sh[6]
+
+    def segment_types(self):
+        for idx in range(self._phnum):
+            yield self._unpack(_PHDR[self.elfclass], self._phoff + idx * self._phentsize)[0]
+
+    def _string_tables(self):
+        # String tables holding the names of .symtab and .dynsym entries
+        sections = list(self.sections())
+        for sh_type, _, _, sh_link in sections:
+            if sh_type in (SHT_SYMTAB, SHT_DYNSYM) and sh_link < len(sections):
+                yield sections[sh_link][1], sections[sh_link][2]
+
+    def find_symbols(self, names):
+        # Subset of names that occur in a symbol name. The symbol string tables
+        # are searched in place, individual symbols are never decoded.
+        found = set()
+        for offset, size in self._string_tables():
+            for name in names:
+                if name not in found and self._map.find(name, offset, offset + size) != -1:
+                    found.add(name)
+        return found
+
+    def build_id(self):
+        # Hex GNU build-id of the binary, None if it was linked without one
+        for sh_type, offset, size, _ in self.sections():
+            if sh_type != SHT_NOTE:
+                continue
+            end = offset + size
+            while offset + 12 <= end:
+                namesz, descsz, n_type = self._unpack('III', offset)
+                name = offset + 12
+                desc = name + (namesz + 3) // 4 * 4
+                if n_type == NT_GNU_BUILD_ID and self._map[name:name + namesz] == 'GNU\0':
+                    return self._map[desc:desc + descsz].encode('hex')
+                offset = desc + (descsz + 3) // 4 * 4
+        return None
+
+
+def read_type(path):
+    # e_type from the first 64 bytes of a file, None if it is no ELF file
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(64)
+    except IOError:
+        return None
+    if len(header) < 18 or header[:4] != ELF_MAGIC or header[5] not in ('\x01', '\x02'):
+        return None
+    return struct.unpack(('<' if header[5] == '\x01' else '>') + 'H', header[16:18])[0]
+
+
+def is_executable(path):
+    # Executables and position independent executables, but no shared libraries
+    e_type = read_type(path)
+    if e_type == ET_EXEC:
+        return True
+    if e_type != ET_DYN:
+        return False
+    try:
+        with ElfFile(path) as elf:
+            return PT_INTERP in elf.segment_types()
+    except ElfError:
+        return False
+
+
+class SymbolCache(object):
+
+    # Symbol lookups of binaries, persisted in a file and keyed by device,
+    # inode, mtime and size so unchanged binaries are never read again.
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        # Variants built in parallel share the cache
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) == 4:
+                        self._entries[fields[0]] = (fields[1], fields[2], set(filter(None, fields[3].split(','))))
+
+    @staticmethod
+    def _identity(path):
+        st = os.stat(path)
+        return "{}:{}:{}:{}".format(st.st_dev, st.st_ino, st.st_mtime, st.st_size)
+
+    def find_symbols(self, path, names):
+        path = os.path.abspath(path)
+        identity = self._identity(path)
+        names_key = ",".join(sorted(names))
+        entry = self._entries.get(path)
+        if not entry or entry[0] != identity or entry[1] != names_key:
+            with ElfFile(path) as elf:
+                entry = (identity, names_key, elf.find_symbols(names))
+            with self._lock:
+                self._entries[path] = entry
+        return entry[2]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            tmp = "{}.tmp.{}".format(self.path, os.getpid())
+            with open(tmp, 'w') as f:
+                for path, (identity, names, found) in sorted(self._entries.items()):
+                    if os.path.exists(path):
+                        f.write("{}\t{}\t{}\t{}\n".format(path, identity, names, ",".join(sorted(found))))
+            os.rename(tmp, self.path)
@@ -3,7 +3,18 @@ import subprocess
 import os
 import shutil
 import ConfigParser
-from argparse import ArgumentParser
+import tarfile
+import tempfile
+import fcntl
+import fnmatch
+import hashlib
+import threading
+from Queue import Queue, Empty
+from argparse import ArgumentParser, ArgumentTypeError
+from distutils.spawn import find_executable
+import elf
+import corpus
+import blobstore
 
 CREATE_HELP = """Create an orthrus workspace"""
 ADD_HELP = """Add a fuzzing job"""
@@ -15,6 +26,22 @@ TRIAGE_HELP = """Triage crash samples"""
 DATABASE_HELP = """Joern database operations"""
 CLEAN_HELP = """Clean up the workspace"""
 DESTROY_HELP = """Destroy the orthrus workspace"""
+METRICS_HELP = """Serve job metrics in the Prometheus text format"""
+SYNC_HELP = """Exchange testcases and stats of a job with its worker nodes"""
+
+# ioctl cloning a file's extents into another file on btrfs, xfs and friends
+FICLONE = 0x40049409
+
+# Parallel decompressors by the magic bytes of the compressed stream
+DECOMPRESSORS = [('\x1f\x8b', ['pigz']),
+                 ('BZh', ['lbzip2', 'pbzip2']),
+                 ('\xfd7zXZ\x00', ['xz -T0'])]
+
+# Sources copied into a build tree by the last sync_tree
+SYNC_MANIFEST = ".orthrus-sources"
+
+# Directories never searched for built binaries
+SCAN_SKIP_DIRS = ['.git', '.svn', '.hg']
 
 class bcolors:
     HEADER = '\033[95m'
@@ -36,7 +63,7 @@ def color_print_singleline(color, msg):
     sys.stdout.write(color + msg + bcolors.ENDC)
     sys.stdout.flush()
 
-def run_cmd(command, env=None, logfile=None):
+def run_cmd(command, env=None, logfile=None, cwd=None):
     if not logfile:
         logfile = os.devnull
 
@@ -45,7 +72,7 @@ def run_cmd(command, env=None, logfile=None):
 
     logfh = open(logfile, 'w')
     proc = subprocess.Popen(command, shell=True, executable='/bin/bash',
-                            env=env, stdout=logfh, stderr=subprocess.STDOUT)
+                            env=env, stdout=logfh, stderr=subprocess.STDOUT, cwd=cwd)
     ret = proc.wait()
     logfh.close()
 
@@ -54,28 +81,232 @@ def run_cmd(command, env=None, logfile=None):
     return True
 
 
-def return_elf_binaries():
-    # Search everywhere in working dir except in .orthrus
-    command = "find -type f -executable -not -path \"./.orthrus/*\"" \
-              " -exec file -i '{}' \; | grep 'x-executable; charset=binary' | cut -d':' -f1"
-    output = subprocess.check_output(command, shell=True)
-    return filter(None, output.split("\n"))
-
-def copy_binaries(dest):
+def parallel_map(func, items, workers=None):
+    # Apply func to every item with a bounded pool of worker threads.
+    # Results are returned in the order of items.
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    if not workers or workers > len(items):
+        workers = len(items)
+
+    queue = Queue()
+    for idx, item in enumerate(items):
+        queue.put((idx, item))
+
+    def worker():
+        while True:
+            try:
+                idx, item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[idx] = func(item)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return results
+
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(src, dst):
+    # Cheapest way to give dst the content of src: a hard link, then a
+    # reflink, then a plain copy. Returns the method that was used.
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError:
+        pass
+    return reflink_or_copy(src, dst)
+
+def reflink_or_copy(src, dst):
+    # A copy of src that shares no inode with it, a reflink where the file
+    # system supports them. Returns the method that was used.
+    try:
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        return 'reflink'
+    except (IOError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+
+    shutil.copy(src, dst)
+    return 'copy'
+
+def open_tar_stream(path):
+    # Open a tar archive for a single sequential pass. Compressed archives are
+    # piped through a parallel decompressor when one is installed. Returns the
+    # archive and the decompressor process, if any.
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    for prefix, tools in DECOMPRESSORS:
+        if not magic.startswith(prefix):
+            continue
+        for tool in tools:
+            if find_executable(tool.split()[0]):
+                # stderr goes to a file, a full pipe would stall the stream
+                errors = tempfile.TemporaryFile()
+                proc = subprocess.Popen(tool.split() + ['-dc', path], stdout=subprocess.PIPE, stderr=errors)
+                proc.errors = errors
+                return tarfile.open(fileobj=proc.stdout, mode='r|'), proc
+    return tarfile.open(path, 'r|*'), None
+
+def close_tar_stream(tar, decompressor):
+    # Close an archive of open_tar_stream. A truncated or corrupt compressed
+    # stream only shows in the decompressor, which raises a ReadError.
+    tar.close()
+    if not decompressor:
+        return
+    # Padding after the end of the archive is read too, the decompressor
+    # would fail on a closed pipe otherwise
+    while decompressor.stdout.read(65536):
+        pass
+    decompressor.stdout.close()
+    returncode = decompressor.wait()
+    decompressor.errors.seek(0)
+    errors = decompressor.errors.read().strip()
+    decompressor.errors.close()
+    if returncode != 0 or errors:
+        raise tarfile.ReadError(errors or "decompressor exited with {}".format(returncode))
+
+def is_elf(path):
+    with open(path, 'rb') as f:
+        return f.read(4) == '\x7fELF'
+
+def _ignored(name, ignore):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
+
+def source_files(srcdir, ignore=(), prebuilt=()):
+    # Relative paths of the files making up a source tree. Ignored names, files
+    # generated from a .in template and binaries linked in-tree are skipped.
+    # ELF files matching prebuilt are libraries that come with the sources.
+    for dirpath, dirnames, filenames in os.walk(srcdir):
+        dirnames[:] = sorted(d for d in dirnames if not _ignored(d, ignore))
+        for fn in sorted(filenames):
+            fpath = os.path.join(dirpath, fn)
+            if _ignored(fn, ignore) or not os.path.isfile(fpath):
+                continue
+            if fn != "configure" and fn + ".in" in filenames:
+                continue
+            if is_elf(fpath) and not _ignored(fn, prebuilt):
+                continue
+            yield os.path.relpath(fpath, srcdir)
+
+def sync_tree(src, dest, ignore=(), prebuilt=()):
+    # Bring dest up to date with the source files of src for out-of-tree builds.
+    # Unchanged files keep their timestamps so make only rebuilds what changed.
+    # Files deleted from src are deleted from dest too, the files of the last
+    # sync are listed in dest. Returns the number of files changed.
+    copied = 0
+    relpaths = list(source_files(src, ignore, prebuilt))
+    manifest = os.path.join(dest, SYNC_MANIFEST)
+    if os.path.isfile(manifest):
+        with open(manifest) as f:
+            for relpath in set(f.read().splitlines()) - set(relpaths):
+                if os.path.isfile(os.path.join(dest, relpath)):
+                    os.remove(os.path.join(dest, relpath))
+                    copied += 1
+    for relpath in relpaths:
+        src_path = os.path.join(src, relpath)
+        dst_path = os.path.join(dest, relpath)
+        if os.path.isfile(dst_path):
+            src_stat = os.stat(src_path)
+            dst_stat = os.stat(dst_path)
+            if src_stat.st_size == dst_stat.st_size and int(src_stat.st_mtime) == int(dst_stat.st_mtime):
+                continue
+        elif not os.path.isdir(os.path.dirname(dst_path)):
+            os.makedirs(os.path.dirname(dst_path))
+        shutil.copy2(src_path, dst_path)
+        copied += 1
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+    with open(manifest + ".tmp", 'w') as f:
+        f.writelines(relpath + "\n" for relpath in relpaths)
+    os.rename(manifest + ".tmp", manifest)
+    return copied
+
+def tree_size(path):
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for fn in filenames:
+            fpath = os.path.join(dirpath, fn)
+            if not os.path.islink(fpath):
+                size += os.path.getsize(fpath)
+    return size
+
+def return_elf_binaries(searchdir='.', skipdirs=SCAN_SKIP_DIRS, memo=None):
+    # ELF executables below searchdir. The workspace at the top of searchdir
+    # and all directories named in skipdirs are left out.
+    if memo is not None and searchdir in memo:
+        return memo[searchdir]
+
+    workspace = os.path.join(searchdir, ".orthrus")
+    binaries = []
+    for dirpath, dirnames, filenames in os.walk(searchdir):
+        dirnames[:] = sorted(d for d in dirnames if d not in skipdirs and
+                             os.path.join(dirpath, d) != workspace)
+        for fn in sorted(filenames):
+            fpath = os.path.join(dirpath, fn)
+            if os.path.isfile(fpath) and os.access(fpath, os.X_OK) and elf.is_executable(fpath):
+                binaries.append(fpath)
+
+    if memo is not None:
+        memo[searchdir] = binaries
+    return binaries
+
+def copy_binaries(dest, searchdir='.', update=False, skipdirs=SCAN_SKIP_DIRS, memo=None):
     # Create bin dir if it doesn't exist
     if not os.path.isdir(dest):
         os.makedirs(dest)
 
-    binaries = return_elf_binaries()
-    # Overwriting existing binaries is fine
+    binaries = return_elf_binaries(searchdir, skipdirs, memo)
+    seen = set()
+    # First binary found for a name wins. In update mode only binaries that
+    # changed since the last copy are copied again.
     for f in binaries:
-        if not os.path.isfile(dest + os.path.basename(f)):
-            shutil.copy(f, dest)
-
+        name = os.path.basename(f)
+        if name in seen:
+            continue
+        seen.add(name)
+        dst_path = dest + name
+        if os.path.isfile(dst_path):
+            if not update:
+                continue
+            src_stat = os.stat(f)
+            dst_stat = os.stat(dst_path)
+            if src_stat.st_size == dst_stat.st_size and int(src_stat.st_mtime) == int(dst_stat.st_mtime):
+                continue
+        shutil.copy2(f, dst_path)
+
+
+def parse_duration(value):
+    # Seconds of "90", "30m", "12h" or "1d"
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    try:
+        if value and value[-1] in units:
+            return int(value[:-1]) * units[value[-1]]
+        return int(value)
+    except ValueError:
+        raise ArgumentTypeError("invalid duration '" + value + "'")
 
 def parse_cmdline(description, args, createfunc=None, addfunc=None, removefunc=None,
                   startfunc=None, stopfunc=None, showfunc=None, triagefunc=None,
-                  databasefunc=None, cleanfunc=None, destroyfunc=None):
+                  databasefunc=None, cleanfunc=None, destroyfunc=None, syncfunc=None,
+                  metricsfunc=None):
     argParser = ArgumentParser(description)
 
     argParser.add_argument('-v', '--verbose',
@@ -102,6 +333,24 @@ def parse_cmdline(description, args, createfunc=None, addfunc=None, removefunc=N
     create_parser.add_argument('-d', '--configure-flags', nargs='?',
                                type=str, default="",
                                help='Additional flags for configuring the source')
+    create_parser.add_argument('-p', '--parallel',
+                               action='store_true',
+                               help="""Build variants concurrently, each in its own copy of the source tree""",
+                               default=False)
+    create_parser.add_argument('-w', '--workers', nargs='?',
+                               type=int, default=0,
+                               help='Number of variants built at once in parallel mode (default: all)')
+    create_parser.add_argument('-J', '--make-jobs', nargs='?',
+                               type=int, default=0,
+                               help='Number of make jobs, shared by all variants in parallel mode (default: nproc)')
+    create_parser.add_argument('-u', '--update',
+                               action='store_true',
+                               help="""Incrementally rebuild the variants of an existing workspace""",
+                               default=False)
+    create_parser.add_argument('--no-cache',
+                               action='store_true',
+                               help="""Always rebuild, do not use the build cache""",
+                               default=False)
     # create_parser.add_argument('-f', '--cflags', nargs='?',
     #                         type = str, default="",
     #                         help = 'Additional flags to go into CFLAGS for compilation')
@@ -124,6 +373,8 @@ def parse_cmdline(description, args, createfunc=None, addfunc=None, removefunc=N
     add_parser.add_argument('-s', '--sample', nargs='?',
                             type=str, default="",
                             help='A single file or directory of afl testcases for fuzzing')
+    add_parser.add_argument('-p', '--priority', type=int, default=1,
+                            help='Share of the cores the job gets with start --all --policy=priority')
     add_parser.set_defaults(func=addfunc)
 
     # Command 'remove'
@@ -146,16 +397,54 @@ def parse_cmdline(description, args, createfunc=None, addfunc=None, removefunc=N
                               action='store_true',
                               help="""Minimize corpus before start""",
                               default=False)
+    start_parser.add_argument('-a', '--all',
+                              action='store_true',
+                              help="""Start all configured jobs that are not running yet""",
+                              default=False)
+    start_parser.add_argument('--policy', choices=['equal', 'priority', 'rate'],
+                              help="""How start --all shares the cores between jobs: equally, by job
+                              priority or by the rate of new paths found recently""",
+                              default=None)
+    start_parser.add_argument('-r', '--rebalance',
+                              action='store_true',
+                              help="""Keep running and periodically rebalance the cores between the
+                              running jobs""",
+                              default=False)
+    start_parser.add_argument('--rotate',
+                              action='store_true',
+                              help="""Like --rebalance, and pause jobs that stopped finding new paths to
+                              give their cores to waiting jobs""",
+                              default=False)
+    start_parser.add_argument('-n', '--nodes',
+                              action='store_true',
+                              help="""Also start the job on the worker nodes of the configuration""",
+                              default=False)
     start_parser.set_defaults(func=startfunc)
 
     # Command 'stop'
     stop_parser = subparsers.add_parser('stop', help=STOP_HELP)
+    stop_parser.add_argument('-j', '--job-id', nargs='?',
+                             type=str, default="",
+                             help='Job Id for the job which should be stopped, all jobs if omitted')
+    stop_parser.add_argument('-n', '--nodes',
+                             action='store_true',
+                             help="""Also stop the jobs on the worker nodes of the configuration""",
+                             default=False)
     stop_parser.add_argument('-m', '--minimize',
                              action='store_true',
                              help="""Minimize corpus on stop""",
                              default=False)
     stop_parser.set_defaults(func=stopfunc)
 
+    # Command 'sync'
+    sync_parser = subparsers.add_parser('sync', help=SYNC_HELP)
+    sync_parser.add_argument('-j', '--job-id', required=True,
+                             type=str,
+                             help='Job Id for the job which should be synchronized')
+    sync_parser.add_argument('-i', '--interval', type=int, default=0,
+                             help='Keep syncing every INTERVAL seconds')
+    sync_parser.set_defaults(func=syncfunc)
+
     # Command 'show'
     show_parser = subparsers.add_parser('show', help=SHOW_HELP)
     show_parser.add_argument('-j', '--jobs',
@@ -166,13 +455,56 @@ def parse_cmdline(description, args, createfunc=None, addfunc=None, removefunc=N
                              action='store_true',
                              help="""Show coverage of job""",
                              default=False)
+    show_parser.add_argument('--format', choices=['text', 'json'],
+                             help="""Output format of the job status""",
+                             default='text')
+    show_parser.add_argument('-w', '--watch', nargs='?', type=int, const=5, default=0,
+                             help="""Redraw the job status with its history every WATCH seconds (5 by
+                             default) until interrupted""")
+    show_parser.add_argument('-c', '--crashes',
+                             action='store_true',
+                             help="""Show the crash buckets found by triage""",
+                             default=False)
+    show_parser.add_argument('--hangs',
+                             action='store_true',
+                             help="""Show the hang buckets found by triage --hangs""",
+                             default=False)
+    show_parser.add_argument('--since', type=parse_duration, default=0,
+                             help="""With --crashes or --hangs, only buckets first found in the last SINCE (e.g.
+                             3600, 30m, 12h or 1d)""")
+    show_parser.add_argument('--cross-job',
+                             action='store_true',
+                             help="""With --crashes or --hangs, only buckets found by more than one job""",
+                             default=False)
     show_parser.set_defaults(func=showfunc)
 
+    # Command 'metrics'
+    metrics_parser = subparsers.add_parser('metrics', help=METRICS_HELP)
+    metrics_parser.add_argument('-a', '--address', type=str, default=None,
+                                help='Address to listen on, 127.0.0.1 by default')
+    metrics_parser.add_argument('-p', '--port', type=int, default=None,
+                                help='Port to listen on, 9642 by default')
+    metrics_parser.set_defaults(func=metricsfunc)
+
     # Command 'triage'
     triage_parser = subparsers.add_parser('triage', help=TRIAGE_HELP)
     triage_parser.add_argument('-j', '--job-id', nargs='?',
                                type=str, default="",
                                help="""Job Id for the job which should be triaged""")
+    triage_parser.add_argument('--rerun',
+                               action='store_true',
+                               help="""Triage all crashes again, the previous results are moved aside""",
+                               default=False)
+    triage_parser.add_argument('--hangs',
+                               action='store_true',
+                               help="""Triage the hangs instead of the crashes, grouping real hangs by the
+                               stack they are stuck in""",
+                               default=False)
+    triage_parser.add_argument('-m', '--minimize',
+                               action='store_true',
+                               help="""Minimize the reproducer of every crash bucket, keeping inputs that
+                               still crash in the same bucket""",
+                               default=False)
     triage_parser.set_defaults(func=triagefunc)
 
     # Command 'database'
@@ -228,6 +560,8 @@ def parse_config(configfile=None):
 
     config['orthrus'] = {}
     config['orthrus']['directory'] = configparser.get("orthrus", "directory")
+    config['orthrus']['scan_skip_dirs'] = get_option(configparser, "orthrus", "scan_skip_dirs",
+                                                     " ".join(SCAN_SKIP_DIRS)).split()
 
     # config['joern'] = {}
     # config['joern']['joern_path'] = os.path.abspath(os.path.expanduser((configparser.get("joern", "joern_path"))))
@@ -246,59 +580,122 @@ def parse_config(configfile=None):
     config['afl-cov']['afl_cov_path'] = os.path.abspath(
         os.path.expanduser((configparser.get("afl-cov", "afl_cov_path"))))
 
+    config['cache'] = {}
+    config['cache']['directory'] = os.path.abspath(os.path.expanduser(
+        get_option(configparser, "cache", "directory", "~/.orthrus/cache")))
+    config['cache']['max_size'] = int(get_option(configparser, "cache", "max_size", "4096")) * 1024 * 1024
+    if configparser.has_option("cache", "ignore"):
+        config['cache']['ignore'] = configparser.get("cache", "ignore").split()
+
+    # Worker nodes, one [node.<name>] section each
+    config['nodes'] = {}
+    for section in configparser.sections():
+        if section.startswith("node."):
+            config['nodes'][section[len("node."):]] = dict(configparser.items(section))
+
+    config['metrics'] = {}
+    config['metrics']['address'] = get_option(configparser, "metrics", "address", "127.0.0.1")
+    config['metrics']['port'] = int(get_option(configparser, "metrics", "port", "9642"))
+
+    config['scheduler'] = {}
+    config['scheduler']['busy_threshold'] = float(get_option(configparser, "scheduler", "busy_threshold", "50"))
+    config['scheduler']['policy'] = get_option(configparser, "scheduler", "policy", "equal")
+    config['scheduler']['rebalance_interval'] = int(get_option(configparser, "scheduler", "rebalance_interval", "300"))
+    config['scheduler']['rate_window'] = int(get_option(configparser, "scheduler", "rate_window", "900"))
+    config['scheduler']['plateau_window'] = int(get_option(configparser, "scheduler", "plateau_window", "21600"))
+    config['scheduler']['pause_time'] = int(get_option(configparser, "scheduler", "pause_time", "86400"))
+    config['scheduler']['weights'] = {'harden': int(get_option(configparser, "scheduler", "harden_weight", "3")),
+                                      'asan': int(get_option(configparser, "scheduler", "asan_weight", "1"))}
+
     return config
 
+def get_option(configparser, section, option, default):
+    if configparser.has_option(section, option):
+        return configparser.get(section, option)
+    return default
+
 def minimize_sync_dir(config, jobId):
     color_print(bcolors.OKGREEN, "\t\t[+] Minimizing corpus for job [" + jobId + "]...")
 
     job_config = ConfigParser.ConfigParser()
     job_config.read(config['orthrus']['directory'] + "/jobs/jobs.conf")
-    export = {}
-    export['PYTHONUNBUFFERED'] = "1"
-    env = os.environ.copy()
-    env.update(export)
+    jobDir = config['orthrus']['directory'] + "/jobs/" + jobId
+    syncDir = jobDir + "/afl-out/"
     isasan = False
 
     if os.path.exists(config['orthrus']['directory'] + "/binaries/afl-harden"):
-        launch = config['orthrus']['directory'] + "/binaries/afl-harden/bin/" + job_config.get(jobId,
-                                                                                                     "target") + " " + job_config.get(
-            jobId, "params").replace("&", "\&")
+        target = config['orthrus']['directory'] + "/binaries/afl-harden/bin/" + job_config.get(jobId, "target")
     else:
         isasan = True
-        launch = config['orthrus']['directory'] + "/binaries/afl-asan/bin/" + job_config.get(jobId,
-                                                                                                   "target") + " " + job_config.get(
-            jobId, "params")
+        target = config['orthrus']['directory'] + "/binaries/afl-asan/bin/" + job_config.get(jobId, "target")
 
     if isasan and is64bit():
         mem_limit = 30000000
     else:
         mem_limit = 800
-    cmin = " ".join(
-        ["afl-minimize", "-c", config['orthrus']['directory'] + "/jobs/" + jobId + "/collect", "--cmin",
-         "--cmin-mem-limit={}".format(mem_limit), "--cmin-timeout=5000", "--dry-run",
-         config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out", "--", "'" + launch + "'"])
-    p = subprocess.Popen(cmin, bufsize=0, shell=True, executable='/bin/bash', env=env, stdout=subprocess.PIPE)
-    for line in p.stdout:
-        if "[*]" in line or "[!]" in line:
-            color_print(bcolors.OKGREEN, "\t\t\t" + line)
-
-    reseed_cmd = " ".join(
-        ["afl-minimize", "-c", config['orthrus']['directory'] + "/jobs/" + jobId + "/collect.cmin",
-         "--reseed", config['orthrus']['directory'] + "/jobs/" + jobId + "/afl-out", "--",
-         "'" + launch + "'"])
-    p = subprocess.Popen(reseed_cmd, bufsize=0, shell=True, executable='/bin/bash', env=env, stdout=subprocess.PIPE)
-    for line in p.stdout:
-        if "[*]" in line or "[!]" in line:
-            color_print(bcolors.OKGREEN, "\t\t\t" + line)
-
-    if os.path.exists(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect"):
-        shutil.rmtree(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect")
-    if os.path.exists(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect.cmin"):
-        shutil.rmtree(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect.cmin")
-    if os.path.exists(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect.cmin.crashes"):
-        shutil.rmtree(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect.cmin.crashes")
-    if os.path.exists(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect.cmin.hangs"):
-        shutil.rmtree(config['orthrus']['directory'] + "/jobs/" + jobId + "/collect.cmin.hangs")
+
+    # Every distinct queue entry of all sessions, reusing the hashes of the
+    # job manifest for files that did not change
+    manifest = blobstore.Manifest(jobDir + "/manifest")
+    sessions = []
+    paths = []
+    for session in sorted(os.listdir(syncDir)):
+        queue = syncDir + session + "/queue/"
+        if not os.path.isdir(queue):
+            continue
+        sessions.append(session)
+        paths.extend(queue + fn for fn in sorted(os.listdir(queue)) if os.path.isfile(queue + fn))
+
+    def digest(path):
+        known = manifest.entries.get(os.path.relpath(path, jobDir))
+        if known and known[0] == os.stat(path).st_ino:
+            return known[1]
+        return hash_file(path)
+
+    inputs = {}
+    for path, sha1 in zip(paths, parallel_map(digest, paths, int(getnproc()))):
+        inputs.setdefault(sha1, path)
+
+    if not inputs:
+        color_print(bcolors.OKGREEN, "\t\t\t[*] No queue entries to minimize")
+        return True
+
+    minimizer = corpus.CorpusMinimizer(target, job_config.get(jobId, "params"), jobDir + "/traces",
+                                       mem_limit, 5000)
+    selected = minimizer.minimize(inputs)
+    color_print(bcolors.OKGREEN, "\t\t\t[*] {} queue entries, {} unique, {} traced, {} kept"
+                .format(len(paths), len(inputs), minimizer.traced, len(selected)))
+
+    # Reseed every session with the minimized corpus
+    staging = jobDir + "/cmin/"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.mkdir(staging)
+    names = {}
+    for num, sha1 in enumerate(selected):
+        orig = os.path.basename(inputs[sha1])
+        if orig.startswith("id:") and ",orig:" in orig:
+            orig = orig.split(",orig:", 1)[1]
+        name = "id:{:06d},orig:{}".format(num, orig)
+        link_or_copy(inputs[sha1], staging + name)
+        names[name] = sha1
+
+    for session in sessions:
+        queue = syncDir + session + "/queue/"
+        shutil.rmtree(queue)
+        os.mkdir(queue)
+        prefix = "afl-out/" + session + "/queue/"
+        for relpath in [r for r in manifest.entries if r.startswith(prefix)]:
+            manifest.remove(relpath)
+        for name, sha1 in sorted(names.items()):
+            link_or_copy(staging + name, queue + name)
+            manifest.add(prefix + name, os.stat(queue + name).st_ino, sha1)
+    shutil.rmtree(staging)
+    manifest.flush()
+
+    # Queue entries that were dropped are not referenced by any session anymore
+    blobstore.BlobStore(config['orthrus']['directory'] + "/blobs").gc()
+    color_print(bcolors.OKGREEN, "\t\t\t[*] Reseeded {} sessions".format(len(sessions)))
 
     return True
 
@@ -0,0 +1,245 @@
+import os
+import fcntl
+import errno
+import select
+import signal
+import struct
+import hashlib
+import resource
+import tempfile
+import threading
+import subprocess
+
+# File descriptors of the AFL forkserver protocol: commands to the target,
+# status from the target
+FORKSRV_FD = 198
+
+# Bytes of output kept per run, enough for any sanitizer report
+MAX_OUTPUT = 1024 * 1024
+
+# Held from creating the pipes of a forkserver until they are close-on-exec.
+# Other threads hold it to start their processes, which then never inherit
+# the pipes.
+spawn_lock = threading.Lock()
+
+# Forkserver preloaded into targets that were not built with afl. It takes
+# over before main: every command forks a child that goes on into main with
+# the current input, the parent reports the child's pid and exit status.
+SHIM_SOURCE = r"""
+#include <stdlib.h>
+#include <unistd.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+
+#define FORKSRV_FD 198
+
+__attribute__((constructor)) static void orthrus_forkserver(void) {
+    unsigned int msg = 0;
+    int status;
+    pid_t pid;
+
+    /* Processes the target starts are left alone */
+    if (!getenv("ORTHRUS_FORKSERVER"))
+        return;
+    unsetenv("ORTHRUS_FORKSERVER");
+    if (write(FORKSRV_FD + 1, &msg, 4) != 4)
+        return;
+    while (read(FORKSRV_FD, &msg, 4) == 4) {
+        pid = fork();
+        if (pid < 0)
+            _exit(1);
+        if (!pid) {
+            close(FORKSRV_FD);
+            close(FORKSRV_FD + 1);
+            return;
+        }
+        if (write(FORKSRV_FD + 1, &pid, 4) != 4 || waitpid(pid, &status, 0) < 0 ||
+            write(FORKSRV_FD + 1, &status, 4) != 4)
+            _exit(1);
+    }
+    _exit(0);
+}
+"""
+
+
+def build_shim(directory):
+    # Path of the compiled forkserver shim, built on first use. None if
+    # there is no working C compiler.
+    digest = hashlib.sha1(SHIM_SOURCE).hexdigest()[:12]
+    shim = os.path.join(os.path.abspath(directory), "replay-shim-" + digest + ".so")
+    if os.path.isfile(shim):
+        return shim
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, source = tempfile.mkstemp(prefix="orthrus-shim-", suffix=".c")
+    with os.fdopen(fd, 'w') as f:
+        f.write(SHIM_SOURCE)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            ret = subprocess.call([os.environ.get("CC", "cc"), "-shared", "-fPIC", "-O2", "-o", shim + ".tmp",
+                                   source], stdout=devnull, stderr=devnull)
+    except OSError:
+        ret = -1
+    finally:
+        os.remove(source)
+    if ret != 0:
+        if os.path.exists(shim + ".tmp"):
+            os.remove(shim + ".tmp")
+        return None
+    os.rename(shim + ".tmp", shim)
+    return shim
+
+
+def _status(status):
+    # Popen style returncode of a wait status
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _no_core():
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+class Replayer(object):
+
+    # Runs one target on input after input. With the shim the target is
+    # started once and every input costs a fork() instead of an execve()
+    # and the dynamic linking. Targets the shim cannot be loaded into, e.g.
+    # static binaries, are executed once per input instead. A replayer is
+    # not thread safe, threads need one each.
+    def __init__(self, binary, params, env=None, timeout=10, shim=None):
+        fd, self.input = tempfile.mkstemp(prefix="orthrus-replay-")
+        os.close(fd)
+        self.stdin = "@@" not in params
+        self.cmd = [binary] + [self.input if p == "@@" else p for p in params]
+        self.env = env
+        self.timeout = timeout
+        self._input = open(self.input, 'r+b')
+        self._output = tempfile.TemporaryFile(prefix="orthrus-replay-")
+        self._proc = None
+        self.shim = shim
+        self.forks = 0
+
+    def _start(self):
+        env = dict(self.env or os.environ)
+        env['LD_PRELOAD'] = " ".join(filter(None, [self.shim, env.get('LD_PRELOAD')]))
+        env['ORTHRUS_FORKSERVER'] = "1"
+        # ASAN insists on coming first in the library list otherwise
+        env['ASAN_OPTIONS'] = ":".join(filter(None, [env.get('ASAN_OPTIONS'), "verify_asan_link_order=0"]))
+
+        def setup():
+            os.dup2(ctl_r, FORKSRV_FD)
+            os.dup2(st_w, FORKSRV_FD + 1)
+            _no_core()
+
+        self._reset()
+        with spawn_lock:
+            ctl_r, self._ctl = os.pipe()
+            self._st, st_w = os.pipe()
+            # Only the ends dup'ed into this target survive its exec, a
+            # forkserver must not hold the pipes of another one open
+            for fd in (ctl_r, self._ctl, self._st, st_w):
+                fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+            with open(os.devnull) as devnull:
+                self._proc = subprocess.Popen(self.cmd, stdin=self._input if self.stdin else devnull,
+                                              stdout=self._output, stderr=subprocess.STDOUT, env=env,
+                                              preexec_fn=setup)
+        os.close(ctl_r)
+        os.close(st_w)
+        if self._read() is None:
+            # The shim did not load, the target ran as usual
+            self._stop()
+            self.shim = None
+
+    def _stop(self):
+        if self._proc:
+            os.close(self._ctl)
+            os.close(self._st)
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+
+    def close(self):
+        self._stop()
+        self._input.close()
+        self._output.close()
+        os.remove(self.input)
+
+    def _read(self, timeout=None):
+        # Next 4 byte message of the forkserver, None on timeout or EOF
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            ready = select.select([self._st], [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            ready = []
+        if not ready:
+            return None
+        data = os.read(self._st, 4)
+        if len(data) != 4:
+            return None
+        return struct.unpack("I", data)[0]
+
+    def _reset(self):
+        for f in (self._input, self._output):
+            f.seek(0)
+        self._output.truncate()
+
+    def _result(self):
+        self._output.seek(0)
+        return self._output.read(MAX_OUTPUT)
+
+    def _exec(self):
+        # One run without the forkserver
+        killed = []
+
+        def kill():
+            killed.append(True)
+            proc.kill()
+
+        with spawn_lock, open(os.devnull) as devnull:
+            proc = subprocess.Popen(self.cmd, stdin=self._input if self.stdin else devnull, stdout=self._output,
+                                    stderr=subprocess.STDOUT, env=self.env, preexec_fn=_no_core)
+        timer = threading.Timer(self.timeout, kill)
+        timer.start()
+        try:
+            proc.wait()
+        finally:
+            timer.cancel()
+            timer.join()
+        return None if killed else proc.returncode
+
+    def run(self, data):
+        # (returncode, output) of one run on data, returncode None if the
+        # target was killed after the timeout
+        self._input.seek(0)
+        self._input.truncate()
+        self._input.write(data)
+        self._input.flush()
+        if self.shim and self._proc is None:
+            self._start()
+        self._reset()
+        if not self._proc:
+            return self._exec(), self._result()
+
+        os.write(self._ctl, struct.pack("I", 0))
+        pid = self._read()
+        if pid is None:
+            # The forkserver died, it is started again for the next input
+            self._stop()
+            return self._exec(), self._result()
+        self.forks += 1
+        status = self._read()
+        if status is None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+            if self._read(self.timeout) is None:
+                self._stop()
+            return None, self._result()
+        return _status(status), self._result()
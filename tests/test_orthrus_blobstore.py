@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from orthrusutils import blobstore
+from orthrusutils import orthrusutils as util
+
+class TestOrthrusBlobStore(unittest.TestCase):
+
+    def write(self, path, data):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def test_add_checkout(self):
+        seed = self.write(os.path.join(self.tmpdir, 'seeds', 'seed'), 'seed')
+        digest = self.store.add(seed)
+        self.assertEqual(digest, util.hash_file(seed))
+        self.assertNotEqual(os.stat(seed).st_ino, os.stat(self.store.path(digest)).st_ino)
+        dst = os.path.join(self.tmpdir, 'afl-in')
+        self.store.checkout(digest, dst)
+        self.assertTrue(os.path.samefile(dst, self.store.path(digest)))
+
+        # Editing the seed in place leaves the blob alone
+        self.write(seed, 'edited')
+        with open(self.store.path(digest)) as f:
+            self.assertEqual(f.read(), 'seed')
+        self.assertEqual(self.store.add(seed), util.hash_file(seed))
+
+    def test_ingest_tree_gc(self):
+        job = os.path.join(self.tmpdir, 'job')
+        self.write(os.path.join(job, 'afl-out', 'SESSION000', 'queue', 'id:000000'), 'a')
+        self.write(os.path.join(job, 'afl-out', 'SESSION001', 'queue', 'id:000000'), 'a')
+        self.write(os.path.join(job, 'afl-out', 'SESSION001', 'crashes', 'id:000000'), 'b')
+        self.write(os.path.join(job, 'afl-out', 'SESSION001', 'fuzzer_stats'), 'stats')
+        manifest = os.path.join(job, 'manifest')
+        entries = self.store.ingest_tree(job, manifest)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(len(set(digest for _, digest in entries.values())), 2)
+        self.assertTrue(os.path.samefile(os.path.join(job, 'afl-out', 'SESSION000', 'queue', 'id:000000'),
+                                         os.path.join(job, 'afl-out', 'SESSION001', 'queue', 'id:000000')))
+        self.assertEqual(blobstore.Manifest(manifest).entries, entries)
+
+        # Blobs are freed once nothing links to them anymore
+        self.assertEqual(self.store.gc(), 0)
+        os.remove(os.path.join(job, 'afl-out', 'SESSION001', 'crashes', 'id:000000'))
+        entries = self.store.ingest_tree(job, manifest)
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(blobstore.Manifest(manifest).entries, entries)
+        self.assertEqual(self.store.gc(), 1)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = blobstore.BlobStore(os.path.join(self.tmpdir, 'blobs'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
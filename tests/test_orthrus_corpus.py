@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+from orthrusutils import corpus
+
+class TestOrthrusCorpus(unittest.TestCase):
+
+    def test_parse_showmap(self):
+        showmap = os.path.join(self.tmpdir, 'showmap')
+        with open(showmap, 'w') as f:
+            for hits in range(1, 9):
+                f.write('000100:{}\n'.format(hits))
+        trace = corpus.parse_showmap(showmap)
+        self.assertEqual(list(trace), [100 * corpus.HIT_CLASSES + c for c in range(8)])
+
+    def test_minimize_hit_classes(self):
+        # Inputs that only differ in the hit class of an edge are all kept
+        target = os.path.join(self.tmpdir, 'target')
+        open(target, 'w').close()
+        minimizer = corpus.CorpusMinimizer(target, '@@', os.path.join(self.tmpdir, 'traces'), 'none', 1000)
+        inputs = {}
+        for hits in range(1, 9):
+            digest = 'input{}'.format(hits)
+            inputs[digest] = os.path.join(self.tmpdir, digest)
+            with open(inputs[digest], 'w') as f:
+                f.write('x' * hits)
+            showmap = os.path.join(self.tmpdir, 'showmap')
+            with open(showmap, 'w') as f:
+                f.write('000007:{}\n'.format(hits))
+            minimizer.cache.store(digest, corpus.parse_showmap(showmap))
+        self.assertEqual(sorted(minimizer.minimize(inputs)), sorted(inputs))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
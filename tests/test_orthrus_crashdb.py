@@ -0,0 +1,74 @@
+import shutil
+import argparse
+import tempfile
+import unittest
+from triagetool import crashdb
+from triagetool import triagetool
+from orthrusutils import orthrusutils as util
+
+class TestOrthrusCrashDB(unittest.TestCase):
+
+    def result(self, bucket, kind='SEGV'):
+        return {'bucket': bucket, 'variant': 'asan', 'kind': kind, 'frames': ['main']}
+
+    def test_hang_and_crash_bucket(self):
+        # A hang whose hash equals a crash bucket's stays apart from it
+        self.assertTrue(self.db.add('job', 'd1', 'crash', self.result('b1'), 10))
+        self.assertTrue(self.db.add('job', 'd1', 'hang', self.result('b1', 'hang'), 20, crashdb.HANG))
+        self.db.set_reproducer('job', 'b1', 'unique_hangs/b1', crashdb.HANG)
+        self.assertEqual(self.db.bucket_counts(), {'job': 1})
+        self.assertEqual(self.db.bucket_counts(crashdb.HANG), {'job': 1})
+        self.assertEqual(self.db.known('job'), set(['d1']))
+        self.assertEqual(self.db.known('job', crashdb.HANG), set(['d1']))
+        crash = self.db.query()[0]
+        self.assertEqual((crash['kind'], crash['last_seen'], crash['reproducer']), ('SEGV', 10, 'crash'))
+        self.assertEqual(self.db.query(category=crashdb.HANG)[0]['reproducer'], 'unique_hangs/b1')
+
+    def seed(self):
+        # b1 is found by both jobs, b2 and b3 by one job each
+        self.db.add('job1', 'd1', 'c1', self.result('b1'), 100)
+        self.db.add('job1', 'd2', 'c2', self.result('b1'), 300)
+        self.db.add('job2', 'd3', 'c3', self.result('b1'), 200)
+        self.db.add('job1', 'd4', 'c4', self.result('b2'), 400)
+        self.db.add('job2', 'd5', 'c5', self.result('b3', 'heap-buffer-overflow'), 500)
+        self.db.add('job2', 'd6', 'c6', {'bucket': triagetool.NO_CRASH, 'variant': '', 'kind': '', 'frames': []}, 600)
+
+    def test_query(self):
+        self.seed()
+        buckets = self.db.query()
+        self.assertEqual([b['bucket'] for b in buckets], ['b1', 'b2', 'b3'])
+        self.assertEqual((buckets[0]['jobs'], buckets[0]['first_seen'], buckets[0]['last_seen'],
+                          buckets[0]['crashes'], buckets[0]['reproducer']), (['job1', 'job2'], 100, 300, 3, 'c1'))
+        self.assertEqual(buckets[2]['kind'], 'heap-buffer-overflow')
+        self.assertEqual(self.db.bucket_counts(), {'job1': 2, 'job2': 2})
+
+    def test_query_since(self):
+        self.seed()
+        # Buckets count from the first crash found by any job
+        self.assertEqual([b['bucket'] for b in self.db.query(since=150)], ['b2', 'b3'])
+        self.assertEqual([b['bucket'] for b in self.db.query(since=400)], ['b2', 'b3'])
+        self.assertEqual([b['bucket'] for b in self.db.query(since=401)], ['b3'])
+        self.assertEqual(self.db.query(since=501), [])
+        # Restricted to one job, b1 was first found by it at 200
+        self.assertEqual([b['bucket'] for b in self.db.query(since=150, jobs=['job2'])], ['b1', 'b3'])
+
+    def test_query_cross_job(self):
+        self.seed()
+        self.assertEqual([b['bucket'] for b in self.db.query(cross_job=True)], ['b1'])
+        self.assertEqual(self.db.query(cross_job=True, jobs=['job1']), [])
+        self.assertEqual(self.db.query(since=150, cross_job=True), [])
+
+    def test_parse_duration(self):
+        self.assertEqual(util.parse_duration('90'), 90)
+        self.assertEqual(util.parse_duration('30m'), 1800)
+        self.assertEqual(util.parse_duration('12h'), 43200)
+        self.assertEqual(util.parse_duration('1d'), 86400)
+        self.assertRaises(argparse.ArgumentTypeError, util.parse_duration, '1w')
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = crashdb.CrashDB(self.tmpdir)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
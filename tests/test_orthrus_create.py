@@ -22,6 +22,27 @@ class TestOrthrusCreate(unittest.TestCase):
         cmd = OrthrusCreate(args, self.config)
         self.assertTrue(cmd.run())
 
+    def test_create_parallel(self):
+        args = parse_cmdline(self.description, ['create', '-asan', '-fuzz', '-cov', '-p'])
+        cmd = OrthrusCreate(args, self.config)
+        self.assertTrue(cmd.run())
+
+    def test_create_cached(self):
+        args = parse_cmdline(self.description, ['create', '-asan'])
+        cmd = OrthrusCreate(args, self.config)
+        self.assertTrue(cmd.run())
+        shutil.rmtree(self.orthrusdirname)
+        cmd = OrthrusCreate(args, self.config)
+        self.assertTrue(cmd.run())
+
+    def test_create_update(self):
+        args = parse_cmdline(self.description, ['create', '-asan'])
+        cmd = OrthrusCreate(args, self.config)
+        self.assertTrue(cmd.run())
+        args = parse_cmdline(self.description, ['create', '-u', '--no-cache'])
+        cmd = OrthrusCreate(args, self.config)
+        self.assertTrue(cmd.run())
+
     def setUp(self):
         self.config = {'orthrus' : {'directory': self.orthrusdirname}}
 
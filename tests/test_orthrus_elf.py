@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+from orthrusutils import elf
+
+SOURCE = r"""
+int __afl_maybe_log_test(int x) { return x + 1; }
+int main(int argc, char **argv) { return __afl_maybe_log_test(argc); }
+"""
+
+class TestOrthrusElf(unittest.TestCase):
+
+    def build(self, name, flags):
+        binary = os.path.join(self.tmpdir, name)
+        with open(os.devnull, 'w') as devnull:
+            if subprocess.call(['cc', '-o', binary, self.source] + flags, stdout=devnull, stderr=devnull):
+                self.skipTest('no C compiler')
+        return binary
+
+    def test_find_symbols(self):
+        binary = self.build('main', [])
+        with elf.ElfFile(binary) as f:
+            self.assertEqual(f.find_symbols(['__afl_maybe_log', '__asan_init']), set(['__afl_maybe_log']))
+        cache = elf.SymbolCache(os.path.join(self.tmpdir, 'symbols.cache'))
+        self.assertEqual(cache.find_symbols(binary, ['__afl_maybe_log']), set(['__afl_maybe_log']))
+        cache.save()
+        cache = elf.SymbolCache(os.path.join(self.tmpdir, 'symbols.cache'))
+        self.assertEqual(cache._entries[os.path.abspath(binary)][2], set(['__afl_maybe_log']))
+
+    def test_is_executable(self):
+        self.assertTrue(elf.is_executable(self.build('main', ['-no-pie'])))
+        self.assertTrue(elf.is_executable(self.build('main-pie', ['-fPIE', '-pie'])))
+        self.assertFalse(elf.is_executable(self.build('libmain.so', ['-fPIC', '-shared'])))
+        self.assertFalse(elf.is_executable(self.source))
+
+    def test_truncated(self):
+        binary = self.build('main', [])
+        truncated = os.path.join(self.tmpdir, 'truncated')
+        with open(binary, 'rb') as src, open(truncated, 'wb') as dst:
+            dst.write(src.read(20))
+        fds = len(os.listdir('/proc/self/fd'))
+        try:
+            elf.ElfFile(truncated)
+            self.fail('truncated file accepted')
+        except elf.ElfError:
+            # The traceback still references the half constructed object
+            self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+
+    def test_save_concurrently(self):
+        binaries = [self.build('main{}'.format(idx), []) for idx in range(4)]
+        cache = elf.SymbolCache(os.path.join(self.tmpdir, 'symbols.cache'))
+
+        def lookup(binary):
+            for _ in range(20):
+                cache.find_symbols(binary, ['__afl_maybe_log'])
+                cache.save()
+
+        threads = [threading.Thread(target=lookup, args=(binary,)) for binary in binaries]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(elf.SymbolCache(cache.path)._entries), 4)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'main.c')
+        with open(self.source, 'w') as f:
+            f.write(SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
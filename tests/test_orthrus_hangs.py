@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+from distutils.spawn import find_executable
+from triagetool import hangs
+from triagetool import symbolizer
+from triagetool import triagetool
+
+TARGET_SOURCE = r"""
+#include <stdio.h>
+#include <unistd.h>
+
+volatile int counter;
+
+__attribute__((noinline)) void spin(void) {
+    for (;;)
+        counter++;
+}
+
+__attribute__((noinline)) void spin_other(void) {
+    for (;;)
+        counter--;
+}
+
+int main(int argc, char **argv) {
+    FILE *f = fopen(argv[1], "rb");
+    int c = f ? fgetc(f) : EOF;
+    if (c == 'S')
+        usleep(1200000);
+    if (c == 'L' || c == 'M')
+        spin();
+    if (c == 'O')
+        spin_other();
+    return 0;
+}
+"""
+
+class TestOrthrusHangs(unittest.TestCase):
+
+    def build(self, name, flags=()):
+        binary = os.path.join(self.tmpdir, name)
+        with open(os.devnull, 'w') as devnull:
+            if subprocess.call(['cc', '-g', '-O0', '-o', binary, self.source] + list(flags), stdout=devnull,
+                               stderr=devnull):
+                self.skipTest('no C compiler for ' + name)
+        return binary
+
+    def input_file(self, data):
+        path = os.path.join(self.tmpdir, 'input-' + data)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def check_hangs(self, variant, binary):
+        triager = triagetool.Triager([(variant, binary)], '@@')
+        htriage = hangs.HangTriager(triager, 0.5, steps=(1, 4))
+        # Finished within the timeout, a false positive of a loaded host
+        self.assertEqual(htriage.triage(self.input_file('Q')), None)
+        slow = htriage.triage(self.input_file('S'))
+        self.assertEqual((slow['variant'], slow['kind']), (variant, hangs.SLOW))
+        self.assertTrue(1 <= slow['seconds'] < 2)
+
+        # Bucketed like orthrus triage does, with symbolized frames
+        symbols = symbolizer.Symbolizer()
+        buckets = {}
+        for data in 'LMO':
+            result = htriage.triage(self.input_file(data))
+            self.assertEqual((result['kind'], result['seconds']), (hangs.HANG, None))
+            result = triager.bucket(result, symbols)
+            self.assertEqual(result['frames'][0], 'spin_other' if data == 'O' else 'spin')
+            buckets[data] = result['bucket']
+        symbols.close()
+        # The same loop lands in one bucket, another loop in its own
+        self.assertEqual(buckets['L'], buckets['M'])
+        self.assertNotEqual(buckets['L'], buckets['O'])
+
+    def test_asan(self):
+        if not find_executable('llvm-symbolizer'):
+            self.skipTest('no llvm-symbolizer')
+        self.check_hangs('asan', self.build('target-asan', ['-fsanitize=address']))
+
+    def test_gdb(self):
+        if not find_executable('gdb'):
+            self.skipTest('no gdb')
+        self.check_hangs('harden', self.build('target'))
+
+    def test_parse_timeout(self):
+        self.assertEqual(hangs.parse_timeout('3000+'), 3.0)
+        self.assertEqual(hangs.parse_timeout('250'), 0.25)
+        self.assertEqual(hangs.parse_timeout(None), 1.0)
+        self.assertEqual(hangs.parse_timeout('none', 2.0), 2.0)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'target.c')
+        with open(self.source, 'w') as f:
+            f.write(TARGET_SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
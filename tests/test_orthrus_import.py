@@ -0,0 +1,75 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from StringIO import StringIO
+from orthrus.commands import *
+from orthrusutils.orthrusutils import *
+
+class TestOrthrusImport(unittest.TestCase):
+
+    description = 'Test harness'
+
+    def archive(self, members):
+        path = os.path.join(self.tmpdir, 'archive.tar')
+        with tarfile.open(path, 'w') as tar:
+            for name, kind, data in members:
+                info = tarfile.TarInfo(name)
+                if kind == 'dir':
+                    info.type = tarfile.DIRTYPE
+                    tar.addfile(info)
+                elif kind == 'file':
+                    info.size = len(data)
+                    tar.addfile(info, StringIO(data))
+                else:
+                    info.type = kind
+                    info.linkname = data
+                    tar.addfile(info)
+        return path
+
+    def extract(self, members):
+        cmd = OrthrusAdd(parse_cmdline(self.description, ['add', '-j', 'job', '-i', 'archive.tar']), {})
+        with tarfile.open(self.archive(members)) as tar:
+            return cmd.extract_sync_dir(tar, self.syncDir, len(os.listdir(self.syncDir)))
+
+    def read(self, relpath):
+        with open(os.path.join(self.syncDir, relpath)) as f:
+            return f.read()
+
+    def test_renamed_sessions(self):
+        # SESSION001 is kept, SESSION000 exists and must not be renamed to it
+        os.makedirs(os.path.join(self.syncDir, 'SESSION000', 'queue'))
+        self.assertEqual(self.extract([('SESSION001/queue/id:000000', 'file', 'kept'),
+                                       ('SESSION000/queue/id:000000', 'file', 'renamed')]), (2, 11))
+        self.assertEqual(sorted(os.listdir(self.syncDir)), ['SESSION000', 'SESSION001', 'SESSION002'])
+        self.assertEqual(self.read('SESSION001/queue/id:000000'), 'kept')
+        self.assertEqual(self.read('SESSION002/queue/id:000000'), 'renamed')
+        self.assertEqual(os.listdir(os.path.join(self.syncDir, 'SESSION000', 'queue')), [])
+
+    def test_single_session(self):
+        # A session gap does not make the import merge into the last session
+        os.makedirs(os.path.join(self.syncDir, 'SESSION001'))
+        self.extract([('queue/id:000000', 'file', 'single')])
+        self.assertEqual(self.read('SESSION002/queue/id:000000'), 'single')
+
+    def test_links(self):
+        outside = os.path.join(self.tmpdir, 'outside')
+        os.mkdir(outside)
+        self.assertEqual(self.extract([('SESSION000/queue/id:000000', 'file', 'data'),
+                                       ('SESSION000/queue/id:000001', tarfile.LNKTYPE, 'SESSION000/queue/id:000000'),
+                                       ('SESSION000/escape', tarfile.SYMTYPE, outside),
+                                       ('SESSION000/up', tarfile.SYMTYPE, '../../outside'),
+                                       ('SESSION000/escape/id:000002', 'file', 'escaped'),
+                                       ('SESSION000/up/id:000003', 'file', 'escaped')]), (3, 18))
+        self.assertEqual(self.read('SESSION000/queue/id:000001'), 'data')
+        self.assertEqual(os.listdir(outside), [])
+        self.assertFalse(os.path.islink(os.path.join(self.syncDir, 'SESSION000', 'escape')))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.syncDir = os.path.join(self.tmpdir, 'afl-out') + '/'
+        os.mkdir(self.syncDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+from triagetool import crashdb
+from triagetool import minimizer
+
+class StubTriager(object):
+
+    # Crashes whenever the input holds an 'X', in one bucket
+    def triage(self, path, variant=None):
+        with open(path, 'rb') as f:
+            if 'X' not in f.read():
+                return None
+        return {'variant': variant, 'kind': 'SEGV', 'frames': []}
+
+    def bucket(self, report, symbolizer=None):
+        return {'bucket': 'b1' if report else 'none', 'variant': report and report['variant'], 'kind': 'SEGV',
+                'frames': []}
+
+class TestOrthrusMinimize(unittest.TestCase):
+
+    def minimize(self, data):
+        path = os.path.join(self.tmpdir, 'crash')
+        with open(path, 'wb') as f:
+            f.write(data)
+        tmin = minimizer.CrashMinimizer(StubTriager(), 'asan', 'b1')
+        try:
+            return tmin.minimize(path)
+        finally:
+            tmin.close()
+
+    def test_minimize(self):
+        self.assertEqual(self.minimize('abcdefghXijklmnop' * 8), 'X')
+
+    def test_no_crash(self):
+        self.assertEqual(self.minimize('abcdefgh'), None)
+
+    def test_failed_not_retried(self):
+        db = crashdb.CrashDB(self.tmpdir)
+        result = {'bucket': 'b1', 'variant': 'asan', 'kind': 'SEGV', 'frames': []}
+        db.add('job', 'digest', 'crash', result, 1)
+        self.assertEqual(len(db.unminimized(['job'])), 1)
+        db.set_minimized('job', 'b1', '')
+        self.assertEqual(db.unminimized(['job']), [])
+        self.assertEqual(db.query()[0]['minimized'], None)
+        db.close()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
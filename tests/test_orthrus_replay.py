@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+from orthrusutils import replay
+
+TARGET_SOURCE = r"""
+#include <stdio.h>
+#include <stdlib.h>
+
+int main(int argc, char **argv) {
+    FILE *f = argc > 1 ? fopen(argv[1], "rb") : stdin;
+    int c = f ? fgetc(f) : EOF;
+    if (c == 'A')
+        abort();
+    if (c == 'H')
+        for (;;);
+    printf("clean %c\n", c);
+    return 0;
+}
+"""
+
+class TestOrthrusReplay(unittest.TestCase):
+
+    def build(self, name, flags=()):
+        binary = os.path.join(self.tmpdir, name)
+        with open(os.devnull, 'w') as devnull:
+            if subprocess.call(['cc', '-o', binary, self.source] + list(flags), stdout=devnull, stderr=devnull):
+                return None
+        return binary
+
+    def check_runs(self, replayer):
+        self.assertEqual(replayer.run('Z'), (0, 'clean Z\n'))
+        self.assertEqual(replayer.run('A')[0], -6)
+        self.assertEqual(replayer.run('H')[0], None)
+        # The target is still usable after a crash and a timeout
+        self.assertEqual(replayer.run('Y'), (0, 'clean Y\n'))
+
+    def test_forkserver(self):
+        for params in (['@@'], []):
+            replayer = replay.Replayer(self.build('target'), params, timeout=1, shim=self.shim)
+            try:
+                self.check_runs(replayer)
+                self.assertEqual(replayer.forks, 4)
+                self.assertTrue(replayer.shim)
+            finally:
+                replayer.close()
+
+    def test_static_fallback(self):
+        binary = self.build('target-static', ['-static'])
+        if not binary:
+            self.skipTest('no static libc')
+        replayer = replay.Replayer(binary, ['@@'], timeout=1, shim=self.shim)
+        try:
+            self.check_runs(replayer)
+            self.assertEqual(replayer.forks, 0)
+            self.assertFalse(replayer.shim)
+        finally:
+            replayer.close()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.shim = replay.build_shim(self.tmpdir)
+        if not self.shim:
+            shutil.rmtree(self.tmpdir)
+            self.skipTest('no C compiler')
+        self.source = os.path.join(self.tmpdir, 'target.c')
+        with open(self.source, 'w') as f:
+            f.write(TARGET_SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
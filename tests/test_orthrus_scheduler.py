@@ -0,0 +1,65 @@
+import os
+import sys
+import subprocess
+import unittest
+from fuzzer import fuzzer
+from fuzzer import scheduler
+
+class TestOrthrusScheduler(unittest.TestCase):
+
+    def test_apportion_equal(self):
+        self.assertEqual(scheduler.apportion(8, ['a', 'b'], {}), {'a': 4, 'b': 4})
+        # The largest remainders get the cores left over
+        self.assertEqual(scheduler.apportion(7, ['a', 'b', 'c'], {}), {'a': 3, 'b': 2, 'c': 2})
+
+    def test_apportion_priority(self):
+        self.assertEqual(scheduler.apportion(8, ['a', 'b'], {'a': 3, 'b': 1}), {'a': 6, 'b': 2})
+        self.assertEqual(scheduler.apportion(10, ['a', 'b', 'c'], {'a': 2, 'b': 2, 'c': 1}),
+                         {'a': 4, 'b': 4, 'c': 2})
+        self.assertEqual(scheduler.apportion(5, ['a', 'b'], {'a': 1.5, 'b': 1.0}), {'a': 3, 'b': 2})
+
+    def test_apportion_minimum(self):
+        # Every variant runs, without handing out more than count
+        self.assertEqual(scheduler.apportion(4, ['a', 'b', 'c'], {'a': 10, 'b': 1, 'c': 1}),
+                         {'a': 2, 'b': 1, 'c': 1})
+        for count in range(3, 20):
+            counts = scheduler.apportion(count, ['a', 'b', 'c'], {'a': 100, 'b': 1, 'c': 3})
+            self.assertEqual(sum(counts.values()), count)
+            self.assertTrue(min(counts.values()) >= 1)
+
+    def test_apportion_fewer_than_variants(self):
+        # The heaviest variants, earliest first, get the cores there are
+        self.assertEqual(scheduler.apportion(1, ['a', 'b'], {}), {'a': 1, 'b': 0})
+        self.assertEqual(scheduler.apportion(2, ['a', 'b', 'c'], {'c': 2}), {'a': 1, 'b': 0, 'c': 1})
+        self.assertEqual(scheduler.apportion(0, ['a', 'b'], {}), {'a': 0, 'b': 0})
+
+    def test_assign(self):
+        sched = scheduler.Scheduler({'harden': 3, 'asan': 1}, pool=[0, 1, 2, 3, 4])
+        self.assertEqual(sched.assign(['harden', 'asan'], 4, prefer=[3]),
+                         [('harden', 3), ('harden', 0), ('harden', 1), ('asan', 2)])
+        # Never more instances than cores, none without free cores
+        self.assertEqual(sched.assign(['harden', 'asan'], 4), [('harden', 4)])
+        self.assertEqual(sched.assign(['harden', 'asan']), [])
+
+    def test_assign_jobs(self):
+        # 30 jobs on 8 cores start 8 instances, one per core
+        sched = scheduler.Scheduler(pool=range(8))
+        shares = scheduler.apportion(len(sched.free_cpus()), range(30), {})
+        instances = [inst for job in range(30) for inst in sched.assign(['harden', 'asan'], shares[job])]
+        self.assertEqual(sorted(cpu for _, cpu in instances), range(8))
+
+    def test_pinned_instance(self):
+        inst = fuzzer.Instance('SESSION000', 'harden', 'master', 'harden-job.conf', scheduler.online_cpus()[-1])
+        self.assertEqual(inst.environ({})['AFL_NO_AFFINITY'], '1')
+        status = subprocess.check_output(['cat', '/proc/self/status'], preexec_fn=inst.preexec)
+        self.assertIn('Cpus_allowed_list:\t' + str(inst.cpu) + '\n', status)
+        self.assertNotIn('AFL_NO_AFFINITY', fuzzer.Instance('SESSION000', 'harden', 'master', '').environ({}))
+
+    def test_online_cpus_affinity(self):
+        # A process confined to one core only hands out that core
+        cpu = scheduler.online_cpus()[-1]
+        code = 'from fuzzer import scheduler; print scheduler.online_cpus()'
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, '-c', code], env=env,
+                                         preexec_fn=lambda: fuzzer.set_affinity([cpu]))
+        self.assertEqual(output.strip(), str([cpu]))
@@ -17,6 +17,16 @@ class TestOrthrusShow(unittest.TestCase):
         cmd = OrthrusShow(args, self.config)
         self.assertTrue(cmd.run())
 
+    def test_show_status_json(self):
+        args = parse_cmdline(self.description, ['show', '--format', 'json'])
+        cmd = OrthrusShow(args, self.config)
+        self.assertTrue(cmd.run())
+
+    def test_show_crashes(self):
+        args = parse_cmdline(self.description, ['show', '-c', '--since', '1d', '--cross-job'])
+        cmd = OrthrusShow(args, self.config)
+        self.assertTrue(cmd.run())
+
     def test_show_cov(self):
         args = parse_cmdline(self.description, ['show', '-cov'])
         cmd = OrthrusShow(args, self.config)
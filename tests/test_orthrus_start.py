@@ -33,6 +33,52 @@ class TestOrthrusStart(unittest.TestCase):
         cmd = OrthrusStart(args, self.config)
         self.assertTrue(cmd.run())
 
+    def test_stop_job(self):
+        args = parse_cmdline(self.description, ['add', '--job=main @@',
+                '-s=./seeds'])
+        add_cmd = OrthrusAdd(args, self.config)
+        self.assertTrue(add_cmd.run())
+        args = parse_cmdline(self.description, ['start', '-j', add_cmd.jobId])
+        cmd = OrthrusStart(args, self.config)
+        self.assertTrue(cmd.run())
+        jobDir = self.orthrusdirname + "/jobs/" + add_cmd.jobId
+        self.assertTrue(fuzzer.running(jobDir))
+        args = parse_cmdline(self.description, ['stop', '-j', add_cmd.jobId])
+        cmd = OrthrusStop(args, self.config)
+        self.assertTrue(cmd.run())
+        self.assertFalse(fuzzer.running(jobDir))
+
+    def test_rotate_stopped_job(self):
+        args = parse_cmdline(self.description, ['add', '--job=main @@',
+                '-s=./seeds'])
+        add_cmd = OrthrusAdd(args, self.config)
+        self.assertTrue(add_cmd.run())
+        args = parse_cmdline(self.description, ['start', '-j', add_cmd.jobId])
+        cmd = OrthrusStart(args, self.config)
+        self.assertTrue(cmd.run())
+        args = parse_cmdline(self.description, ['stop', '-j', add_cmd.jobId])
+        cmd = OrthrusStop(args, self.config)
+        self.assertTrue(cmd.run())
+        # A job stopped by hand is not picked up by rotation
+        job_config = ConfigParser.ConfigParser()
+        job_config.read(self.orthrusdirname + "/jobs/jobs.conf")
+        args = parse_cmdline(self.description, ['start', '--rotate'])
+        cmd = OrthrusStart(args, self.config)
+        self.assertTrue(cmd.rotate(job_config, 'equal'))
+        self.assertFalse(fuzzer.running(self.orthrusdirname + "/jobs/" + add_cmd.jobId))
+
+    def test_stop_all_idle_job(self):
+        # A bare stop does not keep jobs that never ran out of rotation
+        args = parse_cmdline(self.description, ['add', '--job=main @@',
+                '-s=./seeds'])
+        add_cmd = OrthrusAdd(args, self.config)
+        self.assertTrue(add_cmd.run())
+        args = parse_cmdline(self.description, ['stop'])
+        cmd = OrthrusStop(args, self.config)
+        self.assertTrue(cmd.run())
+        self.assertFalse(os.path.exists(self.orthrusdirname + "/jobs/" + add_cmd.jobId + "/" +
+                                        OrthrusStart.STOPPED_FILE))
+
     def setUp(self):
         self.config = {'orthrus' : {'directory': self.orthrusdirname}}
         args = parse_cmdline(self.description, ['create', '-asan'])
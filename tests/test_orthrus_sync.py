@@ -0,0 +1,106 @@
+import sys
+import time
+import pipes
+import tempfile
+import unittest
+from orthrus.commands import *
+from orthrusutils.orthrusutils import *
+
+# Nodes run the orthrus of this checkout, not one that happens to be installed
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs the orthrus tool confined to one core, like on a host of its own
+NODE_ORTHRUS = ("import sys, runpy; from fuzzer import fuzzer; fuzzer.set_affinity([{cpu}]); del sys.argv[0]; "
+                "runpy.run_path(sys.argv[0], run_name='__main__')")
+
+class TestOrthrusSync(unittest.TestCase):
+
+    description = 'Test harness'
+    orthrusdirname = '.orthrus'
+
+    def node_job_dir(self, name):
+        return self.workspaces[name] + '/' + self.orthrusdirname + '/jobs/' + self.jobId
+
+    def contents(self, directory):
+        found = set()
+        if os.path.isdir(directory):
+            for fn in os.listdir(directory):
+                with open(directory + '/' + fn) as f:
+                    found.add(f.read())
+        return found
+
+    def add_entry(self, jobDir, data):
+        queue = jobDir + '/afl-out/SESSION000/queue/'
+        if not os.path.isdir(queue):
+            os.makedirs(queue)
+        with open(queue + 'id:009999,test', 'w') as f:
+            f.write(data)
+
+    def test_sync(self):
+        args = parse_cmdline(self.description, ['start', '-j', self.jobId, '-n'])
+        cmd = OrthrusStart(args, self.config)
+        self.assertTrue(cmd.run())
+        for name in self.workspaces:
+            self.assertTrue(os.path.isdir(self.node_job_dir(name) + '/afl-in'))
+            self.assertTrue(os.path.isdir(self.workspaces[name] + '/' + self.orthrusdirname + '/binaries/afl-asan'))
+            self.assertTrue(fuzzer.running(self.node_job_dir(name)))
+
+        # New entries on the master and on one node reach all the others
+        jobDir = self.orthrusdirname + '/jobs/' + self.jobId
+        self.add_entry(jobDir, 'found on master')
+        self.add_entry(self.node_job_dir('node1'), 'found on node1')
+        args = parse_cmdline(self.description, ['sync', '-j', self.jobId])
+        cmd = OrthrusSync(args, self.config)
+        self.assertTrue(cmd.run())
+        self.assertIn('found on node1', self.contents(jobDir + '/afl-out/node.node1/queue'))
+        self.assertIn('found on master', self.contents(self.node_job_dir('node1') + '/afl-out/orthrus-sync/queue'))
+        self.assertTrue(set(['found on master', 'found on node1']) <=
+                        self.contents(self.node_job_dir('node2') + '/afl-out/orthrus-sync/queue'))
+
+        # Nothing is transferred twice
+        synced = len(os.listdir(self.node_job_dir('node2') + '/afl-out/orthrus-sync/queue'))
+        cmd = OrthrusSync(args, self.config)
+        self.assertTrue(cmd.run())
+        self.assertEqual(len(os.listdir(self.node_job_dir('node2') + '/afl-out/orthrus-sync/queue')), synced)
+
+        args = parse_cmdline(self.description, ['stop', '-j', self.jobId, '-n'])
+        cmd = OrthrusStop(args, self.config)
+        self.assertTrue(cmd.run())
+        for name in self.workspaces:
+            self.assertFalse(fuzzer.running(self.node_job_dir(name)))
+
+    def setUp(self):
+        # The master and each node fuzz on a core of their own
+        self.cpus = scheduler.online_cpus()
+        if len(self.cpus) < 3:
+            self.skipTest('needs three cores')
+        fuzzer.set_affinity(self.cpus[:1])
+        self.pythonpath = os.environ.get('PYTHONPATH')
+        os.environ['PYTHONPATH'] = os.pathsep.join([REPO] + ([self.pythonpath] if self.pythonpath else []))
+        self.workspaces = {'node1': tempfile.mkdtemp(), 'node2': tempfile.mkdtemp()}
+        self.config = {'orthrus': {'directory': self.orthrusdirname}, 'nodes': {}}
+        for idx, name in enumerate(sorted(self.workspaces)):
+            orthrus = [sys.executable, '-c', NODE_ORTHRUS.format(cpu=self.cpus[idx + 1]),
+                       os.path.join(REPO, 'tool', 'orthrus')]
+            self.config['nodes'][name] = {'transport': 'local', 'workspace': self.workspaces[name],
+                                          'directory': self.orthrusdirname,
+                                          'orthrus': " ".join(pipes.quote(a) for a in orthrus)}
+        args = parse_cmdline(self.description, ['create', '-asan', '-fuzz'])
+        cmd = OrthrusCreate(args, self.config)
+        cmd.run()
+        args = parse_cmdline(self.description, ['add', '--job=main @@',
+                                                '-s=./seeds'])
+        cmd = OrthrusAdd(args, self.config)
+        self.assertTrue(cmd.run())
+        self.jobId = cmd.jobId
+
+    def tearDown(self):
+        args = parse_cmdline(self.description, ['stop', '-j', self.jobId, '-n'])
+        OrthrusStop(args, self.config).run()
+        shutil.rmtree(self.orthrusdirname)
+        for workspace in self.workspaces.values():
+            shutil.rmtree(workspace)
+        if self.pythonpath is None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = self.pythonpath
+        fuzzer.set_affinity(self.cpus)
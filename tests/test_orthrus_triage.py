@@ -13,6 +13,20 @@ class TestOrthrusTriage(unittest.TestCase):
         cmd = OrthrusTriage(args, self.config)
         self.assertTrue(cmd.run())
 
+    def test_triage_rerun(self):
+        args = parse_cmdline(self.description, ['triage', '-j', self.cmd.jobId])
+        cmd = OrthrusTriage(args, self.config)
+        self.assertTrue(cmd.run())
+        args = parse_cmdline(self.description, ['triage', '-j', self.cmd.jobId, '--rerun'])
+        cmd = OrthrusTriage(args, self.config)
+        self.assertTrue(cmd.run())
+        self.assertTrue(glob.glob(self.orthrusdirname + '/jobs/' + self.cmd.jobId + '/unique.*'))
+
+    def test_triage_hangs(self):
+        args = parse_cmdline(self.description, ['triage', '-j', self.cmd.jobId, '--hangs'])
+        cmd = OrthrusTriage(args, self.config)
+        self.assertTrue(cmd.run())
+
     def setUp(self):
         self.config = {'orthrus' : {'directory': self.orthrusdirname}}
         args = parse_cmdline(self.description, ['create', '-asan', '-fuzz'])
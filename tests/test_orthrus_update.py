@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from builder import builder as b
+from orthrusutils import orthrusutils as util
+
+class TestOrthrusUpdate(unittest.TestCase):
+
+    def write(self, relpath, data='source'):
+        path = os.path.join(self.src, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def sync(self):
+        return util.sync_tree(self.src, self.dest, b.Builder.SYNC_IGNORE, b.Builder.PREBUILT)
+
+    def test_sync_tree(self):
+        self.write('main.c')
+        self.write('old.c')
+        self.write('vendor/libfoo.a', '!<arch>\n')
+        self.write('vendor/libfoo.so', '\x7fELF prebuilt')
+        self.write('main.o', '\x7fELF object')
+        self.write('main', '\x7fELF in-tree binary')
+        self.write('.git/HEAD')
+        self.assertEqual(self.sync(), 4)
+        self.assertEqual(sorted(util.source_files(self.dest, [util.SYNC_MANIFEST], b.Builder.PREBUILT)),
+                         ['main.c', 'old.c', 'vendor/libfoo.a', 'vendor/libfoo.so'])
+        self.assertEqual(self.sync(), 0)
+
+        # Deleted sources go, files the build generated stay
+        os.remove(os.path.join(self.src, 'old.c'))
+        with open(os.path.join(self.dest, 'Makefile'), 'w') as f:
+            f.write('generated')
+        self.assertEqual(self.sync(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.dest, 'old.c')))
+        self.assertTrue(os.path.exists(os.path.join(self.dest, 'Makefile')))
+
+    def cache_key(self, cc='cc'):
+        env = b.BuildEnv(b.BuildEnv.BEnv(cc, cc, '', '', '', '', {}))
+        builder = b.Builder(env, [], cache=b.BuildCache(os.path.join(self.tmpdir, 'cache'), 0))
+        return builder.cache_key(self.src)
+
+    def test_cache_key(self):
+        self.write('main.c')
+        self.write('vendor/libfoo.so', '\x7fELF prebuilt')
+        key = self.cache_key()
+        self.write('main.o', '\x7fELF object')
+        self.assertEqual(self.cache_key(), key)
+        # A changed prebuilt library or compiler misses the cache
+        self.write('vendor/libfoo.so', '\x7fELF prebuilt 2')
+        key = self.cache_key()
+        self.assertNotEqual(self.cache_key('cc-upgraded'), key)
+        compiler = os.path.join(self.tmpdir, 'cc')
+        for version in ['1.0', '2.0']:
+            with open(compiler, 'w') as f:
+                f.write('#!/bin/sh\necho ' + version + '\n')
+            os.chmod(compiler, 0755)
+            self.assertNotEqual(self.cache_key(compiler), key)
+            key = self.cache_key(compiler)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'src')
+        self.dest = os.path.join(self.tmpdir, 'build')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
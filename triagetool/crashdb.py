@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import triagetool
+
+# Crash database of a workspace, in the orthrus directory
+DB_FILE = "crashes.db"
+
+# Results of crash triage and of hang triage
+CRASH = "crash"
+HANG = "hang"
+
+# Columns added since the first version of the database
+COLUMNS = [("buckets", "minimized", "TEXT"), ("crashes", "category", "TEXT DEFAULT 'crash'"),
+           ("buckets", "category", "TEXT DEFAULT 'crash'")]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crashes (job TEXT, digest TEXT, bucket TEXT, path TEXT, seen INTEGER,
+                                    category TEXT DEFAULT 'crash', PRIMARY KEY (job, digest, category));
+CREATE TABLE IF NOT EXISTS buckets (job TEXT, bucket TEXT, variant TEXT, kind TEXT, frames TEXT,
+                                    first_seen INTEGER, last_seen INTEGER, crashes INTEGER, reproducer TEXT,
+                                    minimized TEXT, category TEXT DEFAULT 'crash',
+                                    PRIMARY KEY (job, bucket, category));
+CREATE INDEX IF NOT EXISTS crashes_bucket ON crashes (bucket);
+CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket);
+CREATE INDEX IF NOT EXISTS buckets_first_seen ON buckets (first_seen);
+"""
+
+
+class CrashDB(object):
+
+    # Triage results of all jobs of a workspace. Every crash input is recorded
+    # by content hash, so it is triaged only once, and every bucket per job
+    # with the time its first and latest crash was found and a reproducer.
+    # Hangs are kept the same way under their own category.
+    def __init__(self, orthrusDir):
+        self.db = sqlite3.connect(os.path.join(orthrusDir, DB_FILE))
+        self.db.executescript(SCHEMA)
+        for table, column, definition in COLUMNS:
+            if column not in [row[1] for row in self.db.execute("PRAGMA table_info(" + table + ")")]:
+                self.db.execute("ALTER TABLE " + table + " ADD COLUMN " + column + " " + definition)
+        for table in ["crashes", "buckets"]:
+            self._key_category(table)
+
+    def _key_category(self, table):
+        # Tables of before hang triage are keyed without the category, a
+        # hang and a crash with the same hash would share a row. SQLite
+        # cannot change a key, the table is copied into a new one.
+        info = self.db.execute("PRAGMA table_info(" + table + ")").fetchall()
+        if [row[5] for row in info if row[1] == "category"] != [0]:
+            return
+        columns = ", ".join(row[1] for row in info)
+        self.db.execute("ALTER TABLE " + table + " RENAME TO old_" + table)
+        self.db.executescript(SCHEMA)
+        self.db.execute("INSERT INTO " + table + " (" + columns + ") SELECT " + columns + " FROM old_" + table)
+        self.db.execute("DROP TABLE old_" + table)
+        # The indexes went with the old table
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def known(self, job, category=CRASH):
+        # Content hashes of the crashes of a job triaged so far
+        return set(row[0] for row in self.db.execute("SELECT digest FROM crashes WHERE job = ? AND category = ?",
+                                                     (job, category)))
+
+    def add(self, job, digest, path, result, seen, category=CRASH):
+        # Records a triaged crash found at time seen, True if it opened a new
+        # bucket for the job. path becomes the reproducer of a new bucket.
+        self.db.execute("INSERT OR REPLACE INTO crashes VALUES (?, ?, ?, ?, ?, ?)",
+                        (job, digest, result['bucket'], path, seen, category))
+        if result['bucket'] == triagetool.NO_CRASH:
+            return False
+        row = self.db.execute("SELECT first_seen, last_seen FROM buckets WHERE job = ? AND bucket = ? AND "
+                              "category = ?", (job, result['bucket'], category)).fetchone()
+        if row:
+            self.db.execute("UPDATE buckets SET first_seen = ?, last_seen = ?, crashes = crashes + 1 "
+                            "WHERE job = ? AND bucket = ? AND category = ?",
+                            (min(row[0], seen), max(row[1], seen), job, result['bucket'], category))
+            return False
+        self.db.execute("INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, NULL, ?)",
+                        (job, result['bucket'], result['variant'], result['kind'], ",".join(result['frames']),
+                         seen, seen, path, category))
+        return True
+
+    def set_reproducer(self, job, bucket, path, category=CRASH):
+        self.db.execute("UPDATE buckets SET reproducer = ? WHERE job = ? AND bucket = ? AND category = ?",
+                        (path, job, bucket, category))
+
+    def unminimized(self, jobs):
+        # [(job, bucket, variant, reproducer)] of the buckets of the jobs
+        # whose reproducer was not tried to minimize yet
+        return self.db.execute("SELECT job, bucket, variant, reproducer FROM buckets WHERE minimized IS NULL "
+                               "AND category = ? AND job IN (" + ",".join("?" * len(jobs)) + ") "
+                               "ORDER BY job, first_seen", [CRASH] + list(jobs)).fetchall()
+
+    def set_minimized(self, job, bucket, path):
+        # An empty path records that the reproducer did not minimize, it is
+        # not tried again
+        self.db.execute("UPDATE buckets SET minimized = ? WHERE job = ? AND bucket = ? AND category = ?",
+                        (path, job, bucket, CRASH))
+
+    def forget(self, job, category=CRASH):
+        # Drops the results of a job so all its crashes are triaged again
+        self.db.execute("DELETE FROM crashes WHERE job = ? AND category = ?", (job, category))
+        self.db.execute("DELETE FROM buckets WHERE job = ? AND category = ?", (job, category))
+        self.db.commit()
+
+    def bucket_counts(self, category=CRASH):
+        # {job: unique crashes}
+        return dict(self.db.execute("SELECT job, COUNT(*) FROM buckets WHERE category = ? GROUP BY job",
+                                    (category,)))
+
+    def query(self, since=0, jobs=None, cross_job=False, category=CRASH):
+        # Buckets first found at or after since, over all jobs or the given
+        # ones. cross_job keeps the buckets found by more than one job.
+        sql = ("SELECT bucket, kind, frames, GROUP_CONCAT(job), MIN(first_seen), MAX(last_seen), SUM(crashes), "
+               "MIN(reproducer), MAX(minimized) FROM buckets WHERE category = ?")
+        params = [category]
+        if jobs:
+            sql += " AND job IN (" + ",".join("?" * len(jobs)) + ")"
+            params.extend(jobs)
+        sql += " GROUP BY bucket HAVING MIN(first_seen) >= ?"
+        params.append(since)
+        if cross_job:
+            sql += " AND COUNT(*) > 1"
+        sql += " ORDER BY MIN(first_seen), bucket"
+        buckets = []
+        for bucket, kind, frames, job_list, first_seen, last_seen, crashes, reproducer, minimized in \
+                self.db.execute(sql, params):
+            buckets.append({'bucket': bucket, 'kind': kind, 'frames': frames.split(",") if frames else [],
+                            'jobs': sorted(job_list.split(",")), 'first_seen': first_seen,
+                            'last_seen': last_seen, 'crashes': crashes, 'reproducer': reproducer,
+                            'minimized': minimized or None})
+        return buckets
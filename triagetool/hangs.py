@@ -0,0 +1,120 @@
+import os
+import time
+import errno
+import signal
+import threading
+import triagetool
+
+# Replays of a hang candidate run for these multiples of the job's afl-fuzz
+# timeout, each one only if the previous one timed out too
+DEFAULT_STEPS = (1, 4, 16)
+# Seconds a target gets to report its stack after it was aborted
+REPORT_GRACE = 10
+
+# Kinds of hangs: the target finished but only well after the timeout, or
+# it did not finish at all
+SLOW = "slow"
+HANG = "hang"
+
+
+def parse_timeout(value, default=1.0):
+    # Seconds of an afl-fuzz -t value such as "3000+"
+    try:
+        return int(value.rstrip('+')) / 1000.0
+    except (AttributeError, ValueError):
+        return default
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/" + entry + "/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except IOError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _signal(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except OSError as e:
+        if e.errno != errno.ESRCH:
+            raise
+
+
+class HangTriager(object):
+
+    # Replays hang candidates with growing timeouts. Candidates that finish
+    # within the afl-fuzz timeout only hung because the host was loaded and
+    # are dropped. The others are aborted once they run past the timeout and
+    # bucketed by the stack they were stuck in: an ASAN build reports it on
+    # SIGABRT, other builds are run under gdb for a backtrace.
+    def __init__(self, triager, timeout, steps=DEFAULT_STEPS):
+        self.triager = triager
+        self.timeout = timeout
+        self.steps = steps
+        # Sanitizers slow the target down, the harden build is preferred
+        self.variant, self.binary = sorted(triager.binaries, key=lambda b: b[0] != "harden")[0]
+
+    def duration(self, path):
+        # Seconds the target ran, None if it did not finish in any step
+        args, stdin = self.triager._args(path)
+        for step in self.steps:
+            start = time.time()
+            returncode, _ = triagetool.run_target([self.binary] + args, stdin, self.triager.env,
+                                                  self.timeout * step)
+            if returncode is not None:
+                return time.time() - start
+        return None
+
+    def _abort(self, proc, gdb):
+        # The target, or the process gdb runs, is aborted. Whatever does not
+        # finish its report in time is killed.
+        for pid in (child_pids(proc.pid) if gdb else [proc.pid]):
+            _signal(pid, signal.SIGABRT)
+        timer = threading.Timer(REPORT_GRACE,
+                                lambda: proc.returncode is None and _signal(proc.pid, signal.SIGKILL))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def sample(self, path):
+        # (kind, frames) of the stack the target is in after the timeout
+        args, stdin = self.triager._args(path)
+        # The kill after the grace period is called off once the target is
+        # gone, it must not outlive the triage
+        timers = []
+        try:
+            if self.variant == "asan":
+                _, output = triagetool.run_target([self.binary] + args, stdin, self.triager.env, self.timeout,
+                                                  lambda proc: timers.append(self._abort(proc, False)))
+                return triagetool.parse_asan_report(output)
+            run = "run" + (" < " + stdin if stdin else "")
+            try:
+                _, output = triagetool.run_target(["gdb", "-q", "-nx", "-batch", "-ex", "set pagination off",
+                                                   "-ex", run, "-ex", "bt", "--args", self.binary] + args,
+                                                  env=self.triager.env, timeout=self.timeout,
+                                                  on_timeout=lambda proc: timers.append(self._abort(proc, True)))
+            except OSError:
+                return None
+            return triagetool.parse_gdb_backtrace(output)
+        finally:
+            for timer in timers:
+                timer.cancel()
+                timer.join()
+
+    def triage(self, path):
+        # {'variant', 'kind', 'frames', 'seconds'} of a hang with the raw
+        # frames of its stack, None if it is no hang
+        seconds = self.duration(path)
+        if seconds is not None and seconds < self.timeout:
+            return None
+        report = self.sample(path)
+        return {'variant': self.variant, 'kind': SLOW if seconds else HANG,
+                'frames': report[1] if report else [], 'seconds': seconds}
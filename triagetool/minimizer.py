@@ -0,0 +1,77 @@
+import os
+import tempfile
+import symbolizer
+
+# Runs of the target one minimization may take
+DEFAULT_MAX_EXECS = 5000
+
+
+class CrashMinimizer(object):
+
+    # afl-tmin style minimization of a crash input. Blocks of the input are
+    # removed, then replaced by '0' characters, halving the block size until
+    # single bytes. A change is kept if the input still crashes in the same
+    # bucket with the same build, not merely if it still crashes.
+    def __init__(self, triager, variant, bucket, frame_cache=None, max_execs=DEFAULT_MAX_EXECS):
+        self.triager = triager
+        self.variant = variant
+        self.bucket = bucket
+        self.max_execs = max_execs
+        self.execs = 0
+        # Each minimization talks to a symbolizer of its own, the frame cache
+        # is shared and mostly spares the lookups
+        self.symbols = symbolizer.Symbolizer(frame_cache)
+        fd, self._path = tempfile.mkstemp(prefix="orthrus-tmin-")
+        os.close(fd)
+
+    def close(self):
+        self.symbols.close()
+        os.remove(self._path)
+
+    def reproduces(self, data):
+        if self.execs >= self.max_execs:
+            return False
+        self.execs += 1
+        with open(self._path, 'wb') as f:
+            f.write(data)
+        report = self.triager.triage(self._path, self.variant)
+        return report is not None and self.triager.bucket(report, self.symbols)['bucket'] == self.bucket
+
+    def _remove_blocks(self, data):
+        size = max(len(data) // 2, 1)
+        while size >= 1 and self.execs < self.max_execs:
+            pos = 0
+            while pos < len(data) and len(data) > 1:
+                candidate = data[:pos] + data[pos + size:]
+                if candidate and self.reproduces(candidate):
+                    data = candidate
+                else:
+                    pos += size
+            size //= 2
+        return data
+
+    def _normalize(self, data):
+        size = max(len(data) // 2, 1)
+        while size >= 1 and self.execs < self.max_execs:
+            for pos in range(0, len(data), size):
+                block = data[pos:pos + size]
+                if block.strip('0'):
+                    candidate = data[:pos] + '0' * len(block) + data[pos + size:]
+                    if self.reproduces(candidate):
+                        data = candidate
+            size //= 2
+        return data
+
+    def minimize(self, path):
+        # Minimized content of the crash at path, None if it does not
+        # reproduce in its bucket to begin with
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not self.reproduces(data):
+            return None
+        data = self._normalize(self._remove_blocks(data))
+        # The result is run once more, flaky crashes are not trusted
+        self.execs = 0
+        if not self.reproduces(data):
+            return None
+        return data
@@ -0,0 +1,117 @@
+import os
+import re
+import threading
+import subprocess
+from orthrusutils import elf
+
+# "module+0xoffset" locations of unsymbolized sanitizer frames
+MODULE_OFFSET = re.compile(r"^(.+)\+(0x[0-9a-f]+)$")
+
+
+class FrameCache(object):
+
+    # Symbolized frames keyed by the build-id of the module and the offset in
+    # it. Build-ids change with every rebuild, so entries never go stale and
+    # the file is only ever appended to. Symbolizers of several threads may
+    # share one cache.
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) == 4:
+                        self._entries[(fields[0], fields[1])] = (fields[2] or None, fields[3])
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def add(self, key, frame):
+        with self._lock:
+            self._entries[key] = frame
+            self._pending.append("\t".join(list(key) + [frame[0] or "", frame[1]]) + "\n")
+
+    def save(self):
+        if not self.path or not os.path.isdir(os.path.dirname(self.path)):
+            return
+        with self._lock:
+            if self._pending:
+                with open(self.path, 'a') as f:
+                    f.writelines(self._pending)
+                self._pending = []
+
+
+class Symbolizer(object):
+
+    # Resolves module offsets through one llvm-symbolizer process kept alive
+    # for all lookups. Without llvm-symbolizer frames stay module+offset,
+    # which still buckets stably for one build.
+    def __init__(self, cache=None, command="llvm-symbolizer"):
+        self.cache = cache or FrameCache()
+        self.command = command
+        self._proc = None
+        self._ids = {}
+        self.resolved = 0
+
+    def close(self):
+        if self._proc:
+            self._proc.stdin.close()
+            self._proc.wait()
+            self._proc = None
+        self.cache.save()
+
+    def module_id(self, module):
+        # Build-id of a module, its path and stat for binaries without one
+        if module not in self._ids:
+            try:
+                with elf.ElfFile(module) as binary:
+                    self._ids[module] = binary.build_id()
+            except (IOError, OSError, elf.ElfError):
+                self._ids[module] = None
+            if not self._ids[module] and os.path.exists(module):
+                st = os.stat(module)
+                self._ids[module] = "{}:{}:{}".format(os.path.abspath(module), st.st_mtime, st.st_size)
+        return self._ids[module]
+
+    def _lookup(self, module, offset):
+        if self._proc is None:
+            try:
+                self._proc = subprocess.Popen([self.command, "--no-inlines", "--demangle"], stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+            except OSError:
+                self.command = None
+                return None
+        self._proc.stdin.write(module + " " + offset + "\n")
+        self._proc.stdin.flush()
+        # Function and location, then an empty line
+        lines = []
+        while True:
+            line = self._proc.stdout.readline()
+            if not line or not line.strip():
+                break
+            lines.append(line.strip())
+        if len(lines) < 2 or lines[0] == "??":
+            return None
+        return lines[0], lines[1]
+
+    def symbolize(self, frames):
+        # [(function, location)] with the module+offset frames resolved
+        symbolized = []
+        for function, location in frames:
+            match = MODULE_OFFSET.match(location or "") if not function else None
+            if match:
+                module, offset = match.group(1), match.group(2)
+                key = (self.module_id(module), offset)
+                if key[0]:
+                    frame = self.cache.get(key)
+                    if frame is None and self.command:
+                        frame = self._lookup(module, offset) or (None, location)
+                        self.cache.add(key, frame)
+                        self.resolved += 1
+                    if frame:
+                        function, location = frame
+            symbolized.append((function, location))
+        return symbolized
@@ -0,0 +1,256 @@
+import os
+import re
+import signal
+import shlex
+import hashlib
+import resource
+import threading
+import subprocess
+from orthrusutils import replay
+
+# Frames of the top of the stack that make up a bucket
+DEFAULT_DEPTH = 5
+# Seconds a crash gets to reproduce
+DEFAULT_TIMEOUT = 10
+
+# handle_abort has ASAN report the stack of aborts and failed assertions too.
+# Reports hold module+offset frames, they are symbolized in one batch later.
+ASAN_OPTIONS = "abort_on_error=1:disable_coredump=1:symbolize=0:detect_leaks=0:handle_abort=1"
+
+# Bucket of the crashes that did not reproduce
+NO_CRASH = "-"
+
+ASAN_ERROR = re.compile(r"==\d+==ERROR: (\w+Sanitizer): ([\w-]+)")
+ASAN_ACCESS = re.compile(r"^(READ|WRITE) of size \d+")
+ASAN_FRAME = re.compile(r"^\s*#(\d+) 0x[0-9a-f]+(?: in (.+?))?(?:\s+\(([^)]*)\)|\s+(\S+))?"
+                        r"(?:\s+\(BuildId: [0-9a-f]+\))?\s*$")
+GDB_SIGNAL = re.compile(r"^Program (?:received|terminated with) signal (SIG\w+)")
+GDB_FRAME = re.compile(r"^#(\d+)\s+(?:0x[0-9a-f]+ in )?(\S+) \(.*?\)(?: at (\S+)| from (\S+))?")
+
+# Frames of the sanitizer runtime and of the C library's abort path say
+# nothing about where a crash is
+SKIP_FRAMES = re.compile(r"^(__asan_|__interceptor_|__sanitizer|__ubsan_|__msan_|__lsan_|__GI_|"
+                         r"raise$|abort$|__assert_fail|__assert_fail_base|__libc_message|__fortify_fail|"
+                         r"__chk_fail|__stack_chk_fail|__kernel_vsyscall|_start$|__libc_start_main)")
+
+
+def normalize_function(name):
+    # Template and function arguments differ between builds of the same code
+    name = name.replace("(anonymous namespace)::", "")
+    depth = 0
+    out = []
+    for c in name:
+        if c in "<(":
+            depth += 1
+        elif c in ">)" and depth:
+            depth -= 1
+        elif not depth:
+            out.append(c)
+    return "".join(out).strip()
+
+
+def normalize_frames(frames, depth=DEFAULT_DEPTH, symbolizer=None):
+    # [function] of the top depth frames. Frames without symbols are kept as
+    # module+offset, which is stable across runs unlike absolute addresses.
+    # Frames are symbolized one by one, only as deep as needed.
+    normalized = []
+    for frame in frames:
+        if symbolizer:
+            frame = symbolizer.symbolize([frame])[0]
+        function, location = frame
+        if function:
+            function = normalize_function(function)
+            if SKIP_FRAMES.match(function):
+                continue
+        elif location:
+            function = os.path.basename(location)
+        else:
+            continue
+        normalized.append(function)
+        # Below main there is only the C library's startup code
+        if len(normalized) == depth or function == "main":
+            break
+    return normalized
+
+
+def parse_asan_report(output):
+    # (kind, [(function, location)]) of the first report in output, None if
+    # there is no sanitizer report
+    kind = None
+    frames = []
+    for line in output.splitlines():
+        if kind is None:
+            match = ASAN_ERROR.search(line)
+            if match:
+                kind = match.group(2)
+            continue
+        access = ASAN_ACCESS.match(line)
+        if access and not frames:
+            kind += "-" + access.group(1).lower()
+            continue
+        match = ASAN_FRAME.match(line)
+        if match:
+            frames.append((match.group(2), match.group(3) or match.group(4)))
+        elif frames:
+            # Only the stack of the faulting access, not the allocation stacks
+            break
+    if kind is None:
+        return None
+    return kind, frames
+
+
+def parse_gdb_backtrace(output):
+    # (signal name, [(function, location)]) of a gdb batch run, None if the
+    # program did not die of a signal
+    kind = None
+    frames = []
+    for line in output.splitlines():
+        match = GDB_SIGNAL.match(line)
+        if match:
+            kind = match.group(1)
+            continue
+        match = GDB_FRAME.match(line)
+        if kind and match:
+            function = match.group(2)
+            frames.append((None if function == "??" else function, match.group(3) or match.group(4)))
+    if kind is None:
+        return None
+    return kind, frames
+
+
+def bucket_hash(kind, frames):
+    return hashlib.sha1("\n".join([kind] + frames)).hexdigest()
+
+
+def _no_core():
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def run_target(cmd, stdin_path=None, env=None, timeout=DEFAULT_TIMEOUT, on_timeout=None):
+    # (returncode, output) of a run. A target killed after timeout seconds
+    # did not crash and has the returncode None. on_timeout(proc) replaces
+    # the kill, e.g. to have the target report where it hangs.
+    killed = []
+
+    def kill():
+        killed.append(True)
+        (on_timeout or subprocess.Popen.kill)(proc)
+
+    with open(stdin_path or os.devnull, 'rb') as stdin:
+        with replay.spawn_lock:
+            proc = subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+                                    preexec_fn=_no_core)
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            output = proc.communicate()[0]
+        finally:
+            timer.cancel()
+            timer.join()
+    return None if killed else proc.returncode, output
+
+
+class Triager(object):
+
+    # Runs crashes against the debug builds of a target and buckets them by the
+    # normalized top frames of the crashing stack. The ASAN build is tried
+    # first, its report holds the stack already. Crashes without a sanitizer
+    # report are run again under gdb for a backtrace. With a forkserver shim
+    # each thread replays crashes through a forkserver per build.
+    def __init__(self, binaries, params, depth=DEFAULT_DEPTH, timeout=DEFAULT_TIMEOUT, shim=None):
+        # binaries is [(variant, path)] in the order to try them
+        self.binaries = binaries
+        self.params = shlex.split(params)
+        self.depth = depth
+        self.timeout = timeout
+        self.shim = shim
+        self.env = os.environ.copy()
+        self.env['ASAN_OPTIONS'] = ASAN_OPTIONS
+        self._local = threading.local()
+        self._replayers = []
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            for replayer in self._replayers:
+                replayer.close()
+            self._replayers = []
+
+    def replayer(self, variant, binary):
+        # Replayer of a build for the calling thread
+        replayers = getattr(self._local, 'replayers', None)
+        if replayers is None:
+            replayers = self._local.replayers = {}
+        if variant not in replayers:
+            replayers[variant] = replay.Replayer(binary, self.params, self.env, self.timeout, self.shim)
+            with self._lock:
+                self._replayers.append(replayers[variant])
+        return replayers[variant]
+
+    def _args(self, path):
+        if "@@" in self.params:
+            return [path if p == "@@" else p for p in self.params], None
+        return self.params, path
+
+    def backtrace(self, binary, path):
+        args, stdin = self._args(path)
+        run = "run" + (" < " + stdin if stdin else "")
+        try:
+            returncode, output = run_target(["gdb", "-q", "-nx", "-batch", "-ex", "set pagination off",
+                                             "-ex", run, "-ex", "bt", "--args", binary] + args,
+                                            env=self.env, timeout=self.timeout * 3)
+        except OSError:
+            # No gdb, the crash is bucketed by its signal alone
+            return None
+        return parse_gdb_backtrace(output)
+
+    def triage(self, path, variant=None):
+        # {'variant', 'kind', 'frames'} of a crash with the raw frames of its
+        # stack, None if it does not reproduce. variant restricts the run to
+        # one of the builds.
+        with open(path, 'rb') as f:
+            data = f.read()
+        for name, binary in self.binaries:
+            if variant and name != variant:
+                continue
+            returncode, output = self.replayer(name, binary).run(data)
+            report = parse_asan_report(output)
+            if report is None:
+                if returncode is None or returncode >= 0:
+                    continue
+                report = self.backtrace(binary, path) or (signal_name(-returncode), [])
+            return {'variant': name, 'kind': report[0], 'frames': report[1]}
+        return None
+
+    def bucket(self, report, symbolizer=None):
+        # {'bucket', 'variant', 'kind', 'frames'} of a triaged crash
+        if report is None:
+            return {'bucket': NO_CRASH, 'variant': "", 'kind': "", 'frames': []}
+        frames = normalize_frames(report['frames'], self.depth, symbolizer)
+        return {'bucket': bucket_hash(report['kind'], frames), 'variant': report['variant'],
+                'kind': report['kind'], 'frames': frames}
+
+
+def signal_name(signum):
+    for name in dir(signal):
+        if name.startswith("SIG") and not name.startswith("SIG_") and getattr(signal, name) == signum:
+            return name
+    return "signal-" + str(signum)
+
+
+def crash_files(syncDir, directory="crashes"):
+    # Crash inputs of all sessions of a sync dir, oldest session entries
+    # first, or the inputs of another testcase directory such as hangs
+    crashes = []
+    if not os.path.isdir(syncDir):
+        return crashes
+    for session in sorted(os.listdir(syncDir)):
+        crashDir = os.path.join(syncDir, session, directory)
+        if os.path.isdir(crashDir):
+            crashes.extend(os.path.join(crashDir, fn) for fn in sorted(os.listdir(crashDir))
+                           if fn.startswith("id:"))
+    return crashes
+
+
+def bucket_name(result):
+    return "{}:{}:{}".format(result['bucket'][:12], result['variant'], re.sub(r"[^\w-]", "_", result['kind']))